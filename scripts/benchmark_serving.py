@@ -0,0 +1,181 @@
+import json
+from argparse import ArgumentParser
+
+from datasets import load_dataset
+from huggingface_hub import login
+
+from optimum.nvidia import setup_logging
+from optimum.nvidia.benchmarks import (
+    CausalLMBackend,
+    ServiceLevelObjective,
+    SimulatedBackend,
+    TransformersBackend,
+    create_workload,
+    poisson_arrivals,
+    run_benchmark,
+    sample_output_lengths,
+    sample_prompts_from_dataset,
+    workload_from_trace,
+)
+
+
+def get_backend(args):
+    if args.backend == "simulated":
+        return SimulatedBackend(max_batch_size=args.max_batch_size)
+
+    elif args.backend == "transformers":
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(args.model)
+        model = AutoModelForCausalLM.from_pretrained(
+            args.model, torch_dtype=args.dtype, device_map="auto"
+        )
+        return TransformersBackend(model, tokenizer)
+
+    else:
+        from optimum.nvidia.pipelines import pipeline
+
+        pipe = pipeline(
+            model=args.model,
+            max_batch_size=args.max_batch_size,
+            max_prompt_length=args.max_prompt_length,
+            max_new_tokens=args.max_new_tokens,
+            use_fp8=args.use_fp8,
+            dtype=args.dtype,
+        )
+        return CausalLMBackend(pipe)
+
+
+def get_workload(args, num_requests: int, seed: int):
+    if args.trace:
+        return workload_from_trace(args.trace)[:num_requests]
+
+    dataset = load_dataset(args.dataset, args.dataset_config, split=args.dataset_split)
+    prompts = sample_prompts_from_dataset(
+        dataset[args.dataset_column],
+        num_requests,
+        max_length=args.max_prompt_length,
+        seed=seed,
+    )
+    output_lengths = sample_output_lengths(
+        len(prompts),
+        args.output_length_mean,
+        args.output_length_std,
+        max_length=args.max_new_tokens,
+        seed=seed,
+    )
+
+    return create_workload(
+        prompts, output_lengths, poisson_arrivals(args.rate, len(prompts), seed)
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser("Hugging Face Optimum-Nvidia Serving Benchmarking tool")
+    parser.add_argument(
+        "--token", type=str, help="Hugging Face Hub token to authenticate the request."
+    )
+    parser.add_argument(
+        "--backend",
+        type=str,
+        choices=["optimum-nvidia", "transformers", "simulated"],
+        default="optimum-nvidia",
+        help="System to benchmark.",
+    )
+    parser.add_argument(
+        "--num-requests", type=int, default=256, help="Number of requests to send."
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=8, help="Number of warmup requests."
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=float("inf"),
+        help="Average number of requests per second (Poisson arrivals), inf to send all at once.",
+    )
+    parser.add_argument(
+        "--trace",
+        type=str,
+        help="JSON lines trace to replay (timestamp, prompt or prompt_length, output_length).",
+    )
+    parser.add_argument(
+        "--dataset", type=str, default="Open-Orca/OpenOrca", help="Prompts dataset."
+    )
+    parser.add_argument("--dataset-config", type=str, help="Dataset's configuration.")
+    parser.add_argument(
+        "--dataset-split", type=str, default="train", help="Dataset's split."
+    )
+    parser.add_argument(
+        "--dataset-column",
+        type=str,
+        default="question",
+        help="Dataset's column holding the prompts.",
+    )
+    parser.add_argument(
+        "--max-prompt-length", type=int, default=512, help="Prompts are truncated."
+    )
+    parser.add_argument(
+        "--max-new-tokens",
+        type=int,
+        default=512,
+        help="Maximum number of tokens to generate.",
+    )
+    parser.add_argument(
+        "--output-length-mean",
+        type=float,
+        default=128,
+        help="Average number of tokens to generate.",
+    )
+    parser.add_argument(
+        "--output-length-std",
+        type=float,
+        default=64,
+        help="Standard deviation of the number of tokens to generate.",
+    )
+    parser.add_argument(
+        "--max-batch-size", type=int, default=8, help="Maximum batch size."
+    )
+    parser.add_argument(
+        "--slo-ttft", type=float, help="Time-to-first-token target (ms) for goodput."
+    )
+    parser.add_argument(
+        "--slo-tpot", type=float, help="Time-per-output-token target (ms) for goodput."
+    )
+    parser.add_argument(
+        "--use-fp8",
+        action="store_true",
+        help="Attempt to benchmark in float8 precision.",
+    )
+    parser.add_argument(
+        "--dtype",
+        type=str,
+        default="float16",
+        help="Specify the precision for the model.",
+    )
+    parser.add_argument("--seed", type=int, default=2024, help="Random seed.")
+    parser.add_argument("--output", type=str, help="Save the report as JSON.")
+    parser.add_argument(
+        "model", type=str, nargs="?", help="Model's id to use for the benchmark."
+    )
+
+    args = parser.parse_args()
+    setup_logging()
+
+    if args.token:
+        login(args.token)
+
+    backend = get_backend(args)
+    warmup = get_workload(args, args.warmup, args.seed + 1) if args.warmup else ()
+    requests = get_workload(args, args.num_requests, args.seed)
+
+    slo = ServiceLevelObjective(
+        ttft=args.slo_ttft / 1e3 if args.slo_ttft else None,
+        tpot=args.slo_tpot / 1e3 if args.slo_tpot else None,
+    )
+    report = run_benchmark(backend, requests, slo, warmup)
+    print(report.format())
+
+    if args.output:
+        with open(args.output, "w") as report_f:
+            json.dump(report.to_dict(), report_f, indent=2)
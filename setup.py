@@ -29,6 +29,7 @@ except Exception as error:
 INSTALL_REQUIRES = [
     "accelerate",
     "datasets >= 2.14",
+    "filelock",
     "huggingface-hub @ git+https://github.com/huggingface/huggingface_hub@45147c518ad3c1f70ecb462de4bf23cd553ba54b",
     "hf-transfer",
     "mpmath == 1.3.0",
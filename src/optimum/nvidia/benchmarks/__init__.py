@@ -0,0 +1,31 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from .backends import Backend, CausalLMBackend, SimulatedBackend, TransformersBackend
+from .metrics import (
+    BenchmarkReport,
+    RequestMetrics,
+    ServiceLevelObjective,
+    summarize,
+)
+from .runner import run_benchmark, run_benchmark_async
+from .workload import (
+    BenchmarkRequest,
+    create_workload,
+    poisson_arrivals,
+    sample_output_lengths,
+    sample_prompts_from_dataset,
+    workload_from_trace,
+)
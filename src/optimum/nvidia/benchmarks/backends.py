@@ -0,0 +1,196 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import asyncio
+from abc import ABC, abstractmethod
+from logging import getLogger
+from threading import Thread
+from typing import AsyncIterator, Union
+
+from optimum.nvidia.benchmarks.workload import BenchmarkRequest
+
+
+LOGGER = getLogger(__name__)
+
+
+class Backend(ABC):
+    """
+    Abstraction over the system being benchmarked.
+
+    `generate` yields once for every generated token, as soon as it is produced, so the benchmark can measure
+    time-to-first-token and inter-token latencies.
+    """
+
+    @property
+    def name(self) -> str:
+        return type(self).__name__
+
+    @abstractmethod
+    def generate(self, request: BenchmarkRequest) -> AsyncIterator[int]:
+        raise NotImplementedError("Backend::generate is abstract.")
+
+    async def close(self):
+        pass
+
+
+class SimulatedBackend(Backend):
+    """
+    CPU-only engine simulating the latencies of an inflight-batching server.
+
+    The prefill of a request takes `prefill_ms_per_token` per prompt token, then every decoding step takes
+    `decode_ms` plus `decode_ms_per_request` for every other request being decoded at the same time.
+    At most `max_batch_size` requests are processed concurrently, the others wait in queue.
+    """
+
+    __slots__ = (
+        "_prefill_ms_per_token",
+        "_decode_ms",
+        "_decode_ms_per_request",
+        "_slots",
+        "_num_active",
+    )
+
+    def __init__(
+        self,
+        max_batch_size: int = 8,
+        prefill_ms_per_token: float = 0.05,
+        decode_ms: float = 5.0,
+        decode_ms_per_request: float = 0.5,
+    ):
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size should be >= 1 (got: {max_batch_size})")
+
+        self._prefill_ms_per_token = prefill_ms_per_token
+        self._decode_ms = decode_ms
+        self._decode_ms_per_request = decode_ms_per_request
+        self._slots = asyncio.Semaphore(max_batch_size)
+        self._num_active = 0
+
+    async def generate(self, request: BenchmarkRequest) -> AsyncIterator[int]:
+        async with self._slots:
+            self._num_active += 1
+            try:
+                await asyncio.sleep(
+                    request.prompt_length * self._prefill_ms_per_token / 1e3
+                )
+
+                for token_id in range(request.max_new_tokens):
+                    if token_id > 0:
+                        step_ms = (
+                            self._decode_ms
+                            + (self._num_active - 1) * self._decode_ms_per_request
+                        )
+                        await asyncio.sleep(step_ms / 1e3)
+                    yield token_id
+            finally:
+                self._num_active -= 1
+
+
+class CausalLMBackend(Backend):
+    """
+    Benchmark an optimum-nvidia `TextGenerationPipeline`, streaming the tokens out of the engine.
+    The engine handles a single batch at a time, concurrent requests are queued.
+    """
+
+    __slots__ = ("_pipeline", "_generate_kwargs", "_lock")
+
+    def __init__(self, pipeline, **generate_kwargs):
+        self._pipeline = pipeline
+        self._generate_kwargs = generate_kwargs
+        self._lock = asyncio.Lock()
+
+    async def generate(self, request: BenchmarkRequest) -> AsyncIterator[int]:
+        async with self._lock:
+            stream = await asyncio.to_thread(
+                self._pipeline,
+                request.prompt,
+                stream=True,
+                max_new_tokens=request.max_new_tokens,
+                **self._generate_kwargs,
+            )
+
+            try:
+                async for record in stream:
+                    if record["token_id"] is not None:
+                        yield record["token_id"]
+
+                    if record["finished"]:
+                        break
+            finally:
+                # The engine may still be running after the request finished (or the consumer gave up):
+                # drain the stream so the next request doesn't start while it is busy
+                async for _ in stream:
+                    pass
+
+
+class TransformersBackend(Backend):
+    """
+    Benchmark a transformers model (baseline), streaming the tokens through a `TextIteratorStreamer`-like queue.
+    The model handles a single request at a time, concurrent requests are queued.
+    """
+
+    __slots__ = ("_model", "_tokenizer", "_generate_kwargs", "_lock")
+
+    def __init__(self, model, tokenizer, **generate_kwargs):
+        self._model = model
+        self._tokenizer = tokenizer
+        self._generate_kwargs = generate_kwargs
+        self._lock = asyncio.Lock()
+
+    async def generate(self, request: BenchmarkRequest) -> AsyncIterator[int]:
+        from transformers.generation.streamers import BaseStreamer
+
+        loop = asyncio.get_running_loop()
+        tokens: asyncio.Queue[Union[int, Exception, None]] = asyncio.Queue()
+
+        class _Streamer(BaseStreamer):
+            def __init__(self):
+                self._is_prompt = True
+
+            def put(self, value):
+                # The first call holds the prompt
+                if self._is_prompt:
+                    self._is_prompt = False
+                    return
+
+                for token_id in value.view(-1).tolist():
+                    loop.call_soon_threadsafe(tokens.put_nowait, token_id)
+
+            def end(self):
+                loop.call_soon_threadsafe(tokens.put_nowait, None)
+
+        async with self._lock:
+            inputs = self._tokenizer(request.prompt, return_tensors="pt").to(
+                self._model.device
+            )
+
+            def _generate():
+                try:
+                    self._model.generate(
+                        **inputs,
+                        max_new_tokens=request.max_new_tokens,
+                        streamer=_Streamer(),
+                        **self._generate_kwargs,
+                    )
+                except Exception as e:
+                    # Forwarded to the consumer, so the request is reported as failed
+                    loop.call_soon_threadsafe(tokens.put_nowait, e)
+
+            Thread(target=_generate, daemon=True).start()
+
+            while (token_id := await tokens.get()) is not None:
+                if isinstance(token_id, Exception):
+                    raise token_id
+                yield token_id
@@ -0,0 +1,178 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+DEFAULT_PERCENTILES = (50, 90, 99)
+
+
+@dataclass
+class RequestMetrics:
+    """
+    Timestamps (in seconds, relative to the start of the benchmark) collected for a single request
+    """
+
+    arrival: float
+    prompt_length: int
+    token_times: List[float] = field(default_factory=list)
+    end: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None and len(self.token_times) > 0
+
+    @property
+    def num_tokens(self) -> int:
+        return len(self.token_times)
+
+    @property
+    def ttft(self) -> float:
+        """
+        Time-to-first-token, including the time spent waiting in queue
+        """
+        return self.token_times[0] - self.arrival
+
+    @property
+    def inter_token_latencies(self) -> List[float]:
+        return np.diff(self.token_times).tolist()
+
+    @property
+    def tpot(self) -> float:
+        """
+        Time-per-output-token, averaged over the decoding phase
+        """
+        if self.num_tokens < 2:
+            return 0.0
+        return (self.token_times[-1] - self.token_times[0]) / (self.num_tokens - 1)
+
+    @property
+    def e2e_latency(self) -> float:
+        return self.end - self.arrival
+
+
+@dataclass(frozen=True)
+class ServiceLevelObjective:
+    """
+    Latency targets (in seconds) a request has to meet to count towards the goodput
+    """
+
+    ttft: Optional[float] = None
+    tpot: Optional[float] = None
+    e2e_latency: Optional[float] = None
+
+    def is_met(self, metrics: RequestMetrics) -> bool:
+        if not metrics.succeeded:
+            return False
+
+        return all(
+            target is None or getattr(metrics, name) <= target
+            for name, target in (
+                ("ttft", self.ttft),
+                ("tpot", self.tpot),
+                ("e2e_latency", self.e2e_latency),
+            )
+        )
+
+
+def percentiles(
+    values: Sequence[float], qs: Sequence[int] = DEFAULT_PERCENTILES
+) -> Dict[str, float]:
+    if len(values) == 0:
+        return {f"p{q}": float("nan") for q in qs} | {"mean": float("nan")}
+
+    return {f"p{q}": float(np.percentile(values, q)) for q in qs} | {
+        "mean": float(np.mean(values))
+    }
+
+
+@dataclass(frozen=True)
+class BenchmarkReport:
+    backend: str
+    num_requests: int
+    num_failed: int
+    duration: float
+    request_throughput: float
+    output_token_throughput: float
+    goodput: float
+    slo_attainment: float
+    ttft: Dict[str, float]
+    inter_token_latency: Dict[str, float]
+    e2e_latency: Dict[str, float]
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__dataclass_fields__.keys()}
+
+    def format(self) -> str:
+        def _row(name: str, values: Dict[str, float]) -> str:
+            return f"{name:<24}" + " ".join(
+                f"{key}={value * 1e3:>10.2f}ms" for key, value in values.items()
+            )
+
+        return "\n".join(
+            [
+                f"Backend: {self.backend}",
+                f"Requests: {self.num_requests} ({self.num_failed} failed) in {self.duration:.2f}s",
+                f"Request throughput: {self.request_throughput:.2f} req/s",
+                f"Output token throughput: {self.output_token_throughput:.2f} tokens/s",
+                f"Goodput: {self.goodput:.2f} req/s ({self.slo_attainment:.1%} within SLO)",
+                _row("Time-to-first-token", self.ttft),
+                _row("Inter-token latency", self.inter_token_latency),
+                _row("End-to-end latency", self.e2e_latency),
+            ]
+        )
+
+
+def summarize(
+    backend: str,
+    metrics: Sequence[RequestMetrics],
+    slo: Optional[ServiceLevelObjective] = None,
+    qs: Sequence[int] = DEFAULT_PERCENTILES,
+) -> BenchmarkReport:
+    """
+    Aggregate the metrics collected for each request.
+    :param backend: Name of the benchmarked backend
+    :param metrics: Metrics of all the requests
+    :param slo: Latency targets used to compute the goodput, all successful requests count if None
+    :param qs: Percentiles to report
+    :return: `BenchmarkReport`
+    """
+    slo = slo or ServiceLevelObjective()
+    succeeded = [m for m in metrics if m.succeeded]
+
+    start = min((m.arrival for m in metrics), default=0.0)
+    end = max((m.end for m in succeeded), default=start)
+    duration = max(end - start, 1e-9)
+
+    within_slo = sum(slo.is_met(m) for m in metrics)
+    inter_token_latencies = [itl for m in succeeded for itl in m.inter_token_latencies]
+
+    return BenchmarkReport(
+        backend=backend,
+        num_requests=len(metrics),
+        num_failed=len(metrics) - len(succeeded),
+        duration=duration,
+        request_throughput=len(succeeded) / duration,
+        output_token_throughput=sum(m.num_tokens for m in succeeded) / duration,
+        goodput=within_slo / duration,
+        slo_attainment=within_slo / len(metrics) if metrics else 0.0,
+        ttft=percentiles([m.ttft for m in succeeded], qs),
+        inter_token_latency=percentiles(inter_token_latencies, qs),
+        e2e_latency=percentiles([m.e2e_latency for m in succeeded], qs),
+    )
@@ -0,0 +1,94 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import asyncio
+from logging import getLogger
+from typing import List, Optional, Sequence
+
+from optimum.nvidia.benchmarks.backends import Backend
+from optimum.nvidia.benchmarks.metrics import (
+    BenchmarkReport,
+    RequestMetrics,
+    ServiceLevelObjective,
+    summarize,
+)
+from optimum.nvidia.benchmarks.workload import BenchmarkRequest
+
+
+LOGGER = getLogger(__name__)
+
+
+async def _run_request(
+    backend: Backend, request: BenchmarkRequest, origin: float
+) -> RequestMetrics:
+    loop = asyncio.get_running_loop()
+
+    # Open-loop load: requests are sent at their arrival time, whatever the state of the backend
+    await asyncio.sleep(max(0.0, origin + request.arrival - loop.time()))
+
+    metrics = RequestMetrics(loop.time() - origin, request.prompt_length)
+    try:
+        async for _ in backend.generate(request):
+            metrics.token_times.append(loop.time() - origin)
+    except Exception as e:
+        LOGGER.warning(f"Request failed: {e}")
+        metrics.error = str(e)
+
+    metrics.end = loop.time() - origin
+    return metrics
+
+
+async def run_benchmark_async(
+    backend: Backend, requests: Sequence[BenchmarkRequest]
+) -> List[RequestMetrics]:
+    """
+    Replay `requests` against `backend`, each request being sent at its arrival time.
+    :return: The metrics collected for each request, in the same order as `requests`
+    """
+    origin = asyncio.get_running_loop().time()
+    return list(
+        await asyncio.gather(
+            *(_run_request(backend, request, origin) for request in requests)
+        )
+    )
+
+
+def run_benchmark(
+    backend: Backend,
+    requests: Sequence[BenchmarkRequest],
+    slo: Optional[ServiceLevelObjective] = None,
+    warmup: Sequence[BenchmarkRequest] = (),
+) -> BenchmarkReport:
+    """
+    Run the benchmark and aggregate the results.
+    :param backend: The system to benchmark
+    :param requests: The workload
+    :param slo: Latency targets used to compute the goodput
+    :param warmup: Requests sent (and discarded) before the benchmark starts
+    :return: `BenchmarkReport`
+    """
+
+    async def _run():
+        try:
+            if warmup:
+                LOGGER.info(f"Warming up with {len(warmup)} requests")
+                await run_benchmark_async(backend, warmup)
+
+            LOGGER.info(f"Running benchmark with {len(requests)} requests")
+            return await run_benchmark_async(backend, requests)
+        finally:
+            await backend.close()
+
+    return summarize(backend.name, asyncio.run(_run()), slo)
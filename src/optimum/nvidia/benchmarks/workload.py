@@ -0,0 +1,209 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+from logging import getLogger
+from os import PathLike
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+
+
+LOGGER = getLogger(__name__)
+
+
+BenchmarkRequest = NamedTuple(
+    "BenchmarkRequest",
+    [
+        ("arrival", float),
+        ("prompt", str),
+        ("prompt_length", int),
+        ("max_new_tokens", int),
+    ],
+)
+
+
+def poisson_arrivals(
+    rate: float, num_requests: int, seed: Optional[int] = None
+) -> np.ndarray:
+    """
+    Generate the arrival times of requests following a Poisson process.
+    :param rate: Average number of requests per second, `inf` to send all the requests at once
+    :param num_requests: Number of requests to generate
+    :param seed: Seed of the random generator
+    :return: `np.ndarray` of arrival times, in seconds from the start of the benchmark
+    """
+    if rate <= 0:
+        raise ValueError(f"rate should be > 0 (got: {rate})")
+
+    if np.isinf(rate):
+        return np.zeros(num_requests)
+
+    # Inter-arrival times of a Poisson process are exponentially distributed
+    intervals = np.random.default_rng(seed).exponential(1.0 / rate, num_requests)
+    return np.cumsum(intervals) - intervals[0]
+
+
+def load_trace(path: Union[str, PathLike]) -> List[dict]:
+    """
+    Load a trace of requests to replay from a JSON lines file.
+
+    Each line describes a request with a `timestamp` (seconds), an `output_length` and either a `prompt` or a
+    `prompt_length`.
+    :param path: Path to the trace file
+    :return: The entries of the trace sorted by timestamp, the first one arriving at 0
+    """
+    with open(path, "r", encoding="utf-8") as trace_f:
+        entries = [json.loads(line) for line in trace_f if line.strip()]
+
+    if not entries:
+        raise ValueError(f"Trace {path} is empty")
+
+    entries.sort(key=lambda entry: entry["timestamp"])
+    origin = entries[0]["timestamp"]
+
+    for entry in entries:
+        entry["timestamp"] -= origin
+
+    return entries
+
+
+def synthetic_prompt(length: int) -> str:
+    """
+    Generate a prompt of approximately `length` tokens, for traces which don't provide the prompts.
+    """
+    words = ["hello", "world", "the", "quick", "brown", "fox", "jumps", "over"]
+    return " ".join(words[i % len(words)] for i in range(length))
+
+
+def create_workload(
+    prompts: Sequence[str],
+    output_lengths: Union[int, Sequence[int]],
+    arrivals: Iterable[float],
+    prompt_lengths: Optional[Sequence[int]] = None,
+) -> List[BenchmarkRequest]:
+    """
+    Assemble the requests of a benchmark.
+    :param prompts: The prompt of each request
+    :param output_lengths: Number of tokens to generate, for all the requests or for each of them
+    :param arrivals: Arrival time of each request
+    :param prompt_lengths: Number of tokens of each prompt, if known
+    :return: The requests, sorted by arrival time
+    """
+    arrivals = list(arrivals)
+    if len(arrivals) != len(prompts):
+        raise ValueError(
+            f"Got {len(prompts)} prompts but {len(arrivals)} arrival times"
+        )
+
+    if isinstance(output_lengths, int):
+        output_lengths = [output_lengths] * len(prompts)
+
+    if prompt_lengths is None:
+        prompt_lengths = [len(prompt.split()) for prompt in prompts]
+
+    requests = [
+        BenchmarkRequest(float(arrival), prompt, prompt_length, output_length)
+        for arrival, prompt, prompt_length, output_length in zip(
+            arrivals, prompts, prompt_lengths, output_lengths
+        )
+    ]
+
+    return sorted(requests, key=lambda request: request.arrival)
+
+
+def workload_from_trace(path: Union[str, PathLike]) -> List[BenchmarkRequest]:
+    """
+    Create the requests replaying the trace at `path` (see `load_trace`).
+    """
+    entries = load_trace(path)
+    prompts = [
+        entry.get("prompt", None) or synthetic_prompt(entry["prompt_length"])
+        for entry in entries
+    ]
+
+    return create_workload(
+        prompts,
+        [entry["output_length"] for entry in entries],
+        [entry["timestamp"] for entry in entries],
+        [
+            entry.get("prompt_length", len(prompt.split()))
+            for entry, prompt in zip(entries, prompts)
+        ],
+    )
+
+
+def sample_prompts_from_dataset(
+    texts: Sequence[str],
+    num_requests: int,
+    tokenizer=None,
+    min_length: int = 4,
+    max_length: Optional[int] = None,
+    seed: Optional[int] = None,
+) -> List[str]:
+    """
+    Sample prompts of mixed lengths from a dataset (i.e. the text column of a `datasets.Dataset`).
+    :param texts: The candidate texts
+    :param num_requests: The number of prompts to sample
+    :param tokenizer: Tokenizer used to measure and truncate the prompts, whitespace-split words if None
+    :param min_length: Texts shorter than this are skipped
+    :param max_length: Prompts longer than this are truncated
+    :param seed: Seed of the random generator
+    :return: The sampled prompts
+    """
+    rng = np.random.default_rng(seed)
+    prompts = []
+
+    for index in rng.permutation(len(texts)):
+        text = texts[index]
+        tokens = tokenizer.tokenize(text) if tokenizer else text.split()
+
+        if len(tokens) < min_length:
+            continue
+
+        if max_length is not None and len(tokens) > max_length:
+            tokens = tokens[:max_length]
+            text = (
+                tokenizer.convert_tokens_to_string(tokens)
+                if tokenizer
+                else " ".join(tokens)
+            )
+
+        prompts.append(text)
+        if len(prompts) == num_requests:
+            break
+
+    if len(prompts) < num_requests:
+        LOGGER.warning(
+            f"Only {len(prompts)} prompts out of {num_requests} requested match the length constraints"
+        )
+
+    return prompts
+
+
+def sample_output_lengths(
+    num_requests: int,
+    mean: float,
+    std: float = 0.0,
+    min_length: int = 1,
+    max_length: Optional[int] = None,
+    seed: Optional[int] = None,
+) -> List[int]:
+    """
+    Sample the number of tokens to generate for each request from a (clipped) normal distribution.
+    """
+    lengths = np.random.default_rng(seed).normal(mean, std, num_requests)
+    lengths = np.clip(np.rint(lengths), min_length, max_length)
+    return lengths.astype(int).tolist()
@@ -15,3 +15,4 @@
 
 
 from .local import LocalEngineBuilder
+from .orchestrator import BuildJob, BuildOrchestrator, EngineBuildError
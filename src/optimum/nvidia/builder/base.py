@@ -14,9 +14,8 @@
 #  limitations under the License.
 
 import json
-import os
 from logging import getLogger
-from multiprocessing import Pool
+from multiprocessing import get_context
 from os import PathLike, sched_getaffinity
 from pathlib import Path
 from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Type, Union
@@ -35,9 +34,14 @@ from tensorrt_llm.quantization import QuantMode
 from transformers import AutoModelForCausalLM
 
 from optimum.nvidia import DataType
+from optimum.nvidia.builder.timing_cache import TimingCacheStore
 from optimum.nvidia.errors import UnsupportedHardwareFeature
 from optimum.nvidia.models import SupportsFromHuggingFace
 from optimum.nvidia.quantization import Calibration
+from optimum.nvidia.quantization.checkpoint import (
+    verify_calibration_manifest,
+    write_calibration_manifest,
+)
 from optimum.nvidia.utils import (
     OPTIMUM_NVIDIA_CONFIG_FILE,
     TENSORRT_TIMINGS_FILE,
@@ -150,8 +154,9 @@ class TensorRTEngineBuilder(ModelHubMixin):
 
     def enable_parallel_build(self, num_jobs: int = -1) -> "TensorRTEngineBuilder":
         """
-
-        :param num_jobs:
+        Build the engines of the different ranks concurrently, in separate processes.
+        :param num_jobs: Maximum number of concurrent builds, -1 to use as many as CPUs available.
+        The actual number of jobs is further bounded by the number of ranks and the host memory.
         :return:
         """
         # if self._build_info:
@@ -160,7 +165,7 @@ class TensorRTEngineBuilder(ModelHubMixin):
         LOGGER.debug(
             f"Setting parallel build strategy to use a maximum of {num_jobs} parallel jobs"
         )
-        self._build_info = BuildInfo(True, num_jobs)
+        self._build_info = BuildInfo(True, num_jobs, self._build_info.quantized_path)
 
         return self
 
@@ -332,16 +337,8 @@ class TensorRTEngineBuilder(ModelHubMixin):
 
         # Handle any calibration required for static quantization
         if self._quantization_calibration:
-            has_json = has_qweight = False
-            if calibration_path.exists() and calibration_path.is_dir():
-                calibration_data = os.listdir(calibration_path)
-                if len(calibration_data) == 2:
-                    has_json = any(f.endswith(".json") for f in calibration_data)
-                    has_qweight = any(
-                        f.endswith(".safetensors") for f in calibration_data
-                    )
-
-            if not calibration_path.exists() or not (has_json and has_qweight):
+            # Artifacts are only reused when complete and intact, as recorded by their manifest
+            if not verify_calibration_manifest(calibration_path):
                 LOGGER.info("Calibrating model...")
 
                 # Retrieve device total memory
@@ -373,6 +370,7 @@ class TensorRTEngineBuilder(ModelHubMixin):
                 )
                 quantizer.calibrate(self._quantization_calibration)
                 quantizer.save(calibration_path)
+                write_calibration_manifest(calibration_path)
                 # Release the memory
                 del hf_model
                 torch.cuda.empty_cache()
@@ -410,13 +408,25 @@ class TensorRTEngineBuilder(ModelHubMixin):
             self.quantize(output_path)
 
         if self.validate():
-            if self._build_info.parallel and self._build_info.num_parallel_jobs > 1:
+            if self._build_info.parallel and len(shards_info) > 1:
                 build_func = self._build_parallel
             else:
                 build_func = self._build_serial
 
-            # Let's build
-            build_func(shards_info, output_path, optimization_level)
+            # Let's build, starting from the timings of previous builds on this hardware (if any)
+            timing_cache_store = TimingCacheStore.from_env()
+            build_func(
+                shards_info,
+                output_path,
+                optimization_level,
+                timing_cache_store.lookup(self._dtype) if timing_cache_store else None,
+            )
+
+            if timing_cache_store is not None:
+                timing_cache_store.merge(
+                    self._dtype, output_path.joinpath(TENSORRT_TIMINGS_FILE)
+                )
+
             return output_path
 
     def _build_serial(
@@ -424,41 +434,89 @@ class TensorRTEngineBuilder(ModelHubMixin):
         shards_info: List[Shard],
         output_path: Path,
         opt_level: Optional[int],
+        timing_cache: Optional[Path] = None,
     ):
         LOGGER.debug("Building TRT engines sequentially")
 
         for shard in shards_info:
             self._build_engine_for_rank(
-                shard, output_path, opt_level, is_parallel=False
+                shard,
+                output_path,
+                opt_level,
+                is_parallel=False,
+                timing_cache=timing_cache,
             )
 
+            # Other ranks reuse the timings saved by rank 0
+            timing_cache = output_path.joinpath(TENSORRT_TIMINGS_FILE)
+
     def _build_parallel(
         self,
         shard_info: List[Shard],
         output_path: Path,
         opt_level: Optional[int],
+        timing_cache: Optional[Path] = None,
     ):
-        build_info = self._build_info
-        num_jobs = (
-            build_info.num_parallel_jobs
-            if build_info.num_parallel_jobs > 1
-            else sched_getaffinity(0)
+        num_jobs = self._get_num_parallel_jobs(len(shard_info))
+
+        # Rank 0 is built first to generate the timing cache which all the other ranks will reuse
+        self._build_engine_for_rank(
+            shard_info[0],
+            output_path,
+            opt_level,
+            is_parallel=True,
+            timing_cache=timing_cache,
         )
 
-        # If there are more CPU cores than rank ... Let's reduce the number of jobs
-        if num_jobs > len(shard_info):
-            num_jobs = shard_info
+        if len(shard_info) == 1:
+            return
 
+        timing_cache = output_path.joinpath(TENSORRT_TIMINGS_FILE)
         LOGGER.debug(f"Building TRT engines in parallel ({num_jobs} processes)")
-        with Pool(num_jobs) as builders:
-            for shard in shard_info:
-                _ = builders.map(
-                    self._build_engine_for_rank,
-                    shard,
-                    output_path,
-                    is_parallel=True,
-                    opt_level=opt_level,
-                )
+
+        # CUDA cannot be re-initialized in forked processes
+        with get_context("spawn").Pool(num_jobs) as builders:
+            builders.starmap(
+                self._build_engine_for_rank,
+                [
+                    (shard, output_path, opt_level, True, timing_cache)
+                    for shard in shard_info[1:]
+                ],
+            )
+
+    def _get_num_parallel_jobs(self, num_ranks: int) -> int:
+        """
+        Compute the number of engines which can be built concurrently, bounded by the number of ranks,
+        the number of CPUs available to this process and the host memory.
+        :param num_ranks: The number of engines to build
+        :return: The number of parallel jobs
+        """
+        num_jobs = self._build_info.num_parallel_jobs
+        if num_jobs < 1:
+            num_jobs = len(sched_getaffinity(0))
+
+        # Every job loads the original weights in host memory
+        max_jobs_for_memory = max(
+            1, int(virtual_memory().available * 0.8) // self._estimate_weights_size()
+        )
+
+        return max(1, min(num_jobs, num_ranks, max_jobs_for_memory))
+
+    def _estimate_weights_size(self) -> int:
+        """
+        Rough estimation of the size (in bytes) of the model's weights from its configuration
+        """
+        config = self._model_config
+        hidden_size = config["hidden_size"]
+        intermediate_size = config.get("intermediate_size", 4 * hidden_size)
+
+        num_layer_params = 4 * hidden_size**2 + 3 * hidden_size * intermediate_size
+        num_params = (
+            config["num_hidden_layers"] * num_layer_params
+            + 2 * config["vocab_size"] * hidden_size
+        )
+
+        return max(1, num_params * DataType(self._dtype).to_torch().itemsize)
 
     def _build_engine_for_rank(
         self,
@@ -466,11 +524,16 @@ class TensorRTEngineBuilder(ModelHubMixin):
         output_path: Path,
         opt_level: Optional[int],
         is_parallel: bool,
+        timing_cache: Optional[Path] = None,
     ):
         LOGGER.debug(
             f"Building engine rank={shard.rank} (world_size={shard.world_size})"
         )
 
+        # Each parallel job builds on the GPU the rank will run on
+        if is_parallel:
+            torch.cuda.set_device(shard.rank % shard.gpus_per_node)
+
         config = self._model_config
         qconfig = self._qconfig
 
@@ -484,6 +547,7 @@ class TensorRTEngineBuilder(ModelHubMixin):
             shard=shard,
             is_parallel=is_parallel,
             opt_level=opt_level,
+            timing_cache=timing_cache,
         )
 
         # Let's build the network
@@ -593,6 +657,7 @@ class TensorRTEngineBuilder(ModelHubMixin):
         shard: Shard,
         is_parallel: bool,
         opt_level: Optional[int],
+        timing_cache: Optional[Path] = None,
     ):
         """
         Prepares the builder for the model. This is kept for backward compatibility in the base class for Llama, but this should be overridden for each architecture as `Builder.create_builder_config` takes different arguments depending on the architecture.
@@ -626,6 +691,7 @@ class TensorRTEngineBuilder(ModelHubMixin):
             parallel_build=is_parallel,
             vocab_size=config["vocab_size"],
             opt_level=opt_level,
+            timing_cache=str(timing_cache) if timing_cache else None,
         )
 
         return build_config
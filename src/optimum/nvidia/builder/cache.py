@@ -0,0 +1,406 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import asdict, dataclass, is_dataclass
+from enum import Enum
+from logging import getLogger
+from pathlib import Path
+from time import time
+from typing import Any, Callable, Dict, List, Optional, Union
+from uuid import uuid4
+
+from filelock import FileLock
+from huggingface_hub.constants import HF_HOME
+from pynvml import NVMLError
+
+from optimum.nvidia.utils import parse_flag_from_env
+from optimum.nvidia.utils.nvml import get_device_compute_capabilities
+from optimum.nvidia.version import __version__
+
+
+LOGGER = getLogger(__name__)
+
+ENV_ENGINE_CACHE_DIR = "OPTIMUM_NVIDIA_ENGINE_CACHE"
+ENV_ENGINE_CACHE_SIZE_GB = "OPTIMUM_NVIDIA_ENGINE_CACHE_SIZE_GB"
+ENV_DISABLE_ENGINE_CACHE = "OPTIMUM_NVIDIA_DISABLE_ENGINE_CACHE"
+
+DEFAULT_ENGINE_CACHE_DIR = Path(HF_HOME) / "optimum-nvidia" / "engines"
+DEFAULT_ENGINE_CACHE_SIZE_GB = 64.0
+ENGINE_CACHE_ENTRY_FILE = "entry.json"
+ENGINE_CACHE_LOCK_FILE = ".lock"
+
+
+def _to_serializable(obj: Any) -> Any:
+    """
+    Convert (nested) configuration objects to a canonical JSON representation
+    """
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    elif isinstance(obj, Enum):
+        return _to_serializable(obj.value)
+    elif isinstance(obj, Path):
+        return str(obj)
+    elif isinstance(obj, dict):
+        return {str(key): _to_serializable(value) for key, value in obj.items()}
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        values = [_to_serializable(value) for value in obj]
+        return sorted(values, key=repr) if isinstance(obj, (set, frozenset)) else values
+    elif is_dataclass(obj):
+        return _to_serializable(asdict(obj))
+    elif hasattr(obj, "to_dict"):
+        return _to_serializable(obj.to_dict())
+    elif hasattr(obj, "__dict__"):
+        return _to_serializable(
+            {k: v for k, v in vars(obj).items() if not k.startswith("_")}
+        )
+    else:
+        return str(obj)
+
+
+def _link_tree(source: Path, target: Path, ignore: Callable[[Path], bool]) -> int:
+    """
+    Hard-link (copy when not possible) all the files of `source`, including its subfolders, to `target`.
+    :param source: The folder to link the files from
+    :param target: The folder to link the files to, created if needed
+    :param ignore: Predicate telling if a file should be skipped
+    :return: The total size of the linked files, in bytes
+    """
+    size = 0
+    for source_file in sorted(source.rglob("*")):
+        if not source_file.is_file() or ignore(source_file):
+            continue
+
+        target_file = target / source_file.relative_to(source)
+        target_file.parent.mkdir(parents=True, exist_ok=True)
+        target_file.unlink(missing_ok=True)
+        try:
+            os.link(source_file, target_file)
+        except OSError:
+            shutil.copyfile(source_file, target_file)
+        size += target_file.stat().st_size
+
+    return size
+
+
+def get_toolkit_versions() -> Dict[str, str]:
+    """
+    Retrieve the versions of all the components influencing the content of the engines
+    :return: Dictionary mapping component name to its version
+    """
+    versions = {"optimum-nvidia": __version__}
+
+    try:
+        from tensorrt_llm import __version__ as trtllm_version
+
+        versions["tensorrt_llm"] = str(trtllm_version)
+    except ImportError:
+        versions["tensorrt_llm"] = "unknown"
+
+    try:
+        from tensorrt import __version__ as trt_version
+
+        versions["tensorrt"] = str(trt_version)
+    except ImportError:
+        versions["tensorrt"] = "unknown"
+
+    # Engines are specific to the GPU architecture they were built on
+    try:
+        major, minor = get_device_compute_capabilities(0)
+        versions["sm"] = f"{major}{minor}"
+    except NVMLError:
+        versions["sm"] = "unknown"
+
+    return versions
+
+
+def get_model_revision(local_path: Path) -> str:
+    """
+    Identify the revision of the weights stored at `local_path`.
+
+    Snapshots downloaded from the Hub are identified by their commit hash, local folders by the name, size and
+    modification time of the files they contain.
+    :param local_path: Folder containing the original model
+    :return: Revision identifier
+    """
+    local_path = Path(local_path).resolve()
+    if local_path.parent.name == "snapshots":
+        return local_path.name
+
+    digest = hashlib.sha256()
+    for path in sorted(local_path.iterdir()):
+        if path.is_file():
+            stat = path.stat()
+            digest.update(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+
+def compute_engine_cache_key(
+    model_revision: str,
+    engine_config: Any,
+    model_config: Dict[str, Any],
+    quantization_config: Optional[Dict[str, Any]] = None,
+    toolkit_versions: Optional[Dict[str, str]] = None,
+) -> str:
+    """
+    Compute the key identifying engines built from the provided inputs.
+    :param model_revision: Revision of the original weights (see `get_model_revision`)
+    :param engine_config: `EngineConfig` used to build the engines
+    :param model_config: Output of `TensorRTConfig.to_dict()`
+    :param quantization_config: Quantization parameters if any
+    :param toolkit_versions: Versions of the toolkit, defaults to `get_toolkit_versions()`
+    :return: Hexadecimal sha256 digest
+    """
+    if toolkit_versions is None:
+        toolkit_versions = get_toolkit_versions()
+
+    content = _to_serializable(
+        {
+            "model_revision": model_revision,
+            "engine_config": engine_config,
+            "model_config": model_config,
+            "quantization_config": quantization_config,
+            "toolkit_versions": toolkit_versions,
+        }
+    )
+
+    payload = json.dumps(content, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class EngineCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+@dataclass(frozen=True)
+class EngineCacheEntry:
+    key: str
+    path: Path
+    size: int
+    last_access: float
+
+
+class EngineCache:
+    """
+    Local, content-addressed, cache of compiled engines shared across processes.
+
+    Each entry is stored in its own folder named after its key. Entries are published atomically (rename) and
+    evicted in least-recently-used order whenever the total size goes over `max_size_bytes`. Engines found in the
+    cache are linked to the caller's folder, so they stay valid even if the entry gets evicted meanwhile.
+    """
+
+    __slots__ = ("_root", "_max_size_bytes", "_stats")
+
+    @staticmethod
+    def from_env() -> Optional["EngineCache"]:
+        """
+        Create the engine cache according to the environment variables.
+        The cache holds at most OPTIMUM_NVIDIA_ENGINE_CACHE_SIZE_GB (defaults to `DEFAULT_ENGINE_CACHE_SIZE_GB`).
+        :return: `None` if caching is disabled through OPTIMUM_NVIDIA_DISABLE_ENGINE_CACHE
+        """
+        if parse_flag_from_env(ENV_DISABLE_ENGINE_CACHE, False):
+            return None
+
+        root = os.environ.get(ENV_ENGINE_CACHE_DIR, DEFAULT_ENGINE_CACHE_DIR)
+        max_size_gb = float(
+            os.environ.get(ENV_ENGINE_CACHE_SIZE_GB, DEFAULT_ENGINE_CACHE_SIZE_GB)
+        )
+        max_size_bytes = int(max_size_gb * 1024**3)
+
+        return EngineCache(root, max_size_bytes)
+
+    def __init__(
+        self,
+        root: Union[str, os.PathLike] = DEFAULT_ENGINE_CACHE_DIR,
+        max_size_bytes: Optional[int] = None,
+    ):
+        if max_size_bytes is not None and max_size_bytes < 0:
+            raise ValueError(f"max_size_bytes should be >= 0 (got: {max_size_bytes})")
+
+        self._root = Path(root)
+        self._root.mkdir(parents=True, exist_ok=True)
+        self._max_size_bytes = max_size_bytes
+        self._stats = EngineCacheStats()
+
+    @property
+    def root(self) -> Path:
+        return self._root
+
+    @property
+    def max_size_bytes(self) -> Optional[int]:
+        return self._max_size_bytes
+
+    @property
+    def stats(self) -> EngineCacheStats:
+        return self._stats
+
+    def _lock(self) -> FileLock:
+        return FileLock(str(self._root / ENGINE_CACHE_LOCK_FILE))
+
+    def _entry_path(self, key: str) -> Path:
+        return self._root / key
+
+    def __contains__(self, key: str) -> bool:
+        return (self._entry_path(key) / ENGINE_CACHE_ENTRY_FILE).exists()
+
+    def lookup(self, key: str, target: Union[str, os.PathLike]) -> Optional[Path]:
+        """
+        Retrieve the engines for `key`, hard-linking (or copying) them to `target`.
+        The entry is locked while linking, files in `target` remain valid after the entry gets evicted.
+        :param key: Key computed through `compute_engine_cache_key`
+        :param target: Folder where to put the engines, created if needed
+        :return: `target` if found, None otherwise
+        """
+        entry_path = self._entry_path(key)
+        entry_file = entry_path / ENGINE_CACHE_ENTRY_FILE
+        target = Path(target)
+
+        with self._lock():
+            if not entry_file.exists():
+                self._stats.misses += 1
+                LOGGER.debug(f"Engine cache miss for {key}")
+                return None
+
+            # Refresh the access time used for LRU eviction
+            os.utime(entry_file)
+            _link_tree(entry_path, target, lambda path: path == entry_file)
+
+        self._stats.hits += 1
+        LOGGER.info(f"Engine cache hit for {key} ({entry_path}), linked to {target}")
+        return target
+
+    def store(
+        self,
+        key: str,
+        engines_folder: Path,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> Path:
+        """
+        Insert the content of `engines_folder` (including its subfolders) in the cache, except the checkpoints.
+        Files are hard-linked when possible, copied otherwise.
+        :param key: Key computed through `compute_engine_cache_key`
+        :param engines_folder: Folder holding the engines and their config.json
+        :param metadata: Additional information to store along the entry
+        :return: Path to the entry's folder
+        """
+        entry_path = self._entry_path(key)
+        if key in self:
+            return entry_path
+
+        staging_path = self._root / f".{key}.{uuid4().hex}.tmp"
+        staging_path.mkdir(parents=True)
+
+        try:
+            # Engines built for multiple profiles live in subfolders, next to their manifest
+            size = _link_tree(
+                Path(engines_folder),
+                staging_path,
+                lambda path: path.suffix == ".safetensors",
+            )
+
+            with open(staging_path / ENGINE_CACHE_ENTRY_FILE, "w") as entry_f:
+                json.dump(
+                    {
+                        "key": key,
+                        "size": size,
+                        "created": time(),
+                        "metadata": _to_serializable(metadata or {}),
+                    },
+                    entry_f,
+                )
+
+            with self._lock():
+                if key in self:
+                    shutil.rmtree(staging_path, ignore_errors=True)
+                else:
+                    os.replace(staging_path, entry_path)
+                    LOGGER.info(f"Stored engines in cache at {entry_path}")
+        except Exception:
+            shutil.rmtree(staging_path, ignore_errors=True)
+            raise
+
+        if self._max_size_bytes is not None:
+            self.evict(self._max_size_bytes, keep={key})
+
+        return entry_path
+
+    def entries(self) -> List[EngineCacheEntry]:
+        """
+        List all the entries currently in the cache, least recently used first
+        """
+        entries = []
+        for entry_path in self._root.iterdir():
+            entry_file = entry_path / ENGINE_CACHE_ENTRY_FILE
+            if entry_path.name.startswith(".") or not entry_file.exists():
+                continue
+
+            try:
+                with open(entry_file, "r") as entry_f:
+                    size = json.load(entry_f)["size"]
+                last_access = entry_file.stat().st_mtime
+            except (OSError, ValueError, KeyError):
+                continue
+
+            entries.append(
+                EngineCacheEntry(entry_path.name, entry_path, size, last_access)
+            )
+
+        return sorted(entries, key=lambda entry: entry.last_access)
+
+    def size(self) -> int:
+        return sum(entry.size for entry in self.entries())
+
+    def evict(self, max_size_bytes: int, keep: Optional[set] = None) -> List[str]:
+        """
+        Remove least recently used entries until the cache fits in `max_size_bytes`.
+        :param max_size_bytes: The disk budget
+        :param keep: Keys which should not be evicted
+        :return: The keys which were evicted
+        """
+        keep = keep or set()
+        evicted = []
+
+        with self._lock():
+            entries = self.entries()
+            total_size = sum(entry.size for entry in entries)
+
+            for entry in entries:
+                if total_size <= max_size_bytes:
+                    break
+
+                if entry.key in keep:
+                    continue
+
+                # Unpublish first so concurrent lookups don't see a partially removed entry
+                (entry.path / ENGINE_CACHE_ENTRY_FILE).unlink(missing_ok=True)
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+                total_size -= entry.size
+                evicted.append(entry.key)
+                LOGGER.info(f"Evicted engines {entry.key} ({entry.size} bytes)")
+
+        self._stats.evictions += len(evicted)
+        return evicted
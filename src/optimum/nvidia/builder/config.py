@@ -12,9 +12,9 @@
 #  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
-from dataclasses import dataclass
+from dataclasses import astuple, dataclass
 from logging import getLogger
-from typing import Optional, Union
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 
 import torch
 from tensorrt_llm.plugin import PluginConfig
@@ -33,6 +33,12 @@ class InferenceProfile:
     max_input_len: int
     max_output_len: int
 
+    @property
+    def name(self) -> str:
+        return (
+            f"bs{self.max_batch_size}-in{self.max_input_len}-out{self.max_output_len}"
+        )
+
 
 @dataclass
 class GenerationProfile:
@@ -92,6 +98,24 @@ class EngineConfigBuilder:
             max_batch_size, max_prompt_length, max_new_tokens
         )
 
+        # Additional profiles, built from the same checkpoints
+        if inference_profiles := additional_params.pop("inference_profiles", None):
+            profiles = []
+            for profile in inference_profiles:
+                profile_prompt_length = profile.get(
+                    "max_prompt_length", max_prompt_length
+                )
+                profiles.append(
+                    (
+                        profile.get("max_batch_size", max_batch_size),
+                        profile_prompt_length,
+                        profile.get("max_output_length", config.max_position_embeddings)
+                        - profile_prompt_length,
+                    )
+                )
+
+            builder.with_inference_profiles(profiles)
+
         # Generation related
         builder.with_generation_profile(additional_params.pop("num_beams", 1))
 
@@ -110,7 +134,7 @@ class EngineConfigBuilder:
         self._logits_dtype = config.torch_dtype
         self._strongly_typed: bool = False
         self._sharding_profile: ShardingProfile = ShardingProfile()
-        self._workload_profile: Optional[InferenceProfile] = None
+        self._workload_profiles: List[InferenceProfile] = []
         self._generation_profile: Optional[GenerationProfile] = None
         self._plugin_config: Optional[PluginConfig] = None
 
@@ -156,9 +180,9 @@ class EngineConfigBuilder:
         LOGGER.info(f"Defined logits dtype to: {self._logits_dtype}")
         return self
 
-    def with_inference_profile(
+    def _create_inference_profile(
         self, max_batch_size: int, max_prompt_length: int, max_new_tokens: int
-    ) -> "EngineConfigBuilder":
+    ) -> InferenceProfile:
         if max_batch_size < 1:
             raise ValueError(f"max_batch_size should be >= 1 (got: {max_batch_size})")
 
@@ -184,12 +208,42 @@ class EngineConfigBuilder:
                 f" maximum sequence length supported by the model is {self._config.max_position_embeddings})"
             )
 
-        self._workload_profile = InferenceProfile(
-            max_batch_size, max_prompt_length, max_new_tokens
-        )
-        LOGGER.info(f"Defined engine inference profile: {self._workload_profile}")
+        return InferenceProfile(max_batch_size, max_prompt_length, max_new_tokens)
+
+    def with_inference_profile(
+        self, max_batch_size: int, max_prompt_length: int, max_new_tokens: int
+    ) -> "EngineConfigBuilder":
+        self._workload_profiles = [
+            self._create_inference_profile(
+                max_batch_size, max_prompt_length, max_new_tokens
+            )
+        ]
+        LOGGER.info(f"Defined engine inference profile: {self._workload_profiles[0]}")
         return self
 
+    def with_inference_profiles(
+        self, profiles: Sequence[Union[InferenceProfile, Tuple[int, int, int]]]
+    ) -> "EngineConfigBuilder":
+        """
+        Define multiple inference profiles, one engine being built for each of them from the same checkpoints.
+        Profiles already defined are kept, duplicates are ignored.
+        :param profiles: `InferenceProfile` or (max_batch_size, max_prompt_length, max_new_tokens) tuples
+        """
+        for profile in profiles:
+            if isinstance(profile, InferenceProfile):
+                profile = astuple(profile)
+
+            profile = self._create_inference_profile(*profile)
+            if profile not in self._workload_profiles:
+                self._workload_profiles.append(profile)
+
+        LOGGER.info(f"Defined engine inference profiles: {self._workload_profiles}")
+        return self
+
+    @property
+    def num_inference_profiles(self) -> int:
+        return len(self._workload_profiles)
+
     def with_generation_profile(self, num_beams: int) -> "EngineConfigBuilder":
         if num_beams < 1:
             raise ValueError(f"num_beams should be >= 1 (got: {num_beams})")
@@ -224,7 +278,7 @@ class EngineConfigBuilder:
         return self
 
     def validate(self) -> bool:
-        if self._workload_profile is None:
+        if not self._workload_profiles:
             raise ValueError(
                 "You need to set an inference profile. Use EngineConfigBuilder.with_inference_profile()."
             )
@@ -239,33 +293,49 @@ class EngineConfigBuilder:
                 "You need to set a plugin profile. Use EngineConfigBuilder.with_plugins_config()."
             )
 
-        max_generated_length = (
-            self._workload_profile.max_input_len
-            + self._workload_profile.max_output_len
-            - 1
-        )
-        if max_generated_length > self._config.max_position_embeddings:
-            raise ValueError(
-                "max_prompt_length + max_new_tokens should be lesser or equals "
-                "to the maximum length supported by the model (got "
-                f"max_prompt_length={self._workload_profile.max_input_len}, "
-                f"max_new_tokens={self._workload_profile.max_output_len},"
-                f"{self._workload_profile.max_input_len + self._workload_profile.max_output_len}"
-                f" > {self._config.max_position_embeddings}"
-                ")"
-            )
+        for profile in self._workload_profiles:
+            max_generated_length = profile.max_input_len + profile.max_output_len - 1
+            if max_generated_length > self._config.max_position_embeddings:
+                raise ValueError(
+                    "max_prompt_length + max_new_tokens should be lesser or equals "
+                    "to the maximum length supported by the model (got "
+                    f"max_prompt_length={profile.max_input_len}, "
+                    f"max_new_tokens={profile.max_output_len},"
+                    f"{profile.max_input_len + profile.max_output_len}"
+                    f" > {self._config.max_position_embeddings}"
+                    ")"
+                )
 
         return True
 
-    def build(self) -> EngineConfig:
-        self.validate()
-
+    def _build(self, workload_profile: InferenceProfile) -> EngineConfig:
         return EngineConfig(
             optimisation_level=self._optimisation_level,
             sharding_profile=self._sharding_profile,
             strongly_typed=self._strongly_typed,
             logits_dtype=self._logits_dtype,
-            workload_profile=self._workload_profile,
+            workload_profile=workload_profile,
             generation_profile=self._generation_profile,
             plugins_config=self._plugin_config,
         )
+
+    def build(self) -> EngineConfig:
+        self.validate()
+
+        if len(self._workload_profiles) > 1:
+            raise ValueError(
+                f"{len(self._workload_profiles)} inference profiles are defined. "
+                "Use EngineConfigBuilder.build_profiles()."
+            )
+
+        return self._build(self._workload_profiles[0])
+
+    def build_profiles(self) -> Dict[str, EngineConfig]:
+        """
+        Create the parameters of the engine of every inference profile.
+        :return: Mapping from the name of the profile to the engine's parameters
+        """
+        self.validate()
+        return {
+            profile.name: self._build(profile) for profile in self._workload_profiles
+        }
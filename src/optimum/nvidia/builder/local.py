@@ -15,14 +15,21 @@
 from itertools import chain
 from logging import getLogger
 from pathlib import Path
-from subprocess import PIPE, STDOUT, run
-from typing import Any, Dict
+from typing import Any, Dict, List, Mapping, Optional
 
 from optimum.nvidia import TensorRTConfig
 from optimum.nvidia.builder.config import EngineConfig
+from optimum.nvidia.builder.manifest import write_engines_manifest
+from optimum.nvidia.builder.orchestrator import (
+    BuildJob,
+    BuildOrchestrator,
+    BuildResult,
+)
+from optimum.nvidia.builder.timing_cache import TimingCacheStore
 
 
 LOGGER = getLogger()
+TIMING_CACHE_FILE = "timing.cache"
 CLI_PLUGIN_NAMES = {
     # Plugins
     "bert_attention_plugin",
@@ -58,7 +65,12 @@ class LocalEngineBuilder:
 
     @staticmethod
     def build_cli_command(
-        root: Path, model_config: TensorRTConfig, build_config: EngineConfig
+        root: Path,
+        model_config: TensorRTConfig,
+        build_config: EngineConfig,
+        output_dir: Optional[Path] = None,
+        num_workers: int = 1,
+        input_timing_cache: Optional[Path] = None,
     ) -> Dict[str, Any]:
         workload_params = {
             "--max_batch_size": build_config.workload_profile.max_batch_size,
@@ -83,30 +95,68 @@ class LocalEngineBuilder:
 
         build_params = {
             "--checkpoint_dir": root,
-            "--output_dir": root,
+            "--output_dir": output_dir or root,
             "--model_config": root / "config.json",
             "--builder_opt": build_config.optimisation_level,
             "--logits_dtype": build_config.logits_dtype,
         }
 
+        # trtllm-build is able to build multiple ranks concurrently
+        if num_workers > 1:
+            build_params["--workers"] = num_workers
+
+        # Start from the timings of previous builds and export the updated ones
+        if input_timing_cache is not None:
+            build_params["--input_timing_cache"] = input_timing_cache
+
+        build_params["--output_timing_cache"] = (output_dir or root) / TIMING_CACHE_FILE
+
         if model_config.supports_strong_typing():
             build_params["--strongly_typed"] = None
 
         return build_params | generation_params | workload_params | plugins_params
 
-    def __init__(self, config: TensorRTConfig, output_folder: Path):
+    def __init__(
+        self,
+        config: TensorRTConfig,
+        output_folder: Path,
+        max_workers: Optional[int] = None,
+        timing_cache_store: Optional[TimingCacheStore] = None,
+    ):
         self._config = config
         self._output_folder = output_folder
+        self._orchestrator = BuildOrchestrator(max_workers)
+        self._timing_cache_store = timing_cache_store
+
+    def _create_job(
+        self, name: str, config: EngineConfig, output_dir: Optional[Path] = None
+    ) -> BuildJob:
+        num_workers = min(
+            self._config.mapping.world_size, self._orchestrator.max_workers
+        )
+        input_timing_cache = (
+            self._timing_cache_store.lookup(self._config.dtype)
+            if self._timing_cache_store
+            else None
+        )
 
-    def build(self, config: EngineConfig):
         cli_params = LocalEngineBuilder.build_cli_command(
-            self._output_folder, self._config, config
+            self._output_folder,
+            self._config,
+            config,
+            output_dir,
+            num_workers,
+            input_timing_cache,
         )
         cli_params_list = [str(t) for t in chain.from_iterable(cli_params.items())]
         cli_params_list = [i for i in cli_params_list if i != "None"]
 
-        LOGGER.debug(f"trtllm-build parameters: {cli_params_list}")
+        LOGGER.debug(f"trtllm-build parameters ({name}): {cli_params_list}")
+        return BuildJob(
+            name, [LocalEngineBuilder.TRTLLM_BUILD_EXEC] + cli_params_list, num_workers
+        )
 
+    def _check_checkpoints(self):
         for rank in range(self._config.mapping.world_size):
             ranked_checkpoint = f"rank{rank}.safetensors"
             if not (self._output_folder / ranked_checkpoint).exists():
@@ -114,16 +164,45 @@ class LocalEngineBuilder:
                     f"Missing rank-{rank} checkpoints (rank{rank}.safetensors), cannot build."
                 )
 
-        # Run the build
-        result = run(
-            [LocalEngineBuilder.TRTLLM_BUILD_EXEC] + cli_params_list,
-            stdout=PIPE,
-            stderr=STDOUT,
+    def _run(self, jobs: List[BuildJob], output_dirs: List[Path]) -> List[BuildResult]:
+        results = self._orchestrator.run(jobs)
+
+        # Make the timings of these builds available to the next ones
+        if self._timing_cache_store is not None:
+            for output_dir in output_dirs:
+                self._timing_cache_store.merge(
+                    self._config.dtype, output_dir / TIMING_CACHE_FILE
+                )
+
+        return results
+
+    def build(self, config: EngineConfig):
+        """
+        Build the engines of all the ranks in the output folder.
+        Ranks are built concurrently by trtllm-build, up to the workers budget.
+        :param config: The engine's parameters
+        """
+        self._check_checkpoints()
+        self._run([self._create_job("trtllm-build", config)], [self._output_folder])
+
+    def build_profiles(self, configs: Mapping[str, EngineConfig]) -> List[Path]:
+        """
+        Build multiple sets of engines from the same checkpoints, each in its own subfolder of the output folder.
+        Builds run as concurrent trtllm-build processes, up to the workers budget. The engines of every profile are
+        recorded in a manifest (engines.json) stored in the output folder, allowing to load them as a set.
+        :param configs: Mapping from the name of the subfolder to the engine's parameters
+        :return: The folders holding the engines, in the same order as `configs`
+        """
+        self._check_checkpoints()
+
+        output_dirs = [self._output_folder / name for name in configs]
+        self._run(
+            [
+                self._create_job(name, config, output_dir)
+                for (name, config), output_dir in zip(configs.items(), output_dirs)
+            ],
+            output_dirs,
         )
-        if result.returncode != 0:
-            print(f"trtllm-build stdout: {result.stdout}")
-            print(f"trtllm-build stderr: {result.stderr}")
-            raise ValueError(
-                f"Compilation failed ({result.returncode}), "
-                "please open up an issue at https://github.com/huggingface/optimum-nvidia"
-            )  # TODO: change with proper error
+
+        write_engines_manifest(self._output_folder, configs, output_dirs)
+        return output_dirs
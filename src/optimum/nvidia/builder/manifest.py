@@ -0,0 +1,105 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import json
+import os
+from dataclasses import asdict
+from logging import getLogger
+from pathlib import Path
+from typing import List, Mapping, NamedTuple, Union
+
+from optimum.nvidia.builder.config import EngineConfig, InferenceProfile
+
+
+LOGGER = getLogger(__name__)
+
+ENGINES_MANIFEST_FILE = "engines.json"
+
+# Bump whenever the layout of the manifest changes
+ENGINES_MANIFEST_VERSION = 1
+
+
+ManifestEntry = NamedTuple(
+    "ManifestEntry",
+    [
+        ("name", str),
+        ("path", Path),
+        ("profile", InferenceProfile),
+    ],
+)
+
+
+def has_engines_manifest(root: Union[str, os.PathLike]) -> bool:
+    """
+    Check whether `root` holds a set of engines built for multiple inference profiles
+    """
+    return (Path(root) / ENGINES_MANIFEST_FILE).exists()
+
+
+def write_engines_manifest(
+    root: Union[str, os.PathLike],
+    configs: Mapping[str, EngineConfig],
+    folders: List[Path],
+) -> Path:
+    """
+    Record the engines built from the same checkpoints for multiple inference profiles.
+    :param root: The folder holding the checkpoints, engines' folders are stored relative to it
+    :param configs: Mapping from the name of the profile to the engine's parameters
+    :param folders: The folders holding the engines, in the same order as `configs`
+    :return: The path of the manifest
+    """
+    root = Path(root)
+    manifest = {
+        "version": ENGINES_MANIFEST_VERSION,
+        "engines": [
+            {
+                "name": name,
+                "path": os.path.relpath(folder, root),
+                "profile": asdict(config.workload_profile),
+            }
+            for (name, config), folder in zip(configs.items(), folders)
+        ],
+    }
+
+    path = root / ENGINES_MANIFEST_FILE
+    with open(path, "w") as manifest_f:
+        json.dump(manifest, manifest_f, indent=2)
+
+    LOGGER.debug(f"Recorded {len(folders)} engine profile(s) in {path}")
+    return path
+
+
+def read_engines_manifest(root: Union[str, os.PathLike]) -> List[ManifestEntry]:
+    """
+    Retrieve the engines recorded by `write_engines_manifest`.
+    :param root: The folder holding the manifest
+    :return: The engines of every profile, with absolute paths
+    """
+    root = Path(root)
+    with open(root / ENGINES_MANIFEST_FILE, "r") as manifest_f:
+        manifest = json.load(manifest_f)
+
+    if (version := manifest.get("version")) != ENGINES_MANIFEST_VERSION:
+        raise ValueError(
+            f"Unsupported engines manifest version {version} (expected: {ENGINES_MANIFEST_VERSION})"
+        )
+
+    return [
+        ManifestEntry(
+            entry["name"], root / entry["path"], InferenceProfile(**entry["profile"])
+        )
+        for entry in manifest["engines"]
+    ]
@@ -0,0 +1,176 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+from collections import deque
+from logging import getLogger
+from queue import Queue
+from subprocess import PIPE, STDOUT, Popen
+from threading import Thread
+from time import monotonic
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from optimum.nvidia.errors import OptimumNvidiaException
+
+
+LOGGER = getLogger(__name__)
+
+# Number of output lines kept for each job to report failures
+DEFAULT_LOG_TAIL_LENGTH = 50
+
+
+BuildJob = NamedTuple(
+    "BuildJob",
+    [
+        ("name", str),
+        ("command", List[str]),
+        ("num_workers", int),
+    ],
+)
+
+BuildResult = NamedTuple(
+    "BuildResult",
+    [
+        ("job", BuildJob),
+        ("returncode", int),
+        ("duration", float),
+        ("output", List[str]),
+    ],
+)
+
+
+class EngineBuildError(OptimumNvidiaException):
+    def __init__(self, failures: List[BuildResult]):
+        details = "\n".join(
+            f"- {failure.job.name} exited with code {failure.returncode}:\n"
+            + "\n".join(f"    {line}" for line in failure.output)
+            for failure in failures
+        )
+
+        super().__init__(
+            "build",
+            f"{len(failures)} engine build(s) failed, "
+            "please open up an issue at https://github.com/huggingface/optimum-nvidia\n"
+            f"{details}",
+        )
+        self.failures = failures
+
+
+class BuildOrchestrator:
+    """
+    Run build commands (i.e. `trtllm-build`) as concurrent subprocesses.
+
+    Each job declares how many workers it uses, and jobs are started as long as the sum of the workers of the
+    running jobs fits in the `max_workers` budget. The output of every job is streamed line by line to the
+    logger, prefixed with the job's name, as it is produced.
+    """
+
+    __slots__ = ("_max_workers", "_log_tail_length", "_env")
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        log_tail_length: int = DEFAULT_LOG_TAIL_LENGTH,
+        env: Optional[Dict[str, str]] = None,
+    ):
+        if max_workers is None:
+            max_workers = len(os.sched_getaffinity(0))
+        elif max_workers < 1:
+            raise ValueError(f"max_workers should be >= 1 (got: {max_workers})")
+
+        self._max_workers = max_workers
+        self._log_tail_length = log_tail_length
+        self._env = env
+
+    @property
+    def max_workers(self) -> int:
+        return self._max_workers
+
+    def _start(self, job: BuildJob, completions: Queue):
+        LOGGER.info(f"[{job.name}] Starting: {' '.join(job.command)}")
+
+        start = monotonic()
+        try:
+            process = Popen(
+                job.command,
+                stdout=PIPE,
+                stderr=STDOUT,
+                text=True,
+                bufsize=1,
+                env=self._env,
+            )
+        except OSError as e:
+            completions.put(BuildResult(job, -1, monotonic() - start, [str(e)]))
+            return
+
+        def _stream():
+            output = deque(maxlen=self._log_tail_length)
+            for line in process.stdout:
+                line = line.rstrip()
+                output.append(line)
+                LOGGER.info(f"[{job.name}] {line}")
+
+            returncode = process.wait()
+            completions.put(
+                BuildResult(job, returncode, monotonic() - start, list(output))
+            )
+
+        Thread(target=_stream, name=f"build-{job.name}", daemon=True).start()
+
+    def run(
+        self, jobs: Sequence[BuildJob], raise_on_error: bool = True
+    ) -> List[BuildResult]:
+        """
+        Run all the jobs, bounded by the workers budget.
+        :param jobs: The jobs to run, started in order
+        :param raise_on_error: Raise `EngineBuildError` once all the jobs are done if any of them failed
+        :return: The result of each job, in the same order as `jobs`
+        """
+        pending = deque(jobs)
+        completions = Queue()
+        results: Dict[str, BuildResult] = {}
+        workers_in_use = 0
+
+        if len({job.name for job in jobs}) != len(jobs):
+            raise ValueError("Build jobs should have unique names")
+
+        while pending or workers_in_use:
+            # Start as many jobs as the budget allows, a job larger than the budget runs alone
+            while pending:
+                num_workers = min(max(1, pending[0].num_workers), self._max_workers)
+                if workers_in_use and workers_in_use + num_workers > self._max_workers:
+                    break
+
+                self._start(pending.popleft(), completions)
+                workers_in_use += num_workers
+
+            result = completions.get()
+            workers_in_use -= min(max(1, result.job.num_workers), self._max_workers)
+            results[result.job.name] = result
+
+            if result.returncode == 0:
+                LOGGER.info(f"[{result.job.name}] Done in {result.duration:.1f}s")
+            else:
+                LOGGER.error(
+                    f"[{result.job.name}] Failed with code {result.returncode} after {result.duration:.1f}s"
+                )
+
+        ordered_results = [results[job.name] for job in jobs]
+        failures = [result for result in ordered_results if result.returncode != 0]
+
+        if failures and raise_on_error:
+            raise EngineBuildError(failures)
+
+        return ordered_results
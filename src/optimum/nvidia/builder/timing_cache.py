@@ -0,0 +1,139 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+from logging import getLogger
+from pathlib import Path
+from typing import Dict, Optional, Union
+from uuid import uuid4
+
+from filelock import FileLock
+from huggingface_hub.constants import HF_HOME
+
+from optimum.nvidia.builder.cache import get_toolkit_versions
+from optimum.nvidia.utils import parse_flag_from_env
+
+
+LOGGER = getLogger(__name__)
+
+ENV_TIMING_CACHE_DIR = "OPTIMUM_NVIDIA_TIMING_CACHE"
+ENV_DISABLE_TIMING_CACHE = "OPTIMUM_NVIDIA_DISABLE_TIMING_CACHE"
+
+DEFAULT_TIMING_CACHE_DIR = Path(HF_HOME) / "optimum-nvidia" / "timing-caches"
+
+# Bump whenever the layout of the store changes
+TIMING_CACHE_STORE_VERSION = 1
+
+
+def merge_timing_caches(base: bytes, other: bytes) -> bytes:
+    """
+    Combine two serialized TensorRT timing caches.
+    :param base: The serialized cache to merge into
+    :param other: The serialized cache holding the new timings
+    :return: The serialized combined cache
+    """
+    import tensorrt as trt
+
+    builder = trt.Builder(trt.Logger(trt.Logger.WARNING))
+    config = builder.create_builder_config()
+
+    cache = config.create_timing_cache(base)
+    cache.combine(config.create_timing_cache(other), ignore_mismatch=True)
+    return bytes(cache.serialize())
+
+
+class TimingCacheStore:
+    """
+    Shared store of TensorRT timing caches, reused across builds to skip tactic selection for the layers already
+    profiled on the same hardware.
+
+    Timing caches are only valid for a given GPU architecture and TensorRT version, and depend on the precision
+    of the network, so the store holds one cache per (SM, TensorRT version, dtype). Builders read the cache
+    as-is and merge their own timings back, under a file lock, once they are done.
+    """
+
+    __slots__ = ("_root", "_versions")
+
+    @staticmethod
+    def from_env() -> Optional["TimingCacheStore"]:
+        """
+        Create the timing cache store according to the environment variables.
+        :return: `None` if disabled through OPTIMUM_NVIDIA_DISABLE_TIMING_CACHE
+        """
+        if parse_flag_from_env(ENV_DISABLE_TIMING_CACHE, False):
+            return None
+
+        return TimingCacheStore(
+            os.environ.get(ENV_TIMING_CACHE_DIR, DEFAULT_TIMING_CACHE_DIR)
+        )
+
+    def __init__(
+        self,
+        root: Union[str, os.PathLike] = DEFAULT_TIMING_CACHE_DIR,
+        toolkit_versions: Optional[Dict[str, str]] = None,
+    ):
+        self._root = Path(root) / f"v{TIMING_CACHE_STORE_VERSION}"
+        self._root.mkdir(parents=True, exist_ok=True)
+        self._versions = toolkit_versions or get_toolkit_versions()
+
+    @property
+    def root(self) -> Path:
+        return self._root
+
+    def path_for(self, dtype: str) -> Path:
+        """
+        Location of the timing cache matching the current hardware, TensorRT version and `dtype`.
+        The file might not exist yet.
+        """
+        return (
+            self._root
+            / f"sm{self._versions['sm']}-trt{self._versions['tensorrt']}-{dtype}.cache"
+        )
+
+    def lookup(self, dtype: str) -> Optional[Path]:
+        """
+        Retrieve the timing cache builders should load.
+        :param dtype: The precision of the network to build
+        :return: Path to the timing cache if any, None otherwise
+        """
+        path = self.path_for(dtype)
+        return path if path.exists() else None
+
+    def merge(self, dtype: str, timing_cache: Path):
+        """
+        Merge the timings generated by a build back into the store.
+        :param dtype: The precision of the network which was built
+        :param timing_cache: The timing cache generated by the build
+        """
+        if not timing_cache.exists():
+            LOGGER.warning(f"No timing cache generated at {timing_cache}, skipping")
+            return
+
+        path = self.path_for(dtype)
+        with FileLock(str(path.with_suffix(".lock"))):
+            timings = timing_cache.read_bytes()
+
+            if path.exists():
+                try:
+                    timings = merge_timing_caches(path.read_bytes(), timings)
+                except Exception as e:
+                    LOGGER.warning(f"Unable to merge timing caches ({e}), replacing")
+
+            # Concurrent readers must never see a partially written cache
+            staging_path = path.with_name(f".{path.name}.{uuid4().hex}")
+            staging_path.write_bytes(timings)
+            os.replace(staging_path, path)
+
+        LOGGER.debug(f"Merged timing cache {timing_cache} into {path}")
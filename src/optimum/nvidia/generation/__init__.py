@@ -0,0 +1,22 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from .executor import Executor
+from .prefix_cache import PrefixCache, PrefixCacheStats, PrefixMatch
+from .request import FinishReason, GenerationRequest
+from .router import EngineMetrics, EngineRouter
+from .sampling import DEFAULT_SAMPLING_PARAMETERS, pack_sampling_parameters
+from .scheduler import InflightBatchingScheduler, SlotOccupancy
+from .stopping import AhoCorasick, StopCriteria, StopMatch, StopState
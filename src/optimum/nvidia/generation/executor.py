@@ -0,0 +1,75 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from abc import ABC, abstractmethod
+from logging import getLogger
+from typing import Any, Dict, List, Mapping, Sequence
+
+from .request import GenerationRequest
+
+
+LOGGER = getLogger(__name__)
+
+
+class Executor(ABC):
+    """
+    Backend advancing all the requests currently occupying a slot of the scheduler.
+
+    Executors are step-wise: each call to `step` generates the next token(s) for every active request.
+    The admission and retirement hooks let stateful backends (i.e. owning KV-cache blocks) track slots.
+    """
+
+    @property
+    @abstractmethod
+    def max_batch_size(self) -> int:
+        raise NotImplementedError("Executor::max_batch_size is abstract.")
+
+    @abstractmethod
+    def step(self, requests: Mapping[int, GenerationRequest]) -> Dict[int, List[int]]:
+        """
+        Generate the next token(s) for all the active requests.
+        :param requests: Active requests indexed by the slot they occupy
+        :return: The newly generated tokens indexed by slot
+        """
+        raise NotImplementedError("Executor::step is abstract.")
+
+    def validate(self, request: GenerationRequest):
+        """
+        Check the request can be served by this executor, raising `ValueError` otherwise.
+        :param request: The request about to be submitted
+        """
+        pass
+
+    def on_admit(self, slot: int, request: GenerationRequest):
+        pass
+
+    def on_retire(self, slot: int, request: GenerationRequest):
+        pass
+
+    def kv_blocks(self, slot: int, request: GenerationRequest) -> Sequence[Any]:
+        """
+        Handles of the paged KV-cache blocks holding the keys/values computed for a request about to be retired,
+        one per full block of tokens, in order. Ownership of the blocks is transferred to the prefix cache.
+        Executors not exposing their KV-cache return an empty sequence, disabling prefix reuse.
+        :param slot: The slot occupied by the request
+        :param request: The request being retired
+        """
+        return ()
+
+    def free_kv_blocks(self, blocks: Sequence[Any]):
+        """
+        Give back KV-cache blocks evicted from (or not kept by) the prefix cache.
+        """
+        pass
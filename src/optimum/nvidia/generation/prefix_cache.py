@@ -0,0 +1,240 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import heapq
+from dataclasses import dataclass, replace
+from itertools import count
+from logging import getLogger
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+
+LOGGER = getLogger(__name__)
+
+# Matches TensorRT-LLM's default number of tokens per paged KV-cache block
+DEFAULT_TOKENS_PER_BLOCK = 64
+
+
+class _Node:
+    __slots__ = ("tokens", "block", "parent", "children", "ref_count", "last_access")
+
+    def __init__(self, tokens: Tuple[int, ...], block: Any, parent: Optional["_Node"]):
+        self.tokens = tokens
+        self.block = block
+        self.parent = parent
+        self.children: Dict[Tuple[int, ...], "_Node"] = {}
+        self.ref_count = 0
+        self.last_access = 0
+
+
+PrefixMatch = NamedTuple(
+    "PrefixMatch",
+    [
+        ("num_tokens", int),
+        ("blocks", List[Any]),
+        ("nodes", List[_Node]),
+    ],
+)
+
+
+@dataclass
+class PrefixCacheStats:
+    lookups: int = 0
+    hits: int = 0
+    queried_tokens: int = 0
+    matched_tokens: int = 0
+    evictions: int = 0
+    num_blocks: int = 0
+
+    @property
+    def token_hit_rate(self) -> float:
+        return self.matched_tokens / self.queried_tokens if self.queried_tokens else 0.0
+
+
+class PrefixCache:
+    """
+    Index of the KV-cache blocks holding the keys/values of previously computed prompts, allowing new prompts
+    sharing a prefix with them to skip the context phase for the matched part.
+
+    The index is a trie where each edge is a full block of `tokens_per_block` token ids, mapped to the handle of
+    the paged KV-cache block holding them (any object, as understood by the executor owning the blocks). Only
+    full blocks are indexed, as partially filled blocks keep being written to while decoding.
+
+    Blocks matched by running requests are reference counted and can't be evicted. Once the index holds more than
+    `max_blocks` blocks, the least recently used blocks no running request depends on are evicted, leaves first,
+    and their handles are given back to the caller to be freed.
+    """
+
+    __slots__ = ("_tokens_per_block", "_max_blocks", "_root", "_clock", "_stats")
+
+    def __init__(
+        self, max_blocks: int, tokens_per_block: int = DEFAULT_TOKENS_PER_BLOCK
+    ):
+        if max_blocks < 0:
+            raise ValueError(f"max_blocks should be >= 0 (got: {max_blocks})")
+
+        if tokens_per_block < 1:
+            raise ValueError(
+                f"tokens_per_block should be >= 1 (got: {tokens_per_block})"
+            )
+
+        self._tokens_per_block = tokens_per_block
+        self._max_blocks = max_blocks
+        self._root = _Node((), None, None)
+        self._clock = count(1)
+        self._stats = PrefixCacheStats()
+
+    @property
+    def tokens_per_block(self) -> int:
+        return self._tokens_per_block
+
+    @property
+    def num_blocks(self) -> int:
+        return self._stats.num_blocks
+
+    @property
+    def stats(self) -> PrefixCacheStats:
+        return replace(self._stats)
+
+    def _split(
+        self, token_ids: Sequence[int], max_tokens: int
+    ) -> List[Tuple[int, ...]]:
+        size = self._tokens_per_block
+        return [
+            tuple(token_ids[start : start + size])
+            for start in range(0, max_tokens - size + 1, size)
+        ]
+
+    def match(self, token_ids: Sequence[int]) -> PrefixMatch:
+        """
+        Find the blocks holding the longest cached prefix of `token_ids`, and lock them until `release` is called.
+        The last token is never matched: at least one token has to go through the context phase to produce logits.
+        :param token_ids: The prompt
+        :return: `PrefixMatch` with the number of tokens covered by the matched blocks
+        """
+        node, nodes = self._root, []
+        now = next(self._clock)
+
+        for tokens in self._split(token_ids, len(token_ids) - 1):
+            if (node := node.children.get(tokens, None)) is None:
+                break
+
+            node.ref_count += 1
+            node.last_access = now
+            nodes.append(node)
+
+        num_tokens = len(nodes) * self._tokens_per_block
+        self._stats.lookups += 1
+        self._stats.hits += int(num_tokens > 0)
+        self._stats.queried_tokens += len(token_ids)
+        self._stats.matched_tokens += num_tokens
+
+        return PrefixMatch(num_tokens, [node.block for node in nodes], nodes)
+
+    def release(self, match: PrefixMatch):
+        """
+        Unlock the blocks of a match, once the request using them is done.
+        """
+        for node in match.nodes:
+            if node.ref_count < 1:
+                raise ValueError("Releasing a prefix which is not in use")
+            node.ref_count -= 1
+
+    def insert(self, token_ids: Sequence[int], blocks: Sequence[Any]) -> List[Any]:
+        """
+        Index the blocks holding the KV-cache of `token_ids`.
+        :param token_ids: The tokens whose keys/values were computed
+        :param blocks: The handles of the blocks, in order, one per full block of tokens
+        :return: Handles the cache didn't keep (already indexed or evicted), to be freed by the caller
+        """
+        chunks = self._split(token_ids, len(token_ids))
+        if len(blocks) > len(chunks):
+            raise ValueError(
+                f"{len(blocks)} blocks were provided for {len(token_ids)} tokens "
+                f"({self._tokens_per_block} tokens per block)"
+            )
+
+        node, unused = self._root, []
+        now = next(self._clock)
+
+        for tokens, block in zip(chunks, blocks):
+            if (child := node.children.get(tokens, None)) is None:
+                child = _Node(tokens, block, node)
+                node.children[tokens] = child
+                self._stats.num_blocks += 1
+            elif child.block is not block:
+                # Another request already computed this block
+                unused.append(block)
+
+            child.last_access = now
+            node = child
+
+        if self._stats.num_blocks > self._max_blocks:
+            unused.extend(self.evict(self._stats.num_blocks - self._max_blocks))
+
+        return unused
+
+    def evict(self, num_blocks: int) -> List[Any]:
+        """
+        Evict up to `num_blocks` blocks, least recently used first, skipping those in use.
+        :param num_blocks: The number of blocks to evict
+        :return: The handles of the evicted blocks, to be freed by the caller
+        """
+        candidates = [
+            (node.last_access, id(node), node)
+            for node in self._iter_nodes()
+            if not node.children and node.ref_count == 0
+        ]
+        heapq.heapify(candidates)
+
+        evicted = []
+        while candidates and len(evicted) < num_blocks:
+            _, _, node = heapq.heappop(candidates)
+            parent = node.parent
+
+            del parent.children[node.tokens]
+            evicted.append(node.block)
+
+            # Evicting a leaf might turn its parent into an evictable leaf
+            if (
+                parent is not self._root
+                and not parent.children
+                and parent.ref_count == 0
+            ):
+                heapq.heappush(candidates, (parent.last_access, id(parent), parent))
+
+        self._stats.evictions += len(evicted)
+        self._stats.num_blocks -= len(evicted)
+
+        if evicted:
+            LOGGER.debug(
+                f"Evicted {len(evicted)} KV-cache blocks from the prefix cache"
+            )
+
+        return evicted
+
+    def clear(self) -> List[Any]:
+        """
+        Evict all the blocks not in use.
+        :return: The handles of the evicted blocks, to be freed by the caller
+        """
+        return self.evict(self._stats.num_blocks)
+
+    def _iter_nodes(self):
+        stack = list(self._root.children.values())
+        while stack:
+            node = stack.pop()
+            stack.extend(node.children.values())
+            yield node
@@ -0,0 +1,106 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from dataclasses import dataclass, field
+from enum import Enum
+from itertools import count
+from typing import Any, Dict, Iterable, List, Optional
+
+from .stopping import StopCriteria, StopState
+
+
+_REQUEST_ID_GENERATOR = count()
+
+
+class FinishReason(str, Enum):
+    LENGTH = "length"
+    EOS = "eos"
+    STOP = "stop"
+    ERROR = "error"
+
+
+@dataclass
+class GenerationRequest:
+    """
+    Track the state of a single sequence being generated by a scheduler
+    """
+
+    prompt_ids: List[int]
+    max_new_tokens: int = 128
+    eos_token_id: Optional[int] = None
+    generate_kwargs: Dict[str, Any] = field(default_factory=dict)
+    stop_criteria: Optional[StopCriteria] = None
+    request_id: int = field(default_factory=lambda: next(_REQUEST_ID_GENERATOR))
+    output_ids: List[int] = field(default_factory=list, init=False)
+    finish_reason: Optional[FinishReason] = field(default=None, init=False)
+
+    # Leading prompt tokens whose KV-cache was found in the prefix cache, and the blocks holding them
+    num_cached_tokens: int = field(default=0, init=False)
+    cached_blocks: List[Any] = field(default_factory=list, init=False)
+
+    stop_state: Optional[StopState] = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        if len(self.prompt_ids) < 1:
+            raise ValueError("prompt_ids should contain at least one token")
+
+        if self.max_new_tokens < 1:
+            raise ValueError(
+                f"max_new_tokens should be >= 1 (got: {self.max_new_tokens})"
+            )
+
+        self.prompt_ids = list(self.prompt_ids)
+
+        if self.stop_criteria is not None:
+            self.stop_state = self.stop_criteria.new_state(self.prompt_ids)
+
+    @property
+    def finished(self) -> bool:
+        return self.finish_reason is not None
+
+    @property
+    def num_remaining_tokens(self) -> int:
+        return self.max_new_tokens - len(self.output_ids)
+
+    @property
+    def all_ids(self) -> List[int]:
+        return self.prompt_ids + self.output_ids
+
+    def append(self, tokens: Iterable[int]) -> List[int]:
+        """
+        Append newly generated tokens, stopping on end-of-sequence, stop sequences or once the token budget is
+        exhausted.
+        :param tokens: The tokens generated for this request during the last step
+        :return: The tokens which were actually accepted
+        """
+        accepted = []
+        for token in tokens:
+            if self.finished:
+                break
+
+            accepted.append(token)
+            self.output_ids.append(token)
+
+            if token == self.eos_token_id:
+                self.finish_reason = FinishReason.EOS
+            elif (
+                self.stop_state is not None
+                and self.stop_state.update(token) is not None
+            ):
+                self.finish_reason = FinishReason.STOP
+            elif self.num_remaining_tokens < 1:
+                self.finish_reason = FinishReason.LENGTH
+
+        return accepted
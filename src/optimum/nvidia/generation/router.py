@@ -0,0 +1,346 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import os
+from dataclasses import dataclass, replace
+from logging import getLogger
+from pathlib import Path
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+from weakref import finalize
+
+import torch
+
+from .streaming import TokenStream
+
+
+LOGGER = getLogger(__name__)
+
+
+@dataclass
+class EngineMetrics:
+    num_batches: int = 0
+    num_sequences: int = 0
+    num_prompt_tokens: int = 0
+    num_fallbacks: int = 0
+    busy_time: float = 0.0
+    in_flight: int = 0
+    peak_in_flight: int = 0
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.num_sequences / self.num_batches if self.num_batches else 0.0
+
+
+def _batch_shape(
+    input_ids: Any, attention_mask: Optional[torch.Tensor]
+) -> Tuple[int, int]:
+    """
+    Retrieve the number of sequences and the length of the longest prompt of a batch.
+    """
+    if isinstance(input_ids, torch.Tensor):
+        if input_ids.ndim == 1:
+            return 1, input_ids.numel()
+        if attention_mask is not None:
+            return input_ids.shape[0], int(attention_mask.sum(-1).max())
+        return input_ids.shape[0], input_ids.shape[1]
+
+    if not input_ids:
+        raise ValueError("input_ids should hold at least one prompt")
+
+    # Single prompt given as a flat list of token ids
+    if isinstance(input_ids[0], int):
+        return 1, len(input_ids)
+
+    return len(input_ids), max(len(ids) for ids in input_ids)
+
+
+class EngineRouter:
+    """
+    Dispatch generation calls across several engines of the same model, built with different inference profiles.
+
+    Large-context engines reserve more memory and run slower than small ones, so each batch is routed to the
+    smallest engine (by maximum sequence length, then prompt length and batch size) able to hold its batch size,
+    its longest prompt and its output budget. Engines run one batch at a time: when the best fitting engine is
+    busy, the batch falls back to the next idle engine which fits, or to the least loaded one if none is idle.
+
+    The router exposes the same `generate`, `generate_stream` and `release` methods as `CausalLM`, along with
+    the largest limits among its engines, so it can be used wherever a single engine is expected.
+    """
+
+    __slots__ = ("_engines", "_locks", "_metrics", "_metrics_lock", "_owners")
+
+    @staticmethod
+    def load(
+        engines_folders: Mapping[str, Union[str, os.PathLike]],
+        *,
+        gpus_per_node: int,
+        use_cuda_graph: bool = False,
+        engine_factory: Optional[Callable[..., Any]] = None,
+    ) -> "EngineRouter":
+        """
+        Load the engines of every profile and create a router over them.
+        :param engines_folders: Mapping from the name of the profile to the folder holding its engines
+        :param gpus_per_node: Number of GPUs available on each node
+        :param use_cuda_graph: Enable CUDA Graphs for all the engines
+        :param engine_factory: Class used to load each set of engines, defaults to `CausalLM`
+        """
+        if engine_factory is None:
+            from optimum.nvidia.runtime import CausalLM
+
+            engine_factory = CausalLM
+
+        return EngineRouter(
+            {
+                name: engine_factory(
+                    Path(folder),
+                    gpus_per_node=gpus_per_node,
+                    use_cuda_graph=use_cuda_graph,
+                )
+                for name, folder in engines_folders.items()
+            }
+        )
+
+    @staticmethod
+    def from_manifest(
+        root: Union[str, os.PathLike],
+        *,
+        gpus_per_node: int,
+        use_cuda_graph: bool = False,
+        engine_factory: Optional[Callable[..., Any]] = None,
+    ) -> "EngineRouter":
+        """
+        Load the engines recorded in the manifest written by `LocalEngineBuilder.build_profiles`.
+        :param root: The folder holding the manifest (engines.json)
+        :param gpus_per_node: Number of GPUs available on each node
+        :param use_cuda_graph: Enable CUDA Graphs for all the engines
+        :param engine_factory: Class used to load each set of engines, defaults to `CausalLM`
+        """
+        from optimum.nvidia.builder.manifest import read_engines_manifest
+
+        return EngineRouter.load(
+            {entry.name: entry.path for entry in read_engines_manifest(root)},
+            gpus_per_node=gpus_per_node,
+            use_cuda_graph=use_cuda_graph,
+            engine_factory=engine_factory,
+        )
+
+    def __init__(self, engines: Union[Mapping[str, Any], Sequence[Any]]):
+        if not isinstance(engines, Mapping):
+            engines = {
+                f"engine-{index}": engine for index, engine in enumerate(engines)
+            }
+
+        if not engines:
+            raise ValueError("EngineRouter requires at least one engine")
+
+        # Smallest engines first, they are preferred whenever they fit
+        self._engines = dict(
+            sorted(
+                engines.items(),
+                key=lambda item: (
+                    item[1].max_output_length,
+                    item[1].max_prompt_length,
+                    item[1].max_batch_size,
+                ),
+            )
+        )
+        self._locks = {name: Lock() for name in self._engines}
+        self._metrics = {name: EngineMetrics() for name in self._engines}
+        self._metrics_lock = Lock()
+
+        # Engine owning each output tensor (by id), to give them back to the right buffer pool
+        self._owners: Dict[int, Any] = {}
+
+        LOGGER.debug(f"Routing over engines: {list(self._engines.keys())}")
+
+    @property
+    def engines(self) -> Dict[str, Any]:
+        return dict(self._engines)
+
+    @property
+    def max_batch_size(self) -> int:
+        return max(engine.max_batch_size for engine in self._engines.values())
+
+    @property
+    def max_prompt_length(self) -> int:
+        return max(engine.max_prompt_length for engine in self._engines.values())
+
+    @property
+    def max_output_length(self) -> int:
+        return max(engine.max_output_length for engine in self._engines.values())
+
+    @property
+    def metrics(self) -> Dict[str, EngineMetrics]:
+        """
+        Snapshot of the metrics of every engine.
+        """
+        with self._metrics_lock:
+            return {name: replace(metrics) for name, metrics in self._metrics.items()}
+
+    def candidates(
+        self, batch_size: int, prompt_length: int, max_new_tokens: int = -1
+    ) -> List[str]:
+        """
+        Engines able to generate a batch, smallest first.
+        :param batch_size: The number of sequences in the batch
+        :param prompt_length: The length of the longest prompt in the batch
+        :param max_new_tokens: The output budget, up to the largest engine's maximum sequence length if < 1
+        :return: The name of the engines which fit
+        """
+        if max_new_tokens is None or max_new_tokens < 1:
+            max_new_tokens = max(self.max_output_length - prompt_length, 1)
+
+        return [
+            name
+            for name, engine in self._engines.items()
+            if batch_size <= engine.max_batch_size
+            and prompt_length <= engine.max_prompt_length
+            and prompt_length + max_new_tokens <= engine.max_output_length
+        ]
+
+    def select(
+        self, batch_size: int, prompt_length: int, max_new_tokens: int = -1
+    ) -> str:
+        """
+        Pick the engine to run a batch on: the smallest idle engine which fits, or the least loaded one.
+        :param batch_size: The number of sequences in the batch
+        :param prompt_length: The length of the longest prompt in the batch
+        :param max_new_tokens: The output budget, up to the largest engine's maximum sequence length if < 1
+        :return: The name of the selected engine
+        """
+        candidates = self.candidates(batch_size, prompt_length, max_new_tokens)
+        if not candidates:
+            raise ValueError(
+                f"No engine can generate {batch_size} sequence(s) with prompt length {prompt_length} "
+                f"and max_new_tokens {max_new_tokens}, available profiles (batch, prompt, sequence): "
+                + ", ".join(
+                    f"{name}=({engine.max_batch_size}, {engine.max_prompt_length}, {engine.max_output_length})"
+                    for name, engine in self._engines.items()
+                )
+            )
+
+        with self._metrics_lock:
+            selected = next(
+                (name for name in candidates if self._metrics[name].in_flight == 0),
+                None,
+            )
+
+            if selected is None:
+                selected = min(
+                    candidates,
+                    key=lambda name: (
+                        self._metrics[name].in_flight
+                        / self._engines[name].max_batch_size
+                    ),
+                )
+
+            if selected != candidates[0]:
+                self._metrics[selected].num_fallbacks += 1
+                LOGGER.debug(
+                    f"Engine {candidates[0]} is busy, falling back to {selected}"
+                )
+
+            metrics = self._metrics[selected]
+            metrics.in_flight += batch_size
+            metrics.peak_in_flight = max(metrics.peak_in_flight, metrics.in_flight)
+
+        return selected
+
+    def _complete(self, name: str, batch_size: int, prompt_length: int, start: float):
+        with self._metrics_lock:
+            metrics = self._metrics[name]
+            metrics.in_flight -= batch_size
+            metrics.num_batches += 1
+            metrics.num_sequences += batch_size
+            metrics.num_prompt_tokens += batch_size * prompt_length
+            metrics.busy_time += monotonic() - start
+
+    def generate(
+        self,
+        input_ids: Any,
+        attention_mask: Optional[torch.Tensor] = None,
+        max_new_tokens: int = -1,
+        **kwargs,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Generate a batch on the best fitting engine, see `CausalLM.generate`.
+        """
+        batch_size, prompt_length = _batch_shape(input_ids, attention_mask)
+        name = self.select(batch_size, prompt_length, max_new_tokens)
+        engine = self._engines[name]
+
+        try:
+            with self._locks[name]:
+                start = monotonic()
+                ids, lengths = engine.generate(
+                    input_ids,
+                    attention_mask=attention_mask,
+                    max_new_tokens=max_new_tokens,
+                    **kwargs,
+                )
+        finally:
+            self._complete(name, batch_size, prompt_length, start)
+
+        for tensor in (ids, lengths):
+            self._owners[id(tensor)] = engine
+            finalize(tensor, self._owners.pop, id(tensor), None)
+
+        return ids, lengths
+
+    def generate_stream(
+        self,
+        input_ids: Any,
+        attention_mask: Optional[torch.Tensor] = None,
+        max_new_tokens: int = -1,
+        **kwargs,
+    ) -> TokenStream:
+        """
+        Stream a batch from the best fitting engine, see `CausalLM.generate_stream`.
+        The engine is held until the stream ends.
+        """
+        batch_size, prompt_length = _batch_shape(input_ids, attention_mask)
+        name = self.select(batch_size, prompt_length, max_new_tokens)
+        lock = self._locks[name]
+
+        lock.acquire()
+        start = monotonic()
+
+        def _on_end(_: Optional[BaseException]):
+            self._complete(name, batch_size, prompt_length, start)
+            lock.release()
+
+        try:
+            stream = self._engines[name].generate_stream(
+                input_ids,
+                attention_mask=attention_mask,
+                max_new_tokens=max_new_tokens,
+                **kwargs,
+            )
+        except Exception:
+            _on_end(None)
+            raise
+
+        return stream.on_end(_on_end)
+
+    def release(self, *tensors: torch.Tensor):
+        """
+        Give the output tensors of `generate` back to the engine which produced them.
+        """
+        for tensor in tensors:
+            if (engine := self._owners.pop(id(tensor), None)) is not None:
+                engine.release(tensor)
@@ -0,0 +1,121 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+from logging import getLogger
+from numbers import Number
+from typing import Any, Dict, List, Sequence, Union
+
+import numpy as np
+import torch
+
+
+LOGGER = getLogger(__name__)
+
+SamplingValue = Union[int, float, Sequence[Union[int, float]], np.ndarray, torch.Tensor]
+
+# Sampling parameters which can be set for each sequence of a batch, along with their default value
+DEFAULT_SAMPLING_PARAMETERS: Dict[str, Union[int, float]] = {
+    "temperature": 1.0,
+    "top_k": 50,
+    "top_p": 1.0,
+    "repetition_penalty": 1.0,
+    "length_penalty": 1.0,
+    "min_length": -1,
+    "seed": 0,
+}
+
+_INTEGER_PARAMETERS = {"top_k", "min_length", "seed"}
+
+
+def is_vector(value: Any) -> bool:
+    if isinstance(value, (np.ndarray, torch.Tensor)):
+        return value.ndim > 0
+    return not isinstance(value, (str, bytes)) and isinstance(value, Sequence)
+
+
+def _as_values(name: str, value: SamplingValue) -> List[Any]:
+    # Arrays and tensors are converted to (lists of) Python numbers
+    if isinstance(value, (np.ndarray, torch.Tensor)):
+        if value.ndim > 1:
+            raise ValueError(
+                f"{name} should be a single value or a 1D vector (got: {value.ndim}D {type(value).__name__})"
+            )
+        value = value.tolist()
+
+    values = list(value) if is_vector(value) else [value]
+    return [
+        item.item()
+        if isinstance(item, (np.generic, np.ndarray, torch.Tensor)) and item.ndim == 0
+        else item
+        for item in values
+    ]
+
+
+def _validate(name: str, value: Union[int, float]):
+    if not isinstance(value, Number) or isinstance(value, bool):
+        raise ValueError(f"{name} should be a number (got: {value!r})")
+
+    if name in _INTEGER_PARAMETERS and int(value) != value:
+        raise ValueError(f"{name} should be an integer (got: {value})")
+
+    if name == "temperature" and value < 0:
+        raise ValueError(f"temperature should be >= 0 (got: {value})")
+    elif name == "top_k" and value < 0:
+        raise ValueError(f"top_k should be >= 0 (got: {value})")
+    elif name == "top_p" and not 0 < value <= 1:
+        raise ValueError(f"top_p should be in ]0, 1] (got: {value})")
+    elif name == "repetition_penalty" and value <= 0:
+        raise ValueError(f"repetition_penalty should be > 0 (got: {value})")
+
+
+def pack_sampling_parameters(
+    batch_size: int, **parameters: SamplingValue
+) -> Dict[str, List[Union[int, float]]]:
+    """
+    Validate the sampling parameters of a batch and pack them as the vectors expected by `SamplingConfig`.
+
+    Each parameter is either a scalar, shared by all the sequences, or a vector (sequence, 1D `np.ndarray` or
+    `torch.Tensor`) holding one value per sequence.
+    Vectors holding the same value for all the sequences are collapsed to a single value.
+    :param batch_size: The number of sequences in the batch
+    :param parameters: The sampling parameters, among `DEFAULT_SAMPLING_PARAMETERS`
+    :return: The vector of values of each parameter, holding either 1 or `batch_size` values
+    """
+    packed = {}
+    for name, value in parameters.items():
+        if name not in DEFAULT_SAMPLING_PARAMETERS:
+            raise ValueError(
+                f"Unknown sampling parameter {name}, "
+                f"supported parameters are: {list(DEFAULT_SAMPLING_PARAMETERS.keys())}"
+            )
+
+        values = _as_values(name, value)
+        if len(values) not in (1, batch_size):
+            raise ValueError(
+                f"{name} should hold a single value or one value per sequence ({batch_size}), got {len(values)}"
+            )
+
+        for item in values:
+            _validate(name, item)
+
+        if name in _INTEGER_PARAMETERS:
+            values = [int(item) for item in values]
+        else:
+            values = [float(item) for item in values]
+
+        packed[name] = values[:1] if len(set(values)) == 1 else values
+
+    return packed
@@ -0,0 +1,226 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import heapq
+from collections import deque
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Deque, Dict, Iterator, List, Optional
+
+from .executor import Executor
+from .prefix_cache import PrefixCache, PrefixMatch
+from .request import FinishReason, GenerationRequest
+
+
+LOGGER = getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SlotOccupancy:
+    active: int
+    capacity: int
+
+    @property
+    def free(self) -> int:
+        return self.capacity - self.active
+
+    @property
+    def ratio(self) -> float:
+        return self.active / self.capacity
+
+
+class InflightBatchingScheduler:
+    """
+    Request-level (continuous) batching scheduler.
+
+    Requests are admitted into free slots before every step and retired as soon as they finish, so short requests
+    don't hold a slot while long ones keep decoding. A request for which the executor doesn't generate any token
+    during a step is retired with `FinishReason.ERROR`, as it would otherwise never finish.
+
+    When a `PrefixCache` is provided, the longest cached prefix of every admitted prompt is looked up and exposed
+    to the executor through `request.num_cached_tokens` and `request.cached_blocks`, letting it skip the context
+    phase for these tokens. The KV-cache blocks of retired requests are indexed for the following ones.
+    """
+
+    __slots__ = (
+        "_executor",
+        "_capacity",
+        "_waiting",
+        "_slots",
+        "_free_slots",
+        "_prefix_cache",
+        "_prefix_matches",
+        "_num_steps",
+        "_num_occupied_slot_steps",
+    )
+
+    def __init__(
+        self,
+        executor: Executor,
+        max_batch_size: Optional[int] = None,
+        prefix_cache: Optional[PrefixCache] = None,
+    ):
+        capacity = executor.max_batch_size
+        if max_batch_size is not None:
+            if max_batch_size < 1:
+                raise ValueError(
+                    f"max_batch_size should be >= 1 (got: {max_batch_size})"
+                )
+            capacity = min(capacity, max_batch_size)
+
+        self._executor = executor
+        self._capacity = capacity
+        self._waiting: Deque[GenerationRequest] = deque()
+        self._slots: List[Optional[GenerationRequest]] = [None] * capacity
+        self._free_slots: List[int] = list(range(capacity))
+        self._prefix_cache = prefix_cache
+        self._prefix_matches: Dict[int, PrefixMatch] = {}
+
+        # Statistics
+        self._num_steps = 0
+        self._num_occupied_slot_steps = 0
+
+    @property
+    def executor(self) -> Executor:
+        return self._executor
+
+    @property
+    def prefix_cache(self) -> Optional[PrefixCache]:
+        return self._prefix_cache
+
+    @property
+    def num_waiting(self) -> int:
+        return len(self._waiting)
+
+    @property
+    def num_active(self) -> int:
+        return self._capacity - len(self._free_slots)
+
+    @property
+    def has_pending_requests(self) -> bool:
+        return self.num_waiting > 0 or self.num_active > 0
+
+    @property
+    def occupancy(self) -> SlotOccupancy:
+        return SlotOccupancy(self.num_active, self._capacity)
+
+    @property
+    def num_steps(self) -> int:
+        return self._num_steps
+
+    @property
+    def mean_occupancy(self) -> float:
+        """
+        Average ratio of occupied slots over all the steps executed so far
+        :return: Value between 0 and 1, 0 if no step has been executed yet
+        """
+        if self._num_steps == 0:
+            return 0.0
+        return self._num_occupied_slot_steps / (self._num_steps * self._capacity)
+
+    def submit(self, request: GenerationRequest) -> GenerationRequest:
+        """
+        Queue a new request, it will be admitted as soon as a slot is free.
+        :param request: The request to generate
+        :return: The same request, which will be updated in-place as tokens get generated
+        """
+        if request.finished:
+            raise ValueError(f"Request {request.request_id} is already finished")
+
+        self._executor.validate(request)
+        self._waiting.append(request)
+        return request
+
+    def active_requests(self) -> Dict[int, GenerationRequest]:
+        return {
+            slot: request
+            for slot, request in enumerate(self._slots)
+            if request is not None
+        }
+
+    def step(self) -> List[GenerationRequest]:
+        """
+        Admit waiting requests into free slots, run a single executor step and retire finished requests.
+        :return: The requests which finished during this step
+        """
+        self._admit()
+
+        active = self.active_requests()
+        if not active:
+            return []
+
+        new_tokens = self._executor.step(active)
+
+        self._num_steps += 1
+        self._num_occupied_slot_steps += len(active)
+
+        finished = []
+        for slot, request in active.items():
+            if not request.append(new_tokens.get(slot, [])):
+                LOGGER.error(
+                    f"No token generated for request {request.request_id} in slot {slot}, aborting it"
+                )
+                request.finish_reason = FinishReason.ERROR
+
+            if request.finished:
+                self._retire(slot)
+                finished.append(request)
+
+        return finished
+
+    def run(self) -> Iterator[GenerationRequest]:
+        """
+        Step until all the submitted requests are finished, yielding them in completion order.
+        """
+        while self.has_pending_requests:
+            yield from self.step()
+
+    def _admit(self):
+        while self._waiting and self._free_slots:
+            slot = heapq.heappop(self._free_slots)
+            request = self._waiting.popleft()
+            self._slots[slot] = request
+
+            if self._prefix_cache is not None:
+                match = self._prefix_cache.match(request.prompt_ids)
+                request.num_cached_tokens = match.num_tokens
+                request.cached_blocks = match.blocks
+                self._prefix_matches[slot] = match
+
+            self._executor.on_admit(slot, request)
+            LOGGER.debug(f"Admitted request {request.request_id} in slot {slot}")
+
+    def _retire(self, slot: int):
+        request = self._slots[slot]
+        self._slots[slot] = None
+        heapq.heappush(self._free_slots, slot)
+
+        if self._prefix_cache is not None:
+            # The last token was sampled but never fed to the model, its keys/values aren't computed
+            blocks = self._executor.kv_blocks(slot, request)
+            if request.finish_reason == FinishReason.ERROR:
+                # The keys/values of a failed request can't be trusted
+                unused = list(blocks)
+            else:
+                unused = self._prefix_cache.insert(request.all_ids[:-1], blocks)
+            self._prefix_cache.release(self._prefix_matches.pop(slot))
+
+            if unused:
+                self._executor.free_kv_blocks(unused)
+
+        self._executor.on_retire(slot, request)
+        LOGGER.debug(
+            f"Retired request {request.request_id} from slot {slot} ({request.finish_reason})"
+        )
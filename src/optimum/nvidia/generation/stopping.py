@@ -0,0 +1,279 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+from collections import deque
+from logging import getLogger
+from typing import (
+    Dict,
+    Hashable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from transformers import PreTrainedTokenizer
+
+from .streaming import IncrementalDetokenizer
+
+
+LOGGER = getLogger(__name__)
+
+# Text preceding a stop string when checking it is always encoded to the same tokens
+STOP_STRING_CONTEXTS = ("a", "1", ".", "\n")
+
+
+def encode_stop_string(
+    tokenizer: PreTrainedTokenizer, stop_string: str
+) -> Optional[Tuple[int, ...]]:
+    """
+    Tokens produced for `stop_string` when it follows some text, if they don't depend on the preceding text.
+    :param tokenizer: The tokenizer used to generate
+    :param stop_string: The string to encode
+    :return: The token ids of `stop_string`, None if its tokenization isn't stable
+    """
+    encodings = set()
+    for context in STOP_STRING_CONTEXTS:
+        context_ids = tokenizer.encode(context, add_special_tokens=False)
+        ids = tokenizer.encode(context + stop_string, add_special_tokens=False)
+        if ids[: len(context_ids)] != context_ids or len(ids) == len(context_ids):
+            return None
+
+        # The tokens should also decode to the stop string, whatever the preceding text
+        context_text = tokenizer.decode(context_ids, clean_up_tokenization_spaces=False)
+        text = tokenizer.decode(ids, clean_up_tokenization_spaces=False)
+        if text[len(context_text) :] != stop_string:
+            return None
+
+        encodings.add(tuple(ids[len(context_ids) :]))
+
+    return encodings.pop() if len(encodings) == 1 else None
+
+
+class AhoCorasick:
+    """
+    Automaton matching a set of patterns, made of hashable symbols (i.e. token ids or characters), in a stream of
+    symbols. Each symbol is processed in amortized constant time, whatever the number of patterns.
+    """
+
+    __slots__ = ("_transitions", "_fail", "_matches")
+
+    def __init__(self, patterns: Sequence[Sequence[Hashable]]):
+        self._transitions: List[Dict[Hashable, int]] = [{}]
+        self._matches: List[Optional[int]] = [None]
+
+        for index, pattern in enumerate(patterns):
+            if len(pattern) == 0:
+                raise ValueError("Patterns should not be empty")
+
+            state = 0
+            for symbol in pattern:
+                if (next_state := self._transitions[state].get(symbol, None)) is None:
+                    next_state = len(self._transitions)
+                    self._transitions.append({})
+                    self._matches.append(None)
+                    self._transitions[state][symbol] = next_state
+                state = next_state
+
+            if self._matches[state] is None:
+                self._matches[state] = index
+
+        # Failure links point to the state of the longest proper suffix which is also a prefix of a pattern
+        self._fail = [0] * len(self._transitions)
+        queue = deque(self._transitions[0].values())
+
+        while queue:
+            state = queue.popleft()
+            for symbol, next_state in self._transitions[state].items():
+                fail = self._fail[state]
+                while fail and symbol not in self._transitions[fail]:
+                    fail = self._fail[fail]
+
+                fail = self._transitions[fail].get(symbol, 0)
+                self._fail[next_state] = fail if fail != next_state else 0
+
+                # Patterns ending at the failure state also end at this state
+                if self._matches[next_state] is None:
+                    self._matches[next_state] = self._matches[self._fail[next_state]]
+
+                queue.append(next_state)
+
+    def step(self, state: int, symbol: Hashable) -> int:
+        """
+        Advance the automaton by one symbol.
+        :param state: The current state, 0 being the initial state
+        :param symbol: The next symbol of the stream
+        :return: The new state
+        """
+        while state and symbol not in self._transitions[state]:
+            state = self._fail[state]
+        return self._transitions[state].get(symbol, 0)
+
+    def match(self, state: int) -> Optional[int]:
+        """
+        Index of a pattern ending at the current position of the stream, if any.
+        """
+        return self._matches[state]
+
+
+StopMatch = NamedTuple(
+    "StopMatch",
+    [
+        ("stop", Union[str, Tuple[int, ...]]),
+        ("num_tokens", int),
+    ],
+)
+
+
+class StopCriteria:
+    """
+    Set of token ids sequences and strings which end the generation when produced.
+
+    Token ids sequences are matched directly on the generated tokens. As a string might be produced by many
+    tokenizations, strings are matched on the generated text instead: tokens are detokenized incrementally and the
+    characters fed to an automaton, which keeps track of the tail of the text which could still be part of a
+    stop string. Stop strings always encoded to the same tokens are also exposed as token ids sequences through
+    `stop_words`, letting the engine stop on them by itself.
+
+    `StopCriteria` is immutable and can be shared among many requests, each sequence tracks its own progress
+    through a `StopState`.
+    """
+
+    __slots__ = (
+        "_sequences",
+        "_strings",
+        "_tokenizer",
+        "_stop_words",
+        "_tokens_automaton",
+        "_text_automaton",
+    )
+
+    def __init__(
+        self,
+        stop_sequences: Sequence[Sequence[int]] = (),
+        stop_strings: Sequence[str] = (),
+        tokenizer: Optional[PreTrainedTokenizer] = None,
+    ):
+        if stop_strings and tokenizer is None:
+            raise ValueError("A tokenizer is required to match stop strings")
+
+        self._sequences = [tuple(sequence) for sequence in stop_sequences]
+        self._strings = list(stop_strings)
+        self._tokenizer = tokenizer
+        self._stop_words = list(self._sequences)
+        for stop_string in self._strings:
+            if (ids := encode_stop_string(tokenizer, stop_string)) is not None:
+                self._stop_words.append(ids)
+
+        self._tokens_automaton = AhoCorasick(self._sequences)
+        self._text_automaton = AhoCorasick(self._strings)
+
+    @property
+    def stop_sequences(self) -> List[Tuple[int, ...]]:
+        return self._sequences
+
+    @property
+    def stop_strings(self) -> List[str]:
+        return self._strings
+
+    @property
+    def stop_words(self) -> List[Tuple[int, ...]]:
+        """
+        Token ids sequences the engine can stop on: the stop sequences and the stop strings with a stable
+        tokenization. Other stop strings are only matched on the text, once generated.
+        """
+        return self._stop_words
+
+    def new_state(self, prompt_ids: Optional[Sequence[int]] = None) -> "StopState":
+        """
+        Start tracking a new sequence.
+        :param prompt_ids: The prompt of the sequence, giving context to the detokenizer
+        """
+        return StopState(self, prompt_ids)
+
+    def find(
+        self, token_ids: Sequence[int], prompt_ids: Optional[Sequence[int]] = None
+    ) -> Optional[StopMatch]:
+        """
+        Find the first stop sequence or string in already generated tokens.
+        :param token_ids: The generated tokens
+        :param prompt_ids: The prompt of the sequence, giving context to the detokenizer
+        :return: `StopMatch` if any, the generation should have been stopped after `num_tokens` tokens
+        """
+        state = self.new_state(prompt_ids)
+        for token_id in token_ids:
+            if (match := state.update(token_id)) is not None:
+                return match
+        return None
+
+
+class StopState:
+    """
+    Progress of a single sequence through the automata of a `StopCriteria`.
+    """
+
+    __slots__ = (
+        "_criteria",
+        "_tokens_state",
+        "_text_state",
+        "_detokenizer",
+        "_num_tokens",
+    )
+
+    def __init__(
+        self, criteria: StopCriteria, prompt_ids: Optional[Sequence[int]] = None
+    ):
+        self._criteria = criteria
+        self._tokens_state = 0
+        self._text_state = 0
+        self._num_tokens = 0
+        self._detokenizer = (
+            IncrementalDetokenizer(criteria._tokenizer, prompt_ids)
+            if criteria.stop_strings
+            else None
+        )
+
+    def update(self, token_id: int) -> Optional[StopMatch]:
+        """
+        Add a newly generated token.
+        :param token_id: The token to add
+        :return: `StopMatch` if this token completed a stop sequence or string, None otherwise
+        """
+        criteria = self._criteria
+        self._num_tokens += 1
+
+        if criteria.stop_sequences:
+            self._tokens_state = criteria._tokens_automaton.step(
+                self._tokens_state, token_id
+            )
+            if (
+                index := criteria._tokens_automaton.match(self._tokens_state)
+            ) is not None:
+                return StopMatch(criteria.stop_sequences[index], self._num_tokens)
+
+        if self._detokenizer is not None:
+            for character in self._detokenizer.push(token_id):
+                self._text_state = criteria._text_automaton.step(
+                    self._text_state, character
+                )
+                if (
+                    index := criteria._text_automaton.match(self._text_state)
+                ) is not None:
+                    return StopMatch(criteria.stop_strings[index], self._num_tokens)
+
+        return None
@@ -0,0 +1,231 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import asyncio
+from logging import getLogger
+from queue import Queue
+from threading import Lock
+from typing import Any, Callable, List, Optional, Sequence
+
+from transformers import PreTrainedTokenizer
+
+
+LOGGER = getLogger(__name__)
+
+# Number of prompt tokens used to seed the detokenizer, providing enough context to sentencepiece
+INITIAL_DETOKENIZATION_OFFSET = 5
+
+# Character emitted by the tokenizers when decoding an incomplete multi-bytes sequence
+REPLACEMENT_CHARACTER = "\ufffd"
+
+
+class _EndOfStream:
+    __slots__ = ("error",)
+
+    def __init__(self, error: Optional[BaseException] = None):
+        self.error = error
+
+
+def _run_callback(
+    callback: Callable[[Optional[BaseException]], None],
+    error: Optional[BaseException],
+):
+    try:
+        callback(error)
+    except Exception as e:
+        LOGGER.warning(f"TokenStream end callback failed: {e}")
+
+
+class TokenStream:
+    """
+    Thread-safe bridge between a producer (i.e. the engine running in a background thread) and a consumer.
+
+    The stream can be consumed either synchronously (`for item in stream`) or from asyncio (`async for item in stream`).
+    Transformations registered through `map` are applied, in order, on the consumer side.
+    """
+
+    __slots__ = (
+        "_queue",
+        "_transforms",
+        "_finalizers",
+        "_callbacks",
+        "_lock",
+        "_ended",
+        "_done",
+    )
+
+    def __init__(self):
+        self._queue = Queue()
+        self._transforms: List[Callable[[Any], Any]] = []
+        self._finalizers: List[Callable[[], Any]] = []
+        self._callbacks: List[Callable[[Optional[BaseException]], None]] = []
+        self._lock = Lock()
+        self._ended: Optional[_EndOfStream] = None
+        self._done = False
+
+    def put(self, item: Any):
+        self._queue.put(item)
+
+    def end(self, error: Optional[BaseException] = None):
+        """
+        Signal the producer is done, forwarding the error (if any) to the consumer.
+        :param error: Exception raised by the producer
+        """
+        with self._lock:
+            self._ended = _EndOfStream(error)
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            _run_callback(callback, error)
+
+        self._queue.put(self._ended)
+
+    def on_end(
+        self, callback: Callable[[Optional[BaseException]], None]
+    ) -> "TokenStream":
+        """
+        Register a callback invoked once the producer is done, immediately if it already is.
+        :param callback: Called with the error raised by the producer, if any
+        """
+        with self._lock:
+            if self._ended is None:
+                self._callbacks.append(callback)
+                return self
+
+        _run_callback(callback, self._ended.error)
+        return self
+
+    def map(self, transform: Callable[[Any], Any]) -> "TokenStream":
+        self._transforms.append(transform)
+        return self
+
+    def finalize(self, finalizer: Callable[[], Any]) -> "TokenStream":
+        """
+        Register a callback producing one last item, on the consumer side, once the producer ended without error.
+        The item is emitted as is, transforms registered through `map` are not applied to it.
+        :param finalizer: Called without argument, returns the item to emit
+        """
+        self._finalizers.append(finalizer)
+        return self
+
+    def _process(self, item: Any) -> Any:
+        if isinstance(item, _EndOfStream):
+            if item.error is None and self._finalizers:
+                # The producer is done: requeue the end marker to stop once all the finalizers ran
+                self._queue.put(item)
+                return self._finalizers.pop(0)()
+
+            self._done = True
+            if item.error is not None:
+                raise item.error
+            raise StopIteration
+
+        for transform in self._transforms:
+            item = transform(item)
+        return item
+
+    def __iter__(self) -> "TokenStream":
+        return self
+
+    def __next__(self) -> Any:
+        if self._done:
+            raise StopIteration
+        return self._process(self._queue.get())
+
+    def __aiter__(self) -> "TokenStream":
+        return self
+
+    async def __anext__(self) -> Any:
+        if self._done:
+            raise StopAsyncIteration
+
+        item = await asyncio.to_thread(self._queue.get)
+        try:
+            return self._process(item)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class IncrementalDetokenizer:
+    """
+    Convert a stream of token ids to text without decoding the whole sequence at every step.
+
+    Only a sliding window of tokens is decoded, large enough to let the tokenizer apply merges (i.e. sentencepiece
+    leading spaces) correctly. Text is only emitted once it doesn't end with an incomplete multi-bytes character.
+    """
+
+    __slots__ = (
+        "_tokenizer",
+        "_skip_special_tokens",
+        "_ids",
+        "_prefix_offset",
+        "_read_offset",
+    )
+
+    def __init__(
+        self,
+        tokenizer: PreTrainedTokenizer,
+        prompt_ids: Optional[Sequence[int]] = None,
+        skip_special_tokens: bool = True,
+    ):
+        self._tokenizer = tokenizer
+        self._skip_special_tokens = skip_special_tokens
+
+        # Seed the window with the end of the prompt to decode the first tokens in context
+        self._ids = (
+            list(prompt_ids[-INITIAL_DETOKENIZATION_OFFSET:]) if prompt_ids else []
+        )
+        self._prefix_offset = 0
+        self._read_offset = len(self._ids)
+
+    def _decode(self, ids: List[int]) -> str:
+        return self._tokenizer.decode(
+            ids,
+            skip_special_tokens=self._skip_special_tokens,
+            clean_up_tokenization_spaces=False,
+        )
+
+    def push(self, token_id: int) -> str:
+        """
+        Add a newly generated token.
+        :param token_id: The token to add
+        :return: The text which can be emitted, empty if more tokens are required to form valid text
+        """
+        self._ids.append(token_id)
+
+        prefix_text = self._decode(self._ids[self._prefix_offset : self._read_offset])
+        new_text = self._decode(self._ids[self._prefix_offset :])
+
+        if len(new_text) > len(prefix_text) and not new_text.endswith(
+            REPLACEMENT_CHARACTER
+        ):
+            # Drop tokens which fell out of the window to keep memory bounded
+            del self._ids[: self._prefix_offset]
+            self._prefix_offset = self._read_offset - self._prefix_offset
+            self._read_offset = len(self._ids)
+            return new_text[len(prefix_text) :]
+
+        return ""
+
+    def flush(self) -> str:
+        """
+        Emit the text of the tokens still buffered, even if it ends with an incomplete character.
+        :return: The remaining text
+        """
+        prefix_text = self._decode(self._ids[self._prefix_offset : self._read_offset])
+        new_text = self._decode(self._ids[self._prefix_offset :])
+
+        self._prefix_offset = self._read_offset = len(self._ids)
+        return new_text[len(prefix_text) :]
@@ -14,11 +14,26 @@
 #  limitations under the License.
 
 import json
+import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
 from glob import glob, iglob
 from logging import getLogger
 from pathlib import Path
-from typing import Any, Dict, Optional, Protocol, Tuple, Type, Union, runtime_checkable
+from threading import Lock
+from typing import (
+    Any,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Protocol,
+    Tuple,
+    Type,
+    Union,
+    runtime_checkable,
+)
 from warnings import warn
 
 import numpy as np
@@ -35,11 +50,25 @@ from transformers.utils import SAFE_WEIGHTS_INDEX_NAME
 
 from optimum.nvidia import TensorRTConfig
 from optimum.nvidia.builder import LocalEngineBuilder
+from optimum.nvidia.builder.cache import (
+    EngineCache,
+    compute_engine_cache_key,
+    get_model_revision,
+)
 from optimum.nvidia.builder.config import EngineConfigBuilder
+from optimum.nvidia.builder.manifest import has_engines_manifest
+from optimum.nvidia.builder.timing_cache import TimingCacheStore
+from optimum.nvidia.generation.router import EngineRouter
 from optimum.nvidia.quantization import AutoQuantizationConfig
 from optimum.nvidia.quantization.ammo import AmmoQuantizer
+from optimum.nvidia.quantization.batching import (
+    CalibrationBatching,
+    as_calibration_set,
+)
+from optimum.nvidia.quantization.checkpoint import DEFAULT_CHECKPOINT_INTERVAL
 from optimum.nvidia.utils import get_user_agent, maybe_offload_weights_to_cpu
 from optimum.nvidia.utils.nvml import get_device_count, get_device_memory
+from optimum.nvidia.weights import SafetensorsCheckpoint
 
 
 ATTR_TRTLLM_ENGINE_FOLDER = "__trtllm_engine_folder__"
@@ -50,6 +79,9 @@ HUB_TRTLLM_ENGINE_PATTERNS = ["**/config.json", f"**/{FILE_TRTLLM_ENGINE_PATTERN
 HUB_SAFETENSORS_PATTERNS = ["config.json", "*.safetensors", SAFE_WEIGHTS_INDEX_NAME]
 LOGGER = getLogger()
 
+# Factor applied to the size of the weights of a rank to account for conversion temporaries
+RANK_CONVERSION_MEMORY_OVERHEAD = 1.5
+
 
 def extract_model_type(config: Dict[str, Any]) -> Tuple[Optional[str], bool]:
     if "model_type" in config:
@@ -77,15 +109,36 @@ def find_prebuilt_engines(root: Path) -> Optional[Path]:
     :return: None if no engine was found, `Path` if engines were found in root or root / FOLDER_TRTLLM_ENGINES
     """
 
-    # Look for engine file
-    if len(glob(FILE_TRTLLM_ENGINE_PATTERN, root_dir=root)):
+    # Look for engine file, or the manifest of engines built for multiple inference profiles
+    if len(glob(FILE_TRTLLM_ENGINE_PATTERN, root_dir=root)) or has_engines_manifest(
+        root
+    ):
         return root
-    elif len(glob(FILE_TRTLLM_ENGINE_PATTERN, root_dir=root / FOLDER_TRTLLM_ENGINES)):
+    elif len(
+        glob(FILE_TRTLLM_ENGINE_PATTERN, root_dir=root / FOLDER_TRTLLM_ENGINES)
+    ) or has_engines_manifest(root / FOLDER_TRTLLM_ENGINES):
         return root / FOLDER_TRTLLM_ENGINES
 
     return None
 
 
+def estimate_rank_checkpoint_memory(
+    hf_model: TransformersPretrainedModel, world_size: int
+) -> int:
+    """
+    Estimate the host memory required to hold the converted weights of a single rank.
+    :param hf_model: The Hugging Face model holding the original weights
+    :param world_size: The number of ranks the weights are split across
+    :return: Number of bytes
+    """
+    num_bytes = sum(
+        param.numel() * param.element_size() for param in hf_model.parameters()
+    )
+
+    # Some tensors (i.e. layer norms, embeddings) are replicated on every rank, and conversion creates temporaries
+    return max(1, int(num_bytes / world_size * RANK_CONVERSION_MEMORY_OVERHEAD))
+
+
 @runtime_checkable
 class SupportsTensorrtConversion(Protocol):
     MODEL_CONFIG: Type[TensorRTConfig]
@@ -100,6 +153,16 @@ class SupportsTensorrtConversion(Protocol):
     ) -> Dict[str, np.ndarray]: ...
 
 
+@runtime_checkable
+class SupportsStreamingConversion(Protocol):
+    @staticmethod
+    def convert_checkpoint_from_safetensors(
+        checkpoint: SafetensorsCheckpoint,
+        config: PretrainedConfig,
+        output_folder: Path,
+    ) -> List[Path]: ...
+
+
 class HuggingFaceHubModel(ModelHubMixin, SupportsTensorrtConversion):
     @classmethod
     def convert_and_build(
@@ -113,6 +176,9 @@ class HuggingFaceHubModel(ModelHubMixin, SupportsTensorrtConversion):
         :return:
         """
 
+        # Opt-in: convert non-quantized models straight from the safetensors shards instead of loading the model
+        streaming_conversion = model_kwargs.pop("streaming_conversion", False)
+
         # Path where will be stored the engines
         engines_folder = local_path / FOLDER_TRTLLM_ENGINES
         engines_folder.mkdir(exist_ok=True)
@@ -129,128 +195,312 @@ class HuggingFaceHubModel(ModelHubMixin, SupportsTensorrtConversion):
         LOGGER.debug("Allocating TRTLLM model to build the checkpoint")
         model = cls.TRT_LLM_TARGET_MODEL_CLASS.from_config(model_config)
 
-        # Retrieve the parameters for building the engine
+        # Retrieve the parameters for building the engine(s), one set of engines is built for each inference profile
         if "engine_config" in model_kwargs:
-            engine_config = model_kwargs.pop("engine_config")
+            engine_configs = model_kwargs.pop("engine_config")
         else:
             builder = EngineConfigBuilder.from_dict(config, **model_kwargs)
             builder.with_plugins_config(model_config.get_plugins_config())
-            engine_config = builder.build()
-
-        if engine_config.plugins_config is None:
-            engine_config.plugins_config = model_config.get_plugins_config()
-
-        # Load the weights
-        LOGGER.debug(
-            f"Loading weights from {local_path} into the model ({cls.HF_LIBRARY_TARGET_MODEL_CLASS.__name__})"
-        )
-
-        # Retrieve device total memory
-        fraction_device_map = {
-            device_id: get_device_memory(device_id) * 0.7
-            for device_id in range(get_device_count())
-        }
-
-        cpu_device_map = {"cpu": virtual_memory().available * 0.8}
+            engine_configs = (
+                builder.build_profiles()
+                if builder.num_inference_profiles > 1
+                else builder.build()
+            )
 
-        # Allocate required components for quantization
-        hf_model = cls.HF_LIBRARY_TARGET_MODEL_CLASS.from_pretrained(
-            local_path,
-            device_map="auto",
-            max_memory=fraction_device_map | cpu_device_map,
-            local_files_only=True,
-        ).eval()
+        is_multi_profile = isinstance(engine_configs, Mapping)
+        if not is_multi_profile:
+            engine_configs = {"default": engine_configs}
+
+        for engine_config in engine_configs.values():
+            if engine_config.plugins_config is None:
+                engine_config.plugins_config = model_config.get_plugins_config()
+
+        # All the profiles share the same checkpoints, hence the same sharding
+        engine_config = next(iter(engine_configs.values()))
+
+        # Look for engines previously built from the exact same inputs
+        engine_cache = EngineCache.from_env()
+        if engine_cache is not None:
+            engine_cache_key = compute_engine_cache_key(
+                get_model_revision(local_path),
+                engine_configs if is_multi_profile else engine_config,
+                model_config.to_dict(),
+                cls.get_quantization_cache_key(model_kwargs),
+            )
 
-        hf_model = maybe_offload_weights_to_cpu(hf_model)
+            if engine_cache.lookup(engine_cache_key, engines_folder) is not None:
+                LOGGER.info(f"Reusing cached engines in {engines_folder}")
+                return engines_folder
 
         # Retrieve potential quantization config (If provided) - follow the transformers parameter's name
         has_qconfig = "quantization_config" in model_kwargs
         has_use_fp8 = "use_fp8" in model_kwargs
 
-        if has_qconfig or has_use_fp8:
-            LOGGER.debug("About to quantize Hugging Face model")
+        # Non-quantized models can be converted straight from the safetensors shards, layer by layer
+        use_streaming_conversion = (
+            streaming_conversion
+            and not (has_qconfig or has_use_fp8)
+            and isinstance(cls, SupportsStreamingConversion)
+            and SafetensorsCheckpoint.exists(local_path)
+        )
+
+        if use_streaming_conversion:
+            LOGGER.debug(f"Streaming weights from {local_path} to TRTLLM checkpoints")
+            cls.convert_checkpoint_from_safetensors(
+                SafetensorsCheckpoint(local_path), model_config, engines_folder
+            )
+
+            # Write global config
+            with open(engines_folder / "config.json", "w") as config_f:
+                json.dump(model_config.to_dict(), config_f)
+        else:
+            # Load the weights
+            LOGGER.debug(
+                f"Loading weights from {local_path} into the model ({cls.HF_LIBRARY_TARGET_MODEL_CLASS.__name__})"
+            )
+
+            # Sequential calibration keeps the model on CPU and moves one layer at a time to the GPU
+            use_sequential_calibration = (
+                has_qconfig or has_use_fp8
+            ) and model_kwargs.pop("sequential_calibration", False)
+
+            if use_sequential_calibration:
+                hf_model = cls.HF_LIBRARY_TARGET_MODEL_CLASS.from_pretrained(
+                    local_path,
+                    low_cpu_mem_usage=True,
+                    local_files_only=True,
+                ).eval()
+            else:
+                # Retrieve device total memory
+                fraction_device_map = {
+                    device_id: get_device_memory(device_id) * 0.7
+                    for device_id in range(get_device_count())
+                }
 
-            if has_qconfig:
-                qconfig = model_kwargs.pop("quantization_config")
-            elif has_use_fp8:
-                if (
-                    candidate_tokenizer_path := engines_folder.parent.joinpath(
-                        "tokenizer.json"
+                cpu_device_map = {"cpu": virtual_memory().available * 0.8}
+
+                # Allocate required components for quantization
+                hf_model = cls.HF_LIBRARY_TARGET_MODEL_CLASS.from_pretrained(
+                    local_path,
+                    device_map="auto",
+                    max_memory=fraction_device_map | cpu_device_map,
+                    local_files_only=True,
+                ).eval()
+
+                hf_model = maybe_offload_weights_to_cpu(hf_model)
+
+            if has_qconfig or has_use_fp8:
+                LOGGER.debug("About to quantize Hugging Face model")
+
+                if has_qconfig:
+                    qconfig = model_kwargs.pop("quantization_config")
+                elif has_use_fp8:
+                    if (
+                        candidate_tokenizer_path := engines_folder.parent.joinpath(
+                            "tokenizer.json"
+                        )
+                    ).exists():
+                        tokenizer_path = candidate_tokenizer_path.parent
+                    elif "_model_id" in hf_model_config:
+                        tokenizer_path = hf_model_config["_model_id"]
+                    else:
+                        raise ValueError(
+                            "Unable to determine the tokenizer to use to quantize this model. "
+                            "Please provide a complete QuantizationConfig using "
+                            "from_pretrained(..., quantization_config=AutoQuantizationConfig.from_description())"
+                        )
+
+                    tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+                    qconfig = AutoQuantizationConfig.from_description(
+                        weight="float8",
+                        activation="float8",
+                        tokenizer=tokenizer,
+                        dataset="c4-new",
                     )
-                ).exists():
-                    tokenizer_path = candidate_tokenizer_path.parent
-                elif "_model_id" in hf_model_config:
-                    tokenizer_path = hf_model_config["_model_id"]
-                else:
-                    raise ValueError(
-                        "Unable to determine the tokenizer to use to quantize this model. "
-                        "Please provide a complete QuantizationConfig using "
-                        "from_pretrained(..., quantization_config=AutoQuantizationConfig.from_description())"
+
+                    warn(
+                        "Converting model to support float8 inference.\n"
+                        f"Calibrating model with dataset='c4', split='train', samples={len(qconfig.calibration_dataset)}.\n"
+                        "Note: if text generation doesn't meet your expectations, "
+                        "you can control the quantization process manually with this API: "
+                        "qconfig = AutoQuantizationConfig.from_description(weight='float8', activation='float8', ...) "
+                        "forwarding the configuration to .from_pretrained(..., quantization_config=qconfig)"
                     )
 
-                tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
-                qconfig = AutoQuantizationConfig.from_description(
-                    weight="float8",
-                    activation="float8",
-                    tokenizer=tokenizer,
-                    dataset="c4-new",
+                hf_quantizer = AmmoQuantizer(
+                    quantization_config=qconfig,
+                    artifact_path=engines_folder,
+                    tensor_parallel_degree=engine_config.sharding_profile.tensor_parallelism,
+                    pipeline_parallel_degree=engine_config.sharding_profile.pipeline_parallelism,
+                    export_tensorrt_llm_config=True,
                 )
 
-                warn(
-                    "Converting model to support float8 inference.\n"
-                    f"Calibrating model with dataset='c4', split='train', samples={len(qconfig.calibration_dataset)}.\n"
-                    "Note: if text generation doesn't meet your expectations, "
-                    "you can control the quantization process manually with this API: "
-                    "qconfig = AutoQuantizationConfig.from_description(weight='float8', activation='float8', ...) "
-                    "forwarding the configuration to .from_pretrained(..., quantization_config=qconfig)"
+                hf_quantizer.preprocess_model(
+                    hf_model,
+                    batch_size=model_kwargs.pop("calibration_batch_size", 1),
+                    batching=model_kwargs.pop("calibration_batching", "bucket"),
+                    checkpoint_interval=model_kwargs.pop(
+                        "calibration_checkpoint_interval", DEFAULT_CHECKPOINT_INTERVAL
+                    ),
+                    sequential=use_sequential_calibration,
+                    offload_activations=model_kwargs.pop(
+                        "calibration_offload_activations", False
+                    ),
                 )
+                hf_quantizer.postprocess_model(hf_model)
 
-            hf_quantizer = AmmoQuantizer(
-                quantization_config=qconfig,
-                artifact_path=engines_folder,
-                tensor_parallel_degree=engine_config.sharding_profile.tensor_parallelism,
-                pipeline_parallel_degree=engine_config.sharding_profile.pipeline_parallelism,
-                export_tensorrt_llm_config=True,
-            )
+            else:
+                # Apply the conversion from Hugging Face weights to TRTLLM
+                cls.convert_checkpoint(
+                    model,
+                    hf_model,
+                    model_config,
+                    engines_folder,
+                    num_workers=model_kwargs.pop("conversion_workers", None),
+                    max_memory=model_kwargs.pop("conversion_max_memory", None),
+                )
 
-            hf_quantizer.preprocess_model(hf_model, batch_size=1)
-            hf_quantizer.postprocess_model(hf_model)
+                # Write global config
+                with open(engines_folder / "config.json", "w") as config_f:
+                    json.dump(model_config.to_dict(), config_f)
 
+            # We are freeing memory used by the HF Model to let the engine build goes forward
+            del hf_model
+            torch.cuda.empty_cache()
+
+        # Build
+        engine_builder = LocalEngineBuilder(
+            model_config,
+            engines_folder,
+            timing_cache_store=TimingCacheStore.from_env(),
+        )
+        if is_multi_profile:
+            engine_builder.build_profiles(engine_configs)
         else:
-            # Apply the conversion from Hugging Face weights to TRTLLM
-            for rank in range(model_config.mapping.world_size):
-                LOGGER.debug(
-                    f"Converting weights from Hugging Face checkpoint for rank {rank}"
-                )
-                model_config.set_rank(rank)
-                converted_weights = cls.convert_weights(model, hf_model, model_config)
-                converted_weights = {
-                    name: numpy_to_torch(tensor)
-                    for name, tensor in converted_weights.items()
-                }
+            engine_builder.build(engine_config)
 
-                # Bind the converted weights against the TRTLLM model
-                model.load(converted_weights)
+        if engine_cache is not None:
+            engine_cache.store(
+                engine_cache_key,
+                engines_folder,
+                metadata={"model_id": hf_model_config.get("_model_id", None)},
+            )
 
-                # Write ranked-checkpoints
-                to_safetensors(
-                    converted_weights,
-                    engines_folder / f"rank{model_config.mapping.rank}.safetensors",
-                )
+        return engines_folder
 
-            # Write global config
-            with open(engines_folder / "config.json", "w") as config_f:
-                json.dump(model_config.to_dict(), config_f)
+    @classmethod
+    def convert_checkpoint(
+        cls,
+        model: PretrainedModel,
+        hf_model: TransformersPretrainedModel,
+        model_config: TensorRTConfig,
+        engines_folder: Path,
+        num_workers: Optional[int] = None,
+        max_memory: Optional[int] = None,
+    ):
+        """
+        Convert the Hugging Face weights to TRTLLM ranked-checkpoints (rank{N}.safetensors).
+
+        Ranks are converted concurrently by a pool of threads sharing the (read-only) weights of `hf_model`.
+        The number of concurrent ranks is bounded such that the converted weights fit in `max_memory`.
+        :param model: The TRTLLM model the converted weights are bound to
+        :param hf_model: The Hugging Face model holding the original weights
+        :param model_config: The TRTLLM config describing the model and its sharding
+        :param engines_folder: Folder where to write the ranked-checkpoints
+        :param num_workers: Maximum number of ranks to convert concurrently, defaults to the number of CPUs
+        :param max_memory: Host memory (in bytes) the converted weights may use, defaults to 80% of available memory
+        """
+        world_size = model_config.mapping.world_size
 
-        # We are freeing memory used by the HF Model to let the engine build goes forward
-        del hf_model
-        torch.cuda.empty_cache()
+        if num_workers is None:
+            num_workers = os.cpu_count() or 1
+        elif num_workers < 1:
+            raise ValueError(f"num_workers should be >= 1 (got: {num_workers})")
 
-        # Build
-        engine_builder = LocalEngineBuilder(model_config, engines_folder)
-        engine_builder.build(engine_config)
+        if max_memory is None:
+            max_memory = int(virtual_memory().available * 0.8)
 
-        return engines_folder
+        rank_memory = estimate_rank_checkpoint_memory(hf_model, world_size)
+        num_workers = max(1, min(num_workers, world_size, max_memory // rank_memory))
+
+        LOGGER.debug(
+            f"Converting {world_size} rank(s) with {num_workers} worker(s) "
+            f"(~{rank_memory / 1024**3:.2f}GB per rank)"
+        )
+
+        # Binding weights mutates the TRTLLM model which is shared among all the workers
+        model_lock = Lock()
+
+        def _convert_rank(rank: int):
+            LOGGER.debug(
+                f"Converting weights from Hugging Face checkpoint for rank {rank}"
+            )
+            rank_config = deepcopy(model_config)
+            rank_config.set_rank(rank)
+
+            converted_weights = cls.convert_weights(model, hf_model, rank_config)
+            converted_weights = {
+                name: numpy_to_torch(tensor)
+                for name, tensor in converted_weights.items()
+            }
+
+            # Bind the converted weights against the TRTLLM model
+            with model_lock:
+                model.load(converted_weights)
+
+            # Write ranked-checkpoints
+            to_safetensors(
+                converted_weights,
+                engines_folder / f"rank{rank_config.mapping.rank}.safetensors",
+            )
+
+        if num_workers == 1:
+            for rank in range(world_size):
+                _convert_rank(rank)
+        else:
+            with ThreadPoolExecutor(
+                max_workers=num_workers, thread_name_prefix="optimum-nvidia-convert"
+            ) as executor:
+                # Iterating over the results re-raises the exceptions from the workers
+                for _ in executor.map(_convert_rank, range(world_size)):
+                    pass
+
+    @staticmethod
+    def get_quantization_cache_key(
+        model_kwargs: Dict[str, Any],
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Extract the quantization parameters influencing the content of the engines.
+        :param model_kwargs: Parameters provided to `from_pretrained`
+        :return: None if the model is not quantized, the quantization parameters otherwise
+        """
+        # Batching (padding) and sequential calibration change the statistics gathered by the calibrators
+        calibration = {
+            "batch_size": model_kwargs.get("calibration_batch_size", 1),
+            "batching": CalibrationBatching(
+                model_kwargs.get("calibration_batching", CalibrationBatching.BUCKET)
+            ).value,
+            "sequential": bool(model_kwargs.get("sequential_calibration", False)),
+        }
+
+        if qconfig := model_kwargs.get("quantization_config", None):
+            return {
+                "config": qconfig.to_dict(),
+                "num_calibration_samples": len(qconfig.calibration_dataset)
+                if qconfig.has_calibration_dataset
+                else 0,
+                # Samples drawn from different (i.e. custom) datasets must not share engines
+                "calibration_dataset": as_calibration_set(
+                    qconfig.calibration_dataset
+                ).digest()
+                if qconfig.has_calibration_dataset
+                else None,
+                "calibration": calibration,
+            }
+        elif "use_fp8" in model_kwargs:
+            return {"use_fp8": True, "calibration": calibration}
+
+        return None
 
     @classmethod
     def _from_pretrained(
@@ -324,6 +574,15 @@ class HuggingFaceHubModel(ModelHubMixin, SupportsTensorrtConversion):
             config["_model_id"] = model_id
             engines_folder = cls.convert_and_build(local_path, config, **model_kwargs)
 
+        # Engines built for multiple inference profiles are loaded as a set, behind a router
+        if has_engines_manifest(engines_folder):
+            return EngineRouter.from_manifest(
+                engines_folder,
+                gpus_per_node=model_kwargs.pop("gpus_per_node", 1),
+                use_cuda_graph=model_kwargs.pop("use_cuda_graph", False),
+                engine_factory=cls,
+            )
+
         model = cls(
             engines_folder,
             gpus_per_node=model_kwargs.pop("gpus_per_node", 1),
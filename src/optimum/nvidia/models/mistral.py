@@ -13,7 +13,8 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 from logging import getLogger
-from typing import Dict
+from pathlib import Path
+from typing import Dict, List
 
 import numpy as np
 from tensorrt_llm.models import PretrainedConfig, PretrainedModel
@@ -28,6 +29,7 @@ from optimum.nvidia import TensorRTConfig
 from optimum.nvidia.config import dtype_to_str
 from optimum.nvidia.hub import HuggingFaceHubModel
 from optimum.nvidia.runtime import CausalLM
+from optimum.nvidia.weights import SafetensorsCheckpoint, convert_llama_checkpoint
 
 
 LOGGER = getLogger(__name__)
@@ -109,3 +111,14 @@ class MistralForCausalLM(CausalLM, HuggingFaceHubModel):
             raise NotImplementedError("Quantization is not supported yet.")
 
         return load_from_hf_llama(target, source, config.mapping, config.dtype)
+
+    @staticmethod
+    def convert_checkpoint_from_safetensors(
+        checkpoint: SafetensorsCheckpoint,
+        config: PretrainedConfig,
+        output_folder: Path,
+    ) -> List[Path]:
+        if config.quant_mode.has_any_quant():
+            raise NotImplementedError("Quantization is not supported yet.")
+
+        return convert_llama_checkpoint(checkpoint, config, output_folder)
@@ -23,6 +23,7 @@ from transformers import AutoTokenizer, PreTrainedTokenizer, PreTrainedTokenizer
 from optimum.nvidia import AutoModelForCausalLM
 from optimum.nvidia.pipelines.text_generation import TextGenerationPipeline
 
+from .async_text_generation import AsyncTextGenerationPipeline
 from .base import Pipeline
 
 
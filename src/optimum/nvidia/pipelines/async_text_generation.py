@@ -0,0 +1,269 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import asyncio
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from logging import getLogger
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from optimum.nvidia.generation.sampling import is_vector
+
+from .text_generation import TextGenerationPipeline
+
+
+LOGGER = getLogger(__name__)
+
+DEFAULT_MAX_WAIT_MS: float = 5.0
+
+
+PendingRequest = NamedTuple(
+    "PendingRequest",
+    [
+        ("prompt", str),
+        ("params", Dict[str, Any]),
+        ("future", asyncio.Future),
+    ],
+)
+
+
+def _is_sampling_parameter(name: str, value: Any) -> bool:
+    return name in TextGenerationPipeline.SAMPLING_DEFAULTS and not is_vector(value)
+
+
+def _parameters_key(params: Dict[str, Any]):
+    # Sampling parameters are set for each prompt, they do not prevent requests from sharing an engine call
+    return tuple(
+        sorted(
+            (name, repr(value))
+            for name, value in params.items()
+            if not _is_sampling_parameter(name, value)
+        )
+    )
+
+
+class AsyncTextGenerationPipeline:
+    """
+    Asyncio front-end coalescing concurrent `await pipe(prompt)` calls into batches.
+
+    Requests are queued and gathered for at most `max_wait_ms` (or until `max_batch_size` requests are pending),
+    then submitted to the engine together. Requests within a batch are grouped by their generation parameters,
+    so every request is generated with its own parameters. Sampling parameters (temperature, top_k, ...) are set
+    for each prompt of an engine call and do not split batches. The engine runs on a dedicated thread to keep the
+    event loop responsive.
+    """
+
+    __slots__ = (
+        "_pipeline",
+        "_max_batch_size",
+        "_max_wait",
+        "_executor",
+        "_queue",
+        "_worker",
+        "_closed",
+    )
+
+    def __init__(
+        self,
+        pipeline: TextGenerationPipeline,
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+    ):
+        engine_max_batch_size = pipeline.max_batch_size
+        if max_batch_size is None:
+            max_batch_size = engine_max_batch_size
+        elif max_batch_size < 1:
+            raise ValueError(f"max_batch_size should be >= 1 (got: {max_batch_size})")
+
+        if max_wait_ms < 0:
+            raise ValueError(f"max_wait_ms should be >= 0 (got: {max_wait_ms})")
+
+        self._pipeline = pipeline
+        self._max_batch_size = min(max_batch_size, engine_max_batch_size)
+        self._max_wait = max_wait_ms / 1e3
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="optimum-nvidia-engine"
+        )
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._closed = False
+
+    @property
+    def max_batch_size(self) -> int:
+        return self._max_batch_size
+
+    async def __call__(self, prompt: str, **kwargs) -> Dict[str, Any]:
+        if not isinstance(prompt, str):
+            raise TypeError(
+                f"AsyncTextGenerationPipeline only accepts a single prompt (got: {type(prompt)})"
+            )
+
+        if kwargs.get("stream", False):
+            raise ValueError(
+                "Streaming is not supported by AsyncTextGenerationPipeline, "
+                "please use `async for` on TextGenerationPipeline(..., stream=True)"
+            )
+
+        if self._closed:
+            raise RuntimeError("AsyncTextGenerationPipeline is closed")
+
+        self._ensure_worker()
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(PendingRequest(prompt, kwargs, future))
+        return await future
+
+    async def close(self):
+        """
+        Stop accepting requests and release the engine thread.
+        Requests still pending (queued or being generated) are cancelled.
+        """
+        self._closed = True
+
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        # The worker might have never been scheduled
+        self._abort([], None)
+
+        # Wait for the engine call in flight (if any) without blocking the event loop
+        await asyncio.to_thread(self._executor.shutdown, wait=True)
+
+    def _ensure_worker(self):
+        # Requests queued before the worker stopped are kept to be served by the new one
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    def _abort(self, requests: List[PendingRequest], error: Optional[Exception]):
+        """
+        Resolve the futures of `requests` and of the queued requests, cancelling them if `error` is None.
+        """
+        requests = list(requests)
+        while self._queue is not None and not self._queue.empty():
+            requests.append(self._queue.get_nowait())
+
+        for request in requests:
+            if not request.future.done():
+                if error is None:
+                    request.future.cancel()
+                else:
+                    request.future.set_exception(error)
+
+    async def _collect(self, batch: List[PendingRequest]):
+        loop = asyncio.get_running_loop()
+
+        batch.append(await self._queue.get())
+        deadline = loop.time() + self._max_wait
+
+        while len(batch) < self._max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+    async def _run(self):
+        # Requests taken from the queue but not served yet, they are resolved if the worker stops
+        batch: List[PendingRequest] = []
+
+        try:
+            while True:
+                await self._collect(batch)
+
+                groups = defaultdict(list)
+                for request in batch:
+                    groups[_parameters_key(request.params)].append(request)
+
+                LOGGER.debug(
+                    f"Coalesced {len(batch)} requests into {len(groups)} engine call(s)"
+                )
+
+                for requests in groups.values():
+                    await self._execute(requests)
+
+                batch = []
+        except asyncio.CancelledError:
+            self._abort(batch, None)
+            raise
+        except Exception as e:
+            LOGGER.exception(f"AsyncTextGenerationPipeline worker failed: {e}")
+            self._abort(batch, e)
+            raise
+
+    async def _execute(self, requests: List[PendingRequest]):
+        # Requests might have been cancelled while waiting in the queue
+        requests = [request for request in requests if not request.future.done()]
+        if not requests:
+            return
+
+        prompts = [request.prompt for request in requests]
+        params = {
+            name: value
+            for name, value in requests[0].params.items()
+            if not _is_sampling_parameter(name, value)
+        }
+
+        # Gather the sampling parameters of every request, falling back to the defaults when not provided
+        for name, default in TextGenerationPipeline.SAMPLING_DEFAULTS.items():
+            if any(name in request.params for request in requests):
+                params[name] = [
+                    request.params.get(name, default) for request in requests
+                ]
+
+        try:
+            outputs = await asyncio.get_running_loop().run_in_executor(
+                self._executor, partial(self._pipeline, prompts, **params)
+            )
+        except ValueError as e:
+            # A single invalid request (i.e. a prompt too long) must not fail the others coalesced with it
+            if len(requests) > 1:
+                LOGGER.debug(
+                    f"Invalid engine call ({e}), retrying its {len(requests)} requests one by one"
+                )
+                for request in requests:
+                    await self._execute([request])
+                return
+
+            if not requests[0].future.done():
+                requests[0].future.set_exception(e)
+            return
+        except Exception as e:
+            # Engine failures (i.e. out of memory) would most likely happen again, they are not retried
+            for request in requests:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+
+        for request, output in zip(requests, outputs):
+            if not request.future.done():
+                request.future.set_result(output)
@@ -13,15 +13,21 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
-import warnings
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
-from typing import Dict, List, Union
+from functools import partial
+from itertools import chain
+from typing import Any, Dict, List, Optional, Union
 
 import torch
-from transformers import PreTrainedTokenizer, TensorType
+from transformers import PreTrainedTokenizer
 
 from optimum.nvidia import AutoModelForCausalLM
+from optimum.nvidia.generation.sampling import DEFAULT_SAMPLING_PARAMETERS, is_vector
+from optimum.nvidia.generation.stopping import StopCriteria
+from optimum.nvidia.generation.streaming import IncrementalDetokenizer, TokenStream
 from optimum.nvidia.runtime import CausalLM
+from optimum.nvidia.utils.tokenization import TokenizationCache
 
 from .base import Pipeline
 
@@ -35,15 +41,24 @@ class ReturnType(Enum):
 class TextGenerationPipeline(Pipeline):
     TARGET_FACTORY = AutoModelForCausalLM
 
+    # Sampling parameters accept either a single value or one value per prompt
+    SAMPLING_DEFAULTS = {**DEFAULT_SAMPLING_PARAMETERS, "seed": 2017}
+
     __slots__ = (
         "tokenizer",
         "_runtime",
+        "_tokenization_cache",
         "_bos_token_id",
         "_eos_token_id",
         "_pad_token_id",
     )
 
-    def __init__(self, model: CausalLM, tokenizer: PreTrainedTokenizer):
+    def __init__(
+        self,
+        model: CausalLM,
+        tokenizer: PreTrainedTokenizer,
+        tokenization_cache: Optional[TokenizationCache] = None,
+    ):
         super().__init__()
 
         if tokenizer.eos_token and not tokenizer.pad_token:
@@ -51,18 +66,38 @@ class TextGenerationPipeline(Pipeline):
 
         self.tokenizer = tokenizer
         self._runtime = model
+        self._tokenization_cache = (
+            tokenization_cache
+            if tokenization_cache is not None
+            else TokenizationCache()
+        )
 
         self._bos_token_id = tokenizer.bos_token_id
         self._eos_token_id = tokenizer.eos_token_id
         self._pad_token_id = tokenizer.pad_token_id
 
-    def __call__(self, inputs: Union[str, List[str]], **kwargs):
+    @property
+    def max_batch_size(self) -> int:
+        """
+        Maximum number of prompts the engine generates at once.
+        """
+        return self._runtime.max_batch_size
+
+    @property
+    def tokenization_cache(self) -> TokenizationCache:
+        return self._tokenization_cache
+
+    def __call__(self, inputs: Union[str, List[str]], stream: bool = False, **kwargs):
         (
             preprocess_params,
             forward_params,
             postprocess_params,
         ) = self._sanitize_parameters(**kwargs)
         model_inputs = self.preprocess(inputs, **preprocess_params)
+
+        if stream:
+            return self._stream(model_inputs, **forward_params)
+
         model_outputs = self._forward(model_inputs, **forward_params)
         outputs = self.postprocess(model_outputs, **postprocess_params)
         return outputs
@@ -77,20 +112,17 @@ class TextGenerationPipeline(Pipeline):
         prefix=None,
         handle_long_generation=None,
         stop_sequence=None,
+        stop_token_ids=None,
         add_special_tokens=False,
+        num_decode_workers=None,
         **generate_kwargs,
     ):
         preprocess_params = {"add_special_tokens": add_special_tokens}
         if prefix is not None:
             preprocess_params["prefix"] = prefix
         if prefix:
-            prefix_inputs = self.tokenizer(
-                prefix,
-                padding=False,
-                add_special_tokens=add_special_tokens,
-                return_tensors=TensorType.PYTORCH,
-            )
-            generate_kwargs["prefix_length"] = prefix_inputs["input_ids"].shape[-1]
+            # Prompts will all start with the prefix, only their suffix needs to be tokenized
+            self._tokenization_cache.add_prefix(prefix)
 
         if handle_long_generation is not None:
             if handle_long_generation not in {"hole"}:
@@ -128,77 +160,159 @@ class TextGenerationPipeline(Pipeline):
             postprocess_params["clean_up_tokenization_spaces"] = (
                 clean_up_tokenization_spaces
             )
-
-        if stop_sequence is not None:
-            stop_sequence_ids = self.tokenizer.encode(
-                stop_sequence, add_special_tokens=False
-            )
-            if len(stop_sequence_ids) > 1:
-                warnings.warn(
-                    "Stopping on a multiple token sequence is not yet supported on transformers. The first token of"
-                    " the stop sequence will be used as the stop sequence string in the interim."
-                )
-            generate_kwargs["eos_token_id"] = stop_sequence_ids[0]
+        if num_decode_workers is not None:
+            postprocess_params["num_decode_workers"] = num_decode_workers
+
+        if stop_sequence is not None or stop_token_ids is not None:
+            stop_strings = (
+                [stop_sequence] if isinstance(stop_sequence, str) else stop_sequence
+            ) or []
+            stop_sequences = list(stop_token_ids or [])
+
+            # A single stop token can be handled by the engine itself, as the end-of-sequence token
+            stop_sequence_ids = [
+                self.tokenizer.encode(stop_string, add_special_tokens=False)
+                for stop_string in stop_strings
+            ] + stop_sequences
+            if len(stop_sequence_ids) == 1 and len(stop_sequence_ids[0]) == 1:
+                generate_kwargs["eos_token_id"] = stop_sequence_ids[0][0]
+
+                # The engine doesn't stop on the actual end-of-sequence token anymore, the stop criteria does
+                if self._eos_token_id not in (None, stop_sequence_ids[0][0]):
+                    stop_sequences.append([self._eos_token_id])
+
+            stop_criteria = StopCriteria(stop_sequences, stop_strings, self.tokenizer)
+
+            # The engine stops on the token-level stop sequences, others are only cut from the output
+            generate_kwargs["stop_words"] = stop_criteria.stop_words
+            generate_kwargs["stop_criteria"] = stop_criteria
+            postprocess_params["stop_criteria"] = stop_criteria
 
         return preprocess_params, forward_params, postprocess_params
 
+    def _generation_parameters(self, generate_kwargs: Dict) -> Dict:
+        return {
+            "max_new_tokens": generate_kwargs.pop("max_new_tokens", -1),
+            "num_beams": generate_kwargs.pop("num_beams", 1),
+            **{
+                name: generate_kwargs.pop(name, default)
+                for name, default in self.SAMPLING_DEFAULTS.items()
+            },
+            "bos_token_id": self._bos_token_id,
+            "eos_token_id": generate_kwargs.pop("eos_token_id", self._eos_token_id),
+            "pad_token_id": self._pad_token_id,
+            "stop_words": generate_kwargs.pop("stop_words", None),
+        }
+
+    @staticmethod
+    def _sampling_parameters_for(
+        generation_params: Dict, num_prompts: int, indices: List[int]
+    ) -> Dict:
+        """
+        Select the sampling parameters of the prompts at `indices` when they were provided for each prompt.
+        :param generation_params: The generation parameters of all the prompts
+        :param num_prompts: The total number of prompts
+        :param indices: The index of the prompts in the batch
+        :return: The generation parameters of the batch
+        """
+        params = dict(generation_params)
+        for name in DEFAULT_SAMPLING_PARAMETERS:
+            if is_vector(value := params.get(name)):
+                if len(value) != num_prompts:
+                    raise ValueError(
+                        f"{name} should hold a single value or one value per prompt ({num_prompts}), got {len(value)}"
+                    )
+                params[name] = [value[index] for index in indices]
+
+        return params
+
     def _forward(self, model_inputs, **generate_kwargs):
         input_ids = model_inputs["input_ids"]
         prompt_text = model_inputs.pop("prompt_text")
-        attention_mask = model_inputs.get("attention_mask", None)
-
-        max_new_tokens = generate_kwargs.pop("max_new_tokens", -1)
-        min_length = generate_kwargs.pop("min_length", -1)
-        num_beams = generate_kwargs.pop("num_beams", 1)
-        temperature = generate_kwargs.pop("temperature", 1.0)
-        top_k = generate_kwargs.pop("top_k", 50)
-        top_p = generate_kwargs.pop("top_p", 1.0)
-        repetition_penalty = generate_kwargs.pop("repetition_penalty", 1.0)
-        length_penalty = generate_kwargs.pop("length_penalty", 1.0)
-        seed = generate_kwargs.pop("seed", 2017)
-
-        # prefix_length = generate_kwargs.pop("prefix_length", 0)
-        # If there is a prefix, we may need to adjust the generation length. Do so without permanently modifying
-        # generate_kwargs, as some of the parameterization may come from the initialization of the pipeline.
-        # if prefix_length > 0:
-        #     has_max_new_tokens = "max_new_tokens" in generate_kwargs or (
-        #             "generation_config" in generate_kwargs
-        #             and generate_kwargs["generation_config"].max_new_tokens is not None
-        #     )
-        #     if not has_max_new_tokens:
-        #         generate_kwargs["max_length"] = generate_kwargs.get("max_length") or self._runtime
-        #         generate_kwargs["max_length"] += prefix_length
-        #     has_min_new_tokens = "min_new_tokens" in generate_kwargs or (
-        #             "generation_config" in generate_kwargs
-        #             and generate_kwargs["generation_config"].min_new_tokens is not None
-        #     )
-        #     if not has_min_new_tokens and "min_length" in generate_kwargs:
-        #         generate_kwargs["min_length"] += prefix_length
-
-        # BS x BEAMS x SL
-        generated_sequence, lengths = self._runtime.generate(
-            input_ids=input_ids,
-            attention_mask=attention_mask,
-            max_new_tokens=max_new_tokens,
-            min_length=min_length,
-            num_beams=num_beams,
-            temperature=temperature,
-            top_k=top_k,
-            top_p=top_p,
-            repetition_penalty=repetition_penalty,
-            length_penalty=length_penalty,
-            seed=seed,
-            bos_token_id=self._bos_token_id,
-            eos_token_id=self._eos_token_id,
-            pad_token_id=self._pad_token_id,
-        )
+        generation_params = self._generation_parameters(generate_kwargs)
+
+        # Prompts were bucketed by length, each bucket fitting within the engine's max_batch_size
+        outputs = []
+        for indices in model_inputs["batches"]:
+            # BS x BEAMS x SL
+            generated_sequence, lengths = self._runtime.generate(
+                [input_ids[index] for index in indices],
+                **self._sampling_parameters_for(
+                    generation_params, len(input_ids), indices
+                ),
+            )
 
-        return {
-            "generated_sequence": generated_sequence,
-            "lengths": lengths,
-            "input_ids": input_ids,
-            "prompt_text": prompt_text,
-        }
+            outputs.append(
+                {
+                    "indices": indices,
+                    "generated_sequence": generated_sequence,
+                    "lengths": lengths,
+                    "prompt_lengths": torch.tensor(
+                        [len(input_ids[index]) for index in indices]
+                    ),
+                }
+            )
+
+        return {"outputs": outputs, "prompt_text": prompt_text}
+
+    def _stream(self, model_inputs, **generate_kwargs) -> TokenStream:
+        input_ids = model_inputs["input_ids"]
+        prompt_text = model_inputs.pop("prompt_text")
+        generation_params = self._generation_parameters(generate_kwargs)
+        eos_token_id = generation_params["eos_token_id"]
+        stop_criteria = generate_kwargs.pop("stop_criteria", None)
+
+        if len(input_ids) > self._runtime.max_batch_size:
+            raise ValueError(
+                f"Streaming supports at most {self._runtime.max_batch_size} prompts at once (got: {len(input_ids)})"
+            )
+
+        prompts_ids = [ids.tolist() for ids in input_ids]
+
+        detokenizers = [
+            IncrementalDetokenizer(self.tokenizer, prompt_ids)
+            for prompt_ids in prompts_ids
+        ]
+        stop_states = [
+            stop_criteria.new_state(prompt_ids) if stop_criteria else None
+            for prompt_ids in prompts_ids
+        ]
+        finished = [False] * len(detokenizers)
+
+        def _detokenize(tokens: torch.Tensor):
+            records = []
+            for row, token_id in enumerate(tokens.tolist()):
+                if finished[row]:
+                    records.append({"token_id": None, "text": "", "finished": True})
+                    continue
+
+                if token_id == eos_token_id:
+                    finished[row] = True
+                    text = detokenizers[row].flush()
+                elif stop_states[row] and stop_states[row].update(token_id):
+                    finished[row] = True
+                    text = detokenizers[row].push(token_id) + detokenizers[row].flush()
+                else:
+                    text = detokenizers[row].push(token_id)
+
+                records.append(
+                    {"token_id": token_id, "text": text, "finished": finished[row]}
+                )
+
+            return records[0] if isinstance(prompt_text, str) else records
+
+        def _flush():
+            # Rows which ran out of max_new_tokens never saw a final token: flush them once the engine is done
+            records = []
+            for row, detokenizer in enumerate(detokenizers):
+                text = "" if finished[row] else detokenizer.flush()
+                finished[row] = True
+                records.append({"token_id": None, "text": text, "finished": True})
+
+            return records[0] if isinstance(prompt_text, str) else records
+
+        stream = self._runtime.generate_stream(input_ids, **generation_params)
+        return stream.map(_detokenize).finalize(_flush)
 
     def preprocess(
         self,
@@ -207,49 +321,156 @@ class TextGenerationPipeline(Pipeline):
         handle_long_generation=None,
         add_special_tokens=False,
         **generate_kwargs,
-    ) -> Dict[str, torch.Tensor]:
+    ) -> Dict[str, Any]:
         if isinstance(prompt_text, List):
             text = [prefix + prompt for prompt in prompt_text]
         else:
-            text = prefix + prompt_text
+            text = [prefix + prompt_text]
 
-        inputs = self.tokenizer(
-            text,
-            padding=False,
-            add_special_tokens=add_special_tokens,
-            return_tensors=TensorType.PYTORCH,
+        # Prompts not already cached are encoded in a single call, which fast tokenizers parallelize.
+        # Prompts are kept ragged: no padding is involved
+        prompts_ids = self._tokenization_cache.encode_batch(
+            self.tokenizer, text, add_special_tokens
         )
-        inputs["prompt_text"] = prompt_text
 
-        return inputs
+        max_prompt_length = self._runtime.max_prompt_length
+        for index, ids in enumerate(prompts_ids):
+            if len(ids) > max_prompt_length:
+                if handle_long_generation != "hole":
+                    raise ValueError(
+                        f"Prompt {index} is {len(ids)} tokens long, which exceeds the maximum prompt length "
+                        f"({max_prompt_length}). Use handle_long_generation='hole' to keep the last tokens only."
+                    )
+
+                prompts_ids[index] = ids[-max_prompt_length:]
+
+        # Prompts of similar lengths are batched together to limit padding, the engine can't take more than
+        # max_batch_size prompts at once
+        order = sorted(range(len(prompts_ids)), key=lambda i: len(prompts_ids[i]))
+        max_batch_size = self._runtime.max_batch_size
+        batches = [
+            order[start : start + max_batch_size]
+            for start in range(0, len(order), max_batch_size)
+        ]
+
+        return {
+            "input_ids": [torch.tensor(ids, dtype=torch.int32) for ids in prompts_ids],
+            "batches": batches,
+            "prompt_text": prompt_text,
+        }
 
     def postprocess(
         self,
         model_outputs,
         return_type=ReturnType.FULL_TEXT,
         clean_up_tokenization_spaces=True,
+        num_decode_workers: Optional[int] = None,
+        stop_criteria: Optional[StopCriteria] = None,
     ):
-        generated_sequence = model_outputs["generated_sequence"]
-        # lengths = model_outputs["lengths"]
-        # input_ids = model_outputs["input_ids"]
-        # prompt_text = model_outputs["prompt_text"]
-        generated_sequence = generated_sequence.cpu().numpy().tolist()
-        records = []
-
-        if return_type == ReturnType.TENSORS:
-            return [
-                {"generated_token_ids": generated for generated in generated_sequence}
-            ]
-
-        for sequence in generated_sequence:
-            # Decode text
-            beam_text = self.tokenizer.batch_decode(
-                sequence,
+        outputs = model_outputs["outputs"]
+        records = [None] * sum(len(output["indices"]) for output in outputs)
+
+        # Actual tokens of every beam of every prompt, to be decoded all at once
+        sequences, owners = [], []
+
+        for output in outputs:
+            # BS x BEAMS x SL
+            generated_sequence = output["generated_sequence"].cpu()
+            lengths = output["lengths"].cpu()
+            batch_size, num_beams, _ = generated_sequence.shape
+
+            if return_type == ReturnType.TENSORS:
+                for index, generated in zip(
+                    output["indices"], generated_sequence.numpy().tolist()
+                ):
+                    records[index] = {"generated_token_ids": generated}
+            else:
+                ids = generated_sequence.view(batch_size * num_beams, -1).numpy()
+                prompt_lengths = (
+                    output["prompt_lengths"].cpu().repeat_interleave(num_beams).tolist()
+                )
+                ends = lengths.view(-1).tolist()
+
+                # Cut the sequences which went past a stop sequence
+                if stop_criteria is not None:
+                    for row, (prompt_length, end) in enumerate(
+                        zip(prompt_lengths, ends)
+                    ):
+                        match = stop_criteria.find(
+                            ids[row, prompt_length:end].tolist(),
+                            ids[row, :prompt_length].tolist(),
+                        )
+                        if match is not None:
+                            ends[row] = prompt_length + match.num_tokens
+
+                # Only the actual tokens of each beam are decoded, skipping the prompt if not requested
+                starts = (
+                    prompt_lengths
+                    if return_type == ReturnType.NEW_TEXT
+                    else [0] * len(prompt_lengths)
+                )
+                sequences += [
+                    ids[row, start:end].tolist()
+                    for row, (start, end) in enumerate(zip(starts, ends))
+                ]
+                owners += [(index, num_beams) for index in output["indices"]]
+
+            # Outputs are now on the host, give the device buffers back to the runtime
+            self._runtime.release(output["generated_sequence"], output["lengths"])
+
+        if sequences:
+            texts = self._decode(
+                sequences, clean_up_tokenization_spaces, num_decode_workers
+            )
+
+            # Restore the original order of the prompts
+            start = 0
+            for index, num_beams in owners:
+                records[index] = {"generated_text": texts[start : start + num_beams]}
+                start += num_beams
+
+        return records
+
+    def _decode(
+        self,
+        sequences: List[List[int]],
+        clean_up_tokenization_spaces: bool,
+        num_workers: Optional[int] = None,
+    ) -> List[str]:
+        """
+        Decode all the sequences at once, optionally splitting them in chunks across `num_workers` threads.
+
+        Fast tokenizers decode the whole batch with a single call to their Rust backend, which releases the GIL
+        (chunks are then decoded concurrently). Other tokenizers fall back to `batch_decode`, a Python loop over the
+        sequences holding the GIL, for which threads don't help.
+        """
+        if self.tokenizer.is_fast:
+
+            def decode(chunk: List[List[int]]) -> List[str]:
+                texts = self.tokenizer.backend_tokenizer.decode_batch(
+                    chunk, skip_special_tokens=True
+                )
+                if clean_up_tokenization_spaces:
+                    texts = [
+                        self.tokenizer.clean_up_tokenization(text) for text in texts
+                    ]
+                return texts
+
+        else:
+            decode = partial(
+                self.tokenizer.batch_decode,
                 skip_special_tokens=True,
                 clean_up_tokenization_spaces=clean_up_tokenization_spaces,
             )
 
-            record = {"generated_text": beam_text}
-            records.append(record)
+        if not num_workers or num_workers < 2 or len(sequences) < 2 * num_workers:
+            return decode(sequences)
 
-        return records
+        chunk_size = -(-len(sequences) // num_workers)
+        chunks = [
+            sequences[start : start + chunk_size]
+            for start in range(0, len(sequences), chunk_size)
+        ]
+
+        with ThreadPoolExecutor(num_workers, thread_name_prefix="decode") as workers:
+            return list(chain.from_iterable(workers.map(decode, chunks)))
@@ -1,7 +1,8 @@
 import random
 from abc import ABC, abstractmethod
 from enum import Enum
-from typing import Any, Dict, Optional, Union
+from os import PathLike
+from typing import Any, Dict, Iterable, Optional, Union
 
 import numpy as np
 import torch
@@ -11,7 +12,12 @@ from transformers import PreTrainedTokenizer
 from transformers.utils.quantization_config import QuantizationConfigMixin
 
 from optimum.nvidia.lang import DataType
-from optimum.nvidia.quantization.datasets import get_dataset
+from optimum.nvidia.quantization.calibration import (
+    BUILTIN_CALIBRATION_DATASETS,
+    CalibrationSet,
+    get_calibration_dataset,
+    get_custom_calibration_dataset,
+)
 
 
 dtype = Union[str, torch.dtype]
@@ -145,13 +151,23 @@ class AutoQuantizationConfig:
         weight: dtype,
         activation: dtype,
         tokenizer: Optional[PreTrainedTokenizer] = None,
-        dataset: Optional[Union[str, Dataset]] = None,
+        dataset: Optional[Union[str, PathLike, Dataset, Iterable[str]]] = None,
         split: Optional[str] = "train",
         num_samples: int = 512,
         max_sequence_length: int = 1024,
         seed: int = 2016,
         device: Union[str, torch.device] = "cpu",
+        dataset_column: str = "text",
     ):
+        """
+        Create the quantization config matching the weight and activation data types.
+
+        The calibration dataset is either the name of a built-in dataset (`['wikitext2', 'c4', 'c4-new', 'ptb',
+        'ptb-new']`), a local file (.jsonl, .json, .parquet or plain text with one document per line),
+        a `datasets.Dataset`, an iterable of strings or an already tokenized `CalibrationSet`. Custom datasets are
+        read as a stream and packed into `num_samples` samples of `max_sequence_length` tokens.
+        :param dataset_column: The field holding the text of custom datasets
+        """
         random.seed(seed)
         np.random.seed(seed)
         torch.random.manual_seed(seed)
@@ -162,8 +178,19 @@ class AutoQuantizationConfig:
         if isinstance(activation, str):
             activation = DataType(activation).to_torch()
 
-        if isinstance(dataset, str):
-            dataset = get_dataset(
+        if dataset is None:
+            raise ValueError("A calibration dataset is required")
+
+        if not isinstance(dataset, CalibrationSet) and tokenizer is None:
+            raise ValueError(
+                "A tokenizer is required to tokenize the calibration dataset"
+            )
+
+        if isinstance(dataset, CalibrationSet):
+            dataset = dataset.to(device)
+        elif isinstance(dataset, str) and dataset in BUILTIN_CALIBRATION_DATASETS:
+            # Tokenized samples are cached locally, subsequent calls neither download nor tokenize them again
+            dataset = get_calibration_dataset(
                 dataset,
                 tokenizer,
                 num_samples,
@@ -173,7 +200,14 @@ class AutoQuantizationConfig:
                 device=device,
             )
         else:
-            raise ValueError("Providing custom dataset is not yet supported")
+            dataset = get_custom_calibration_dataset(
+                dataset,
+                tokenizer,
+                num_samples,
+                seqlen=max_sequence_length,
+                column=dataset_column,
+                device=device,
+            )
 
         # float8 case
         if weight in TORCH_FLOAT8:
@@ -13,22 +13,41 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 
+import shutil
 from logging import getLogger
 from os import PathLike
 from pathlib import Path
+from time import perf_counter
 from typing import Union
 
 import torch
 from ammo.torch import export as ate
 from ammo.torch import quantization as atq
 from tensorrt_llm.quantization import QuantMode
-from torch.utils.data import DataLoader
 from tqdm import tqdm
 from transformers import PreTrainedModel
 from transformers.quantizers import HfQuantizer
 from transformers.utils.quantization_config import QuantizationConfigMixin
 
 from optimum.nvidia.quantization.ammo import AmmoQuantizationConfig
+from optimum.nvidia.quantization.batching import (
+    CalibrationBatches,
+    CalibrationBatching,
+    CalibrationStats,
+    as_calibration_set,
+    create_calibration_dataloader,
+)
+from optimum.nvidia.quantization.checkpoint import (
+    CALIBRATION_CHECKPOINT_FOLDER,
+    CALIBRATION_MANIFEST_FILE,
+    DEFAULT_CHECKPOINT_INTERVAL,
+    CalibrationCheckpoint,
+    collect_calibration_statistics,
+    compute_checkpoint_fingerprint,
+    restore_calibration_statistics,
+    write_calibration_manifest,
+)
+from optimum.nvidia.quantization.sequential import sequential_forward
 
 
 LOGGER = getLogger(__name__)
@@ -96,9 +115,40 @@ class AmmoQuantizer(HfQuantizer):
     def is_trainable(self):
         return False
 
+    @property
+    def checkpoint_path(self) -> Path:
+        return self._artifact_path / CALIBRATION_CHECKPOINT_FOLDER
+
     def _process_model_before_weight_loading(
-        self, model, batch_size: int = 1, **kwargs
+        self,
+        model,
+        batch_size: int = 1,
+        batching: Union[str, CalibrationBatching] = CalibrationBatching.BUCKET,
+        num_workers: int = 2,
+        checkpoint_interval: int = DEFAULT_CHECKPOINT_INTERVAL,
+        sequential: bool = False,
+        offload_activations: bool = False,
+        device: Union[str, torch.device] = "cuda:0",
+        **kwargs,
     ):
+        """
+        Calibrate the quantizers of `model` over the calibration dataset.
+
+        The statistics accumulated by the calibrators are checkpointed every `checkpoint_interval` batches under
+        `checkpoint_path`, an interrupted calibration of the same model over the same samples resumes from there.
+
+        With `sequential=True`, the model (i.e. loaded on CPU) is calibrated one decoder layer at a time, each layer
+        being moved to `device` only once, bounding the memory used on `device` to a single layer plus the
+        activations of the calibration samples (see `sequential_forward`). Sequential runs are not checkpointed.
+        :param model: The model to quantize
+        :param batch_size: The number of samples (bucketing) or packed rows (packing) per forward pass
+        :param batching: How to batch calibration samples together, see `CalibrationBatching`
+        :param num_workers: The number of processes assembling and prefetching the batches
+        :param checkpoint_interval: The number of batches between two checkpoints, 0 to disable checkpointing
+        :param sequential: Calibrate the model layer by layer rather than batch by batch
+        :param offload_activations: Keep the activations on CPU between two layers when calibrating sequentially
+        :param device: The device running the forward passes
+        """
         assert isinstance(self.quantization_config, AmmoQuantizationConfig)
         qconfig = self.quantization_config
 
@@ -106,27 +156,122 @@ class AmmoQuantizer(HfQuantizer):
             if not qconfig.has_calibration_dataset:
                 raise ValueError("Float8 quantization requires a calibration dataset")
 
+            pad_token_id = model.config.pad_token_id
+            if pad_token_id is None:
+                pad_token_id = model.config.eos_token_id
+            if isinstance(pad_token_id, list):
+                pad_token_id = pad_token_id[0]
+
+            batches = CalibrationBatches(
+                as_calibration_set(qconfig.calibration_dataset),
+                batch_size,
+                batching,
+                pad_token_id=pad_token_id or 0,
+                dtype=model.dtype,
+            )
+            checkpoint = CalibrationCheckpoint(
+                self.checkpoint_path,
+                compute_checkpoint_fingerprint(
+                    model=model.config.to_json_string(use_diff=True),
+                    quantization=qconfig.to_dict(),
+                    batches=batches.digest(),
+                ),
+                checkpoint_interval,
+            )
+            stats = CalibrationStats()
+            synchronize = torch.device(device).type == "cuda"
+
             with torch.inference_mode():
 
                 def _loop():
-                    data = DataLoader(
-                        qconfig.calibration_dataset,
-                        batch_size=batch_size,
-                        pin_memory=True,
-                        pin_memory_device="cuda:0",
+                    # Quantizers are inserted right before calling the loop, statistics can only be restored now
+                    cursor = 0
+                    if (state := checkpoint.load()) is not None:
+                        restore_calibration_statistics(model, state.statistics)
+                        cursor = state.cursor
+                        LOGGER.info(
+                            f"Resuming calibration from batch {cursor}/{len(batches)} ({checkpoint.root})"
+                        )
+
+                    data = create_calibration_dataloader(
+                        batches,
+                        num_workers=num_workers,
+                        pin_memory=synchronize,
+                        start=cursor,
+                    )
+
+                    with tqdm(
+                        data, unit="batch", initial=cursor, total=len(batches)
+                    ) as progress:
+                        for batch in progress:
+                            start = perf_counter()
+                            inputs = {
+                                name: tensor.to(device, non_blocking=True)
+                                for name, tensor in batch.items()
+                                if name != "num_tokens"
+                            }
+                            model(**inputs)
+                            if synchronize:
+                                torch.cuda.synchronize()
+
+                            stats.update(batch, perf_counter() - start)
+                            progress.set_postfix(
+                                tokens_per_s=f"{stats.tokens_per_second:.0f}"
+                            )
+
+                            cursor += 1
+                            if cursor < len(batches) and checkpoint.should_save(cursor):
+                                checkpoint.save(
+                                    cursor, collect_calibration_statistics(model)
+                                )
+
+                def _sequential_loop():
+                    data = create_calibration_dataloader(
+                        batches, num_workers=num_workers, pin_memory=synchronize
+                    )
+
+                    def _counted():
+                        for batch in tqdm(data, unit="batch", desc="Capturing inputs"):
+                            stats.update(batch, 0.0)
+                            yield batch
+
+                    start = perf_counter()
+                    sequential_forward(
+                        model,
+                        _counted(),
+                        device,
+                        offload_activations=offload_activations,
                     )
+                    if synchronize:
+                        torch.cuda.synchronize()
 
-                    for sample in tqdm(data):
-                        inputs = {
-                            name: tensor.to("cuda:0") for name, tensor in sample.items()
-                        }
-                        model(**inputs)
+                    stats.elapsed = perf_counter() - start
 
-                atq.quantize(model, config=qconfig.as_ammo_config(), forward_loop=_loop)
+                atq.quantize(
+                    model,
+                    config=qconfig.as_ammo_config(),
+                    forward_loop=_sequential_loop if sequential else _loop,
+                )
+
+            LOGGER.info(
+                f"Calibrated over {stats.num_tokens} tokens in {stats.num_batches} batches "
+                f"({stats.tokens_per_second:.0f} tokens/s, {stats.padding_ratio:.1%} padding)"
+            )
 
     def _process_model_after_weight_loading(self, model, **kwargs):
         assert isinstance(self.quantization_config, AmmoQuantizationConfig)
 
+        # Artifacts written by the export are recorded in a manifest once complete
+        def _snapshot():
+            return {
+                path: (path.stat().st_size, path.stat().st_mtime_ns)
+                for path in self._artifact_path.rglob("*")
+                if path.is_file()
+            }
+
+        self._artifact_path.mkdir(parents=True, exist_ok=True)
+        before = _snapshot()
+
         with torch.inference_mode():
             decoder_type = infer_decoder_type(model)
             ate.export_model_config(
@@ -139,3 +284,17 @@ class AmmoQuantizer(HfQuantizer):
                 export_tensorrt_llm_config=self._export_tensorrt_llm_config,
                 export_npz=False,
             )
+
+        # Calibration statistics are now part of the exported artifacts
+        shutil.rmtree(self.checkpoint_path, ignore_errors=True)
+
+        exported = [
+            path
+            for path, stat in _snapshot().items()
+            if before.get(path) != stat and path.name != CALIBRATION_MANIFEST_FILE
+        ]
+        write_calibration_manifest(
+            self._artifact_path,
+            exported,
+            metadata={"quantization": self.quantization_config.to_dict()},
+        )
@@ -0,0 +1,338 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+from dataclasses import dataclass
+from enum import Enum
+from hashlib import sha256
+from logging import getLogger
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import torch
+from packaging.version import Version
+from torch.utils.data import DataLoader, Dataset
+from transformers import __version__ as transformers_version
+
+from optimum.nvidia.quantization.calibration import CalibrationSet
+
+
+LOGGER = getLogger(__name__)
+
+DEFAULT_PREFETCH_FACTOR = 4
+
+# Custom 4D attention masks are used by the models from transformers 4.39, first holding 1 where attending (and 0
+# elsewhere), then from 4.41 as additive masks (0 where attending, the lowest value of the dtype elsewhere)
+SUPPORTS_4D_ATTENTION_MASKS = Version(transformers_version) >= Version("4.39.0")
+INVERTED_4D_ATTENTION_MASKS = Version(transformers_version) >= Version("4.41.0")
+
+
+class CalibrationBatching(str, Enum):
+    # Samples of similar length are batched together, padding each batch to its longest sample
+    BUCKET = "bucket"
+
+    # Samples are concatenated into rows of `max_length` tokens, attending only to the tokens of the same sample
+    PACK = "pack"
+
+
+def bucket_samples(lengths: np.ndarray, batch_size: int) -> List[List[int]]:
+    """
+    Group samples of similar length in batches of `batch_size` samples.
+    :param lengths: The length of every sample
+    :param batch_size: The number of samples per batch
+    :return: The index of the samples of every batch, longest batches first
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size should be >= 1 (got: {batch_size})")
+
+    order = np.argsort(-lengths, kind="stable")
+    return [
+        order[start : start + batch_size].tolist()
+        for start in range(0, len(order), batch_size)
+    ]
+
+
+def pack_samples(lengths: np.ndarray, max_length: int) -> List[List[int]]:
+    """
+    Assign samples to rows of `max_length` tokens (first-fit decreasing), samples longer than `max_length` are
+    truncated and occupy a whole row.
+    :param lengths: The length of every sample
+    :param max_length: The number of tokens of every row
+    :return: The index of the samples of every row
+    """
+    if max_length < 1:
+        raise ValueError(f"max_length should be >= 1 (got: {max_length})")
+
+    rows: List[List[int]] = []
+    free = []
+
+    for index in np.argsort(-lengths, kind="stable").tolist():
+        length = min(int(lengths[index]), max_length)
+        row = next((row for row, space in enumerate(free) if space >= length), None)
+
+        if row is None:
+            rows.append([index])
+            free.append(max_length - length)
+        else:
+            rows[row].append(index)
+            free[row] -= length
+
+    return rows
+
+
+class CalibrationBatches(Dataset):
+    """
+    Batches of a `CalibrationSet`, each item being the inputs of one forward pass of the model.
+
+    With `CalibrationBatching.BUCKET`, samples are sorted by length and left-padded to the longest sample of their
+    batch. With `CalibrationBatching.PACK`, samples are packed into rows of `max_length` tokens along with
+    4D attention masks restricting every token to the previous tokens of its own sample, and positions restarting at 0
+    for every sample. Masks are in the dtype of the model and follow the format of the installed transformers (see
+    `INVERTED_4D_ATTENTION_MASKS`), packing requires transformers >= 4.39. Batches are assembled with a few vectorized
+    copies, allowing to build them in background workers. Every batch also holds the number of (non-padding) tokens
+    it contains, as `num_tokens`.
+    """
+
+    __slots__ = (
+        "_calibration_set",
+        "_batching",
+        "_max_length",
+        "_pad_token_id",
+        "_dtype",
+        "_batches",
+    )
+
+    def __init__(
+        self,
+        calibration_set: CalibrationSet,
+        batch_size: int = 1,
+        batching: Union[str, CalibrationBatching] = CalibrationBatching.BUCKET,
+        max_length: Optional[int] = None,
+        pad_token_id: int = 0,
+        dtype: torch.dtype = torch.float32,
+    ):
+        self._calibration_set = calibration_set
+        self._batching = CalibrationBatching(batching)
+        if (
+            self._batching == CalibrationBatching.PACK
+            and not SUPPORTS_4D_ATTENTION_MASKS
+        ):
+            raise ValueError(
+                f"Packed calibration requires transformers >= 4.39.0 to use 4D attention masks (got: {transformers_version})"
+            )
+
+        self._max_length = max_length or int(calibration_set.lengths.max())
+        self._pad_token_id = pad_token_id
+        self._dtype = dtype
+
+        lengths = calibration_set.lengths
+        if self._batching == CalibrationBatching.PACK:
+            rows = pack_samples(lengths, self._max_length)
+            self._batches = [
+                rows[start : start + batch_size]
+                for start in range(0, len(rows), batch_size)
+            ]
+        else:
+            self._batches = [
+                [[index] for index in batch]
+                for batch in bucket_samples(lengths, batch_size)
+            ]
+
+    @property
+    def batching(self) -> CalibrationBatching:
+        return self._batching
+
+    @property
+    def num_tokens(self) -> int:
+        """
+        Number of tokens of all the samples, excluding the padding
+        """
+        lengths = np.minimum(self._calibration_set.lengths, self._max_length)
+        return int(lengths.sum())
+
+    def __len__(self) -> int:
+        return len(self._batches)
+
+    def digest(self) -> str:
+        """
+        Fingerprint of the batches, covering the tokens of the samples and how they are laid out in the batches.
+        :return: Hexadecimal sha256 digest
+        """
+        digest = sha256(self._calibration_set.digest().encode())
+        digest.update(
+            f"{self._batching.value}:{self._max_length}:{self._pad_token_id}:{self._batches}".encode()
+        )
+        return digest.hexdigest()
+
+    def __getitem__(self, index: int) -> Dict[str, torch.Tensor]:
+        rows = self._batches[index]
+        lengths = self._calibration_set.lengths
+        offsets = self._calibration_set.offsets
+
+        # Length of every sample within its row
+        segments = [
+            [min(int(lengths[sample]), self._max_length) for sample in row]
+            for row in rows
+        ]
+
+        if self._batching == CalibrationBatching.PACK:
+            width = self._max_length
+        else:
+            width = max(sum(row) for row in segments)
+
+        input_ids = np.full((len(rows), width), self._pad_token_id, dtype=np.int64)
+        position_ids = np.zeros((len(rows), width), dtype=np.int64)
+        segment_ids = np.full((len(rows), width), -1, dtype=np.int64)
+
+        for row, (samples, sizes) in enumerate(zip(rows, segments)):
+            # Bucketed batches are left-padded, packed rows are right-padded
+            start = (
+                width - sum(sizes)
+                if self._batching == CalibrationBatching.BUCKET
+                else 0
+            )
+            for segment, (sample, size) in enumerate(zip(samples, sizes)):
+                end = start + size
+                input_ids[row, start:end] = self._calibration_set.ids[
+                    offsets[sample] : offsets[sample] + size
+                ]
+                position_ids[row, start:end] = np.arange(size)
+                segment_ids[row, start:end] = segment
+                start = end
+
+        num_tokens = torch.tensor(sum(map(sum, segments)))
+
+        if self._batching == CalibrationBatching.BUCKET:
+            return {
+                "input_ids": torch.from_numpy(input_ids),
+                "attention_mask": torch.from_numpy((segment_ids >= 0).astype(np.int64)),
+                "num_tokens": num_tokens,
+            }
+
+        # Block-diagonal causal mask, padding tokens only attend to themselves
+        causal = np.tril(np.ones((width, width), dtype=bool))
+        same_segment = segment_ids[:, :, None] == segment_ids[:, None, :]
+        attention_mask = (
+            causal & same_segment & (segment_ids[:, None, :] >= 0)
+        ) | np.eye(width, dtype=bool)
+
+        attention_mask = torch.from_numpy(attention_mask[:, None])
+        if INVERTED_4D_ATTENTION_MASKS:
+            attention_mask = torch.zeros(
+                attention_mask.shape, dtype=self._dtype
+            ).masked_fill_(~attention_mask, torch.finfo(self._dtype).min)
+        else:
+            attention_mask = attention_mask.to(self._dtype)
+
+        return {
+            "input_ids": torch.from_numpy(input_ids),
+            "position_ids": torch.from_numpy(position_ids),
+            "attention_mask": attention_mask,
+            "num_tokens": num_tokens,
+        }
+
+
+@dataclass
+class CalibrationStats:
+    """
+    Throughput of a calibration run, padding tokens excluded.
+    """
+
+    num_batches: int = 0
+    num_tokens: int = 0
+    num_padding_tokens: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.num_tokens / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def padding_ratio(self) -> float:
+        total = self.num_tokens + self.num_padding_tokens
+        return self.num_padding_tokens / total if total else 0.0
+
+    def update(self, batch: Dict[str, torch.Tensor], elapsed: float):
+        num_tokens = int(batch["num_tokens"])
+        self.num_batches += 1
+        self.num_tokens += num_tokens
+        self.num_padding_tokens += batch["input_ids"].numel() - num_tokens
+        self.elapsed += elapsed
+
+
+def as_calibration_set(
+    dataset: Union[CalibrationSet, Sequence[Dict[str, torch.Tensor]]],
+) -> CalibrationSet:
+    """
+    Convert a sequence of `{"input_ids": ...}` dicts (i.e. tokenized samples) to a `CalibrationSet`.
+    """
+    if isinstance(dataset, CalibrationSet):
+        return dataset
+
+    return CalibrationSet.from_sequences(
+        sample["input_ids"].view(-1).tolist() for sample in dataset
+    )
+
+
+def create_calibration_dataloader(
+    dataset: Union[
+        CalibrationBatches, CalibrationSet, Sequence[Dict[str, torch.Tensor]]
+    ],
+    batch_size: int = 1,
+    batching: Union[str, CalibrationBatching] = CalibrationBatching.BUCKET,
+    max_length: Optional[int] = None,
+    pad_token_id: int = 0,
+    dtype: torch.dtype = torch.float32,
+    num_workers: int = 2,
+    prefetch_factor: int = DEFAULT_PREFETCH_FACTOR,
+    pin_memory: bool = False,
+    start: int = 0,
+) -> DataLoader:
+    """
+    Create the loader feeding the calibration forward loop, batches being assembled and prefetched by
+    `num_workers` background processes to keep the model busy.
+    :param dataset: The calibration samples, either a `CalibrationSet` or a sequence of `{"input_ids": ...}` dicts,
+    or already batched samples (`CalibrationBatches`) in which case the batching parameters are ignored
+    :param batch_size: The number of samples (bucketing) or rows (packing) per batch
+    :param batching: How to batch samples together, see `CalibrationBatching`
+    :param max_length: The length of packed rows, defaults to the length of the longest sample
+    :param pad_token_id: The token used to pad the batches
+    :param dtype: The dtype of the model, packed batches' attention masks are created in this dtype
+    :param num_workers: The number of processes assembling the batches, 0 to assemble them on the main process
+    :param prefetch_factor: The number of batches prepared in advance by each worker
+    :param pin_memory: Allocate the batches in page-locked memory, speeding up host to device copies
+    :param start: The index of the first batch to load, skipping the batches processed before resuming a run
+    """
+    if isinstance(dataset, CalibrationBatches):
+        batches = dataset
+    else:
+        batches = CalibrationBatches(
+            as_calibration_set(dataset),
+            batch_size,
+            batching,
+            max_length,
+            pad_token_id,
+            dtype,
+        )
+
+    return DataLoader(
+        batches,
+        batch_size=None,
+        sampler=range(start, len(batches)),
+        num_workers=num_workers,
+        prefetch_factor=prefetch_factor if num_workers > 0 else None,
+        persistent_workers=False,
+        pin_memory=pin_memory,
+    )
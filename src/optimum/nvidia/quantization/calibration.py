@@ -0,0 +1,655 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import json
+import os
+import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from itertools import islice
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+from uuid import uuid4
+
+import numpy as np
+import torch
+from huggingface_hub.constants import HF_HOME
+from torch.utils.data import Dataset
+
+from optimum.nvidia.utils import parse_flag_from_env
+from optimum.nvidia.utils.tokenization import get_tokenizer_fingerprint
+
+
+LOGGER = getLogger(__name__)
+
+ENV_CALIBRATION_CACHE_DIR = "OPTIMUM_NVIDIA_CALIBRATION_CACHE"
+ENV_DISABLE_CALIBRATION_CACHE = "OPTIMUM_NVIDIA_DISABLE_CALIBRATION_CACHE"
+
+DEFAULT_CALIBRATION_CACHE_DIR = Path(HF_HOME) / "optimum-nvidia" / "calibration"
+
+# Bump whenever the layout of the cache or the sampling of the built-in datasets changes
+CALIBRATION_CACHE_VERSION = 1
+
+# Number of documents tokenized at once by the fast tokenizers
+DEFAULT_TOKENIZATION_BATCH_SIZE = 256
+
+BUILTIN_CALIBRATION_DATASETS = {"wikitext2", "c4", "c4-new", "ptb", "ptb-new"}
+
+FILE_IDS = "ids.npy"
+FILE_OFFSETS = "offsets.npy"
+FILE_METADATA = "metadata.json"
+
+
+class CalibrationSet(Dataset):
+    """
+    Tokenized calibration samples stored as a single flat buffer of int32 token ids along with the (int64) offsets
+    of each sample, the sample `i` spanning ids[offsets[i]:offsets[i + 1]].
+
+    Sets saved to disk are memory-mapped when loaded back, so loading is almost free whatever their size.
+    Samples are returned as `{"input_ids", "attention_mask"}` dicts of 1D `torch.LongTensor`.
+    """
+
+    __slots__ = ("_ids", "_offsets", "_device")
+
+    @staticmethod
+    def from_sequences(
+        sequences: Iterable[Sequence[int]],
+        device: Union[str, torch.device] = "cpu",
+    ) -> "CalibrationSet":
+        """
+        Pack tokenized samples.
+        :param sequences: The token ids of every sample
+        :param device: The device on which to put the samples
+        """
+        sequences = [np.asarray(sequence, dtype=np.int32) for sequence in sequences]
+
+        offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+        np.cumsum([len(sequence) for sequence in sequences], out=offsets[1:])
+
+        ids = np.concatenate(sequences) if sequences else np.empty(0, dtype=np.int32)
+        return CalibrationSet(ids, offsets, device)
+
+    @staticmethod
+    def load(
+        path: Union[str, os.PathLike], device: Union[str, torch.device] = "cpu"
+    ) -> "CalibrationSet":
+        """
+        Memory-map a calibration set previously written with `save`.
+        :param path: The folder holding the calibration set
+        :param device: The device on which to put the samples
+        """
+        path = Path(path)
+        return CalibrationSet(
+            np.load(path / FILE_IDS, mmap_mode="r"),
+            np.load(path / FILE_OFFSETS),
+            device,
+        )
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        offsets: np.ndarray,
+        device: Union[str, torch.device] = "cpu",
+    ):
+        if offsets.ndim != 1 or len(offsets) < 1 or offsets[-1] != len(ids):
+            raise ValueError(
+                f"offsets should be 1D and end with the number of ids ({len(ids)})"
+            )
+
+        self._ids = ids
+        self._offsets = offsets
+        self._device = torch.device(device)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: int) -> Dict[str, torch.Tensor]:
+        if not -len(self) <= index < len(self):
+            raise IndexError(f"Sample {index} out of range ({len(self)} samples)")
+
+        index %= len(self)
+        ids = self._ids[self._offsets[index] : self._offsets[index + 1]]
+        input_ids = torch.from_numpy(ids.astype(np.int64)).to(self._device)
+        return {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids
+
+    @property
+    def offsets(self) -> np.ndarray:
+        return self._offsets
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self._offsets)
+
+    @property
+    def num_tokens(self) -> int:
+        return len(self._ids)
+
+    def to(self, device: Union[str, torch.device]) -> "CalibrationSet":
+        return CalibrationSet(self._ids, self._offsets, device)
+
+    def digest(self) -> str:
+        """
+        Fingerprint of the content of the calibration set.
+        :return: Hexadecimal sha256 digest
+        """
+        digest = sha256()
+        digest.update(np.ascontiguousarray(self._ids, dtype=np.int32).tobytes())
+        digest.update(np.ascontiguousarray(self._offsets, dtype=np.int64).tobytes())
+        return digest.hexdigest()
+
+    def save(self, path: Union[str, os.PathLike]):
+        """
+        Write the calibration set in the folder `path`.
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+
+        np.save(path / FILE_IDS, np.ascontiguousarray(self._ids, dtype=np.int32))
+        np.save(path / FILE_OFFSETS, np.asarray(self._offsets, dtype=np.int64))
+
+
+def sample_windows(
+    ids: np.ndarray, seqlen: int, nsamples: int, rng: np.random.Generator
+) -> CalibrationSet:
+    """
+    Draw `nsamples` windows of `seqlen` tokens at random positions of a tokenized corpus.
+    :param ids: The token ids of the whole corpus
+    :param seqlen: The number of tokens of every sample
+    :param nsamples: The number of samples
+    :param rng: The random generator to draw the positions from
+    """
+    if len(ids) <= seqlen:
+        raise ValueError(
+            f"The corpus holds {len(ids)} tokens, not enough to draw samples of {seqlen} tokens"
+        )
+
+    starts = rng.integers(0, len(ids) - seqlen, size=nsamples)
+    windows = np.asarray(ids, dtype=np.int32)[starts[:, None] + np.arange(seqlen)]
+    return CalibrationSet(
+        windows.reshape(-1), np.arange(nsamples + 1, dtype=np.int64) * seqlen
+    )
+
+
+def _select_texts(data: Any, indices: np.ndarray, column: str) -> List[str]:
+    # datasets.Dataset fetches all the rows at once
+    if hasattr(data, "column_names"):
+        return data[indices.tolist()][column]
+    return [data[index] for index in indices.tolist()]
+
+
+def sample_documents(
+    data: Any,
+    tokenizer: Any,
+    seqlen: int,
+    nsamples: int,
+    rng: np.random.Generator,
+    min_length: Optional[int] = None,
+    column: str = "text",
+    batch_size: int = DEFAULT_TOKENIZATION_BATCH_SIZE,
+) -> CalibrationSet:
+    """
+    Draw `nsamples` documents at random and keep (at most) `seqlen` tokens of each.
+
+    Documents are tokenized in batches, in a random order, until enough of them hold at least `min_length` tokens.
+    Documents longer than `seqlen` are cut at a random position when `min_length` is provided, truncated otherwise.
+    :param data: The documents, either a `datasets.Dataset` or a sequence of strings
+    :param tokenizer: The tokenizer of the model
+    :param seqlen: The maximum number of tokens of every sample
+    :param nsamples: The number of samples
+    :param rng: The random generator to draw the documents from
+    :param min_length: The minimum number of tokens of the documents to keep
+    :param column: The column holding the text when `data` is a `datasets.Dataset`
+    :param batch_size: The number of documents tokenized at once
+    """
+    order = rng.permutation(len(data))
+    samples = []
+
+    for start in range(0, len(order), batch_size):
+        texts = _select_texts(data, order[start : start + batch_size], column)
+        encodings = tokenizer(texts, return_attention_mask=False)["input_ids"]
+        lengths = np.fromiter(map(len, encodings), dtype=np.int64, count=len(encodings))
+
+        eligible = np.flatnonzero(lengths >= (min_length or 1))
+        eligible = eligible[: nsamples - len(samples)]
+
+        if min_length:
+            # Random window of seqlen tokens within each document
+            offsets = (
+                rng.random(len(eligible)) * (lengths[eligible] - seqlen + 1).clip(1)
+            ).astype(np.int64)
+        else:
+            offsets = np.zeros(len(eligible), dtype=np.int64)
+
+        samples.extend(
+            encodings[index][offset : offset + seqlen]
+            for index, offset in zip(eligible.tolist(), offsets.tolist())
+        )
+
+        if len(samples) == nsamples:
+            return CalibrationSet.from_sequences(samples)
+
+    raise ValueError(
+        f"Only {len(samples)} documents out of {len(data)} hold at least {min_length or 1} tokens "
+        f"({nsamples} samples requested)"
+    )
+
+
+def build_calibration_set(
+    dataset_name: str,
+    tokenizer: Any,
+    nsamples: int,
+    seqlen: int,
+    seed: int = 0,
+    split: str = "train",
+) -> CalibrationSet:
+    """
+    Sample and tokenize one of the built-in calibration datasets (original datasets from the GPTQ paper).
+    :param dataset_name: One of `['wikitext2', 'c4', 'c4-new', 'ptb', 'ptb-new']`
+    :param tokenizer: The tokenizer of the model
+    :param nsamples: The number of samples
+    :param seqlen: The (maximum) number of tokens of every sample
+    :param seed: Seed of the random generator drawing the samples
+    :param split: Split of the dataset, either "train" or "validation"
+    """
+    from datasets import load_dataset
+
+    if split not in {"train", "validation"}:
+        raise ValueError(
+            f"The split need to be 'train' or 'validation' but found {split}"
+        )
+
+    rng = np.random.default_rng(seed)
+
+    if dataset_name == "wikitext2":
+        data = load_dataset(
+            "wikitext",
+            "wikitext-2-raw-v1",
+            split="train" if split == "train" else "test",
+        )
+        text = "".join(" \n" if s == "" else s for s in data[:1000]["text"])
+        ids = np.asarray(tokenizer(text)["input_ids"], dtype=np.int32)
+        return sample_windows(ids, seqlen, nsamples, rng)
+
+    elif dataset_name in {"ptb", "ptb-new"}:
+        if split == "validation" and dataset_name == "ptb-new":
+            split = "test"
+
+        data = load_dataset("ptb_text_only", "penn_treebank", split=split)
+        ids = np.asarray(
+            tokenizer(" ".join(data["sentence"]))["input_ids"], dtype=np.int32
+        )
+        return sample_windows(ids, seqlen, nsamples, rng)
+
+    elif dataset_name in {"c4", "c4-new"}:
+        data_files = {
+            "train": "en/c4-train.00000-of-01024.json.gz",
+            "validation": "en/c4-validation.00000-of-00008.json.gz",
+        }
+        data = load_dataset(
+            "allenai/c4", split=split, data_files={split: data_files[split]}
+        )
+
+        # c4 keeps a random window of documents long enough, c4-new truncates random documents
+        return sample_documents(
+            data,
+            tokenizer,
+            seqlen,
+            nsamples,
+            rng,
+            min_length=seqlen if dataset_name == "c4" else None,
+        )
+
+    raise ValueError(
+        f"Expected a value in {sorted(BUILTIN_CALIBRATION_DATASETS)} but found {dataset_name}"
+    )
+
+
+def compute_calibration_cache_key(
+    tokenizer: Any,
+    dataset_name: str,
+    split: str,
+    seqlen: int,
+    nsamples: int,
+    seed: int,
+) -> str:
+    """
+    Compute the key identifying a calibration set sampled with the provided parameters.
+    :return: Hexadecimal sha256 digest
+    """
+    payload = json.dumps(
+        {
+            "version": CALIBRATION_CACHE_VERSION,
+            "tokenizer": get_tokenizer_fingerprint(tokenizer),
+            "dataset": dataset_name,
+            "split": split,
+            "seqlen": seqlen,
+            "nsamples": nsamples,
+            "seed": seed,
+        },
+        sort_keys=True,
+    )
+    return sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CalibrationCache:
+    """
+    Local store of tokenized calibration sets, letting subsequent quantizations skip downloading and tokenizing
+    the calibration dataset, and work offline.
+
+    Each set is stored in its own folder, named after `compute_calibration_cache_key`, and memory-mapped on lookup.
+    """
+
+    __slots__ = ("_root",)
+
+    @staticmethod
+    def from_env() -> Optional["CalibrationCache"]:
+        """
+        Create the calibration cache according to the environment variables.
+        :return: `None` if disabled through OPTIMUM_NVIDIA_DISABLE_CALIBRATION_CACHE
+        """
+        if parse_flag_from_env(ENV_DISABLE_CALIBRATION_CACHE, False):
+            return None
+
+        return CalibrationCache(
+            os.environ.get(ENV_CALIBRATION_CACHE_DIR, DEFAULT_CALIBRATION_CACHE_DIR)
+        )
+
+    def __init__(self, root: Union[str, os.PathLike] = DEFAULT_CALIBRATION_CACHE_DIR):
+        self._root = Path(root) / f"v{CALIBRATION_CACHE_VERSION}"
+        self._root.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def root(self) -> Path:
+        return self._root
+
+    def lookup(
+        self, key: str, device: Union[str, torch.device] = "cpu"
+    ) -> Optional[CalibrationSet]:
+        """
+        Retrieve the calibration set stored under `key`.
+        :return: The memory-mapped calibration set if any, None otherwise
+        """
+        path = self._root / key
+        if not (path / FILE_METADATA).exists():
+            return None
+
+        try:
+            return CalibrationSet.load(path, device)
+        except (OSError, ValueError) as e:
+            LOGGER.warning(f"Discarding corrupted calibration set {path}: {e}")
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+
+    def store(
+        self,
+        key: str,
+        calibration_set: CalibrationSet,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> Path:
+        """
+        Store `calibration_set` under `key`.
+        :param key: The key computed by `compute_calibration_cache_key`
+        :param calibration_set: The calibration set to store
+        :param metadata: Additional information stored along with the samples
+        :return: The folder holding the calibration set
+        """
+        path = self._root / key
+
+        # Concurrent readers must never see a partially written set, the metadata file is written last
+        staging_path = self._root / f".{key}.{uuid4().hex}"
+        try:
+            calibration_set.save(staging_path)
+            with open(staging_path / FILE_METADATA, "w") as metadata_f:
+                json.dump(
+                    {
+                        "num_samples": len(calibration_set),
+                        "num_tokens": calibration_set.num_tokens,
+                        **(metadata or {}),
+                    },
+                    metadata_f,
+                )
+
+            os.replace(staging_path, path)
+        except OSError:
+            # Another process stored the same set in the meantime
+            if not (path / FILE_METADATA).exists():
+                raise
+        finally:
+            shutil.rmtree(staging_path, ignore_errors=True)
+
+        LOGGER.debug(f"Stored calibration set {key} at {path}")
+        return path
+
+
+def get_calibration_dataset(
+    dataset_name: str,
+    tokenizer: Any,
+    nsamples: int = 128,
+    seqlen: int = 2048,
+    seed: int = 0,
+    split: str = "train",
+    device: Union[str, torch.device] = "cpu",
+    cache: Optional[CalibrationCache] = None,
+) -> CalibrationSet:
+    """
+    Retrieve a built-in calibration dataset from the calibration cache, sampling and storing it on a miss.
+    :param dataset_name: One of `['wikitext2', 'c4', 'c4-new', 'ptb', 'ptb-new']`
+    :param tokenizer: The tokenizer of the model
+    :param nsamples: The number of samples
+    :param seqlen: The (maximum) number of tokens of every sample
+    :param seed: Seed of the random generator drawing the samples
+    :param split: Split of the dataset, either "train" or "validation"
+    :param device: The device on which to put the samples
+    :param cache: The calibration cache, defaults to `CalibrationCache.from_env()`
+    """
+    if cache is None:
+        cache = CalibrationCache.from_env()
+
+    key = None
+    if cache is not None:
+        key = compute_calibration_cache_key(
+            tokenizer, dataset_name, split, seqlen, nsamples, seed
+        )
+        if (calibration_set := cache.lookup(key, device)) is not None:
+            LOGGER.info(f"Reusing cached calibration set {dataset_name} ({key})")
+            return calibration_set
+
+    calibration_set = build_calibration_set(
+        dataset_name, tokenizer, nsamples, seqlen, seed, split
+    )
+
+    if cache is not None:
+        cache.store(
+            key,
+            calibration_set,
+            metadata={
+                "dataset": dataset_name,
+                "split": split,
+                "seqlen": seqlen,
+                "seed": seed,
+            },
+        )
+
+    return calibration_set.to(device)
+
+
+def _starts_with_array(source_f) -> bool:
+    while (char := source_f.read(1)).isspace():
+        pass
+
+    source_f.seek(0)
+    return char == "["
+
+
+def iter_texts(source: Any, column: str = "text") -> Iterator[str]:
+    """
+    Stream the documents of a custom calibration dataset, without loading it in memory.
+    :param source: Either a local file (.jsonl, .json holding JSON lines or an array, .parquet or plain text with
+        one document per line),
+        a `datasets.Dataset`/`datasets.IterableDataset` or an iterable of strings
+    :param column: The field holding the text for JSON lines, parquet files and datasets
+    """
+    if isinstance(source, (str, os.PathLike)):
+        path = Path(source)
+        if not path.is_file():
+            raise ValueError(f"Calibration dataset {path} is not a file")
+
+        if path.suffix in {".jsonl", ".json"}:
+            with open(path, "r") as source_f:
+                # .json files may hold a single top-level array, which has to be loaded at once
+                if path.suffix == ".json" and _starts_with_array(source_f):
+                    records = json.load(source_f)
+                else:
+                    records = (json.loads(line) for line in source_f if line.strip())
+
+                for record in records:
+                    yield record if isinstance(record, str) else record[column]
+
+        elif path.suffix == ".parquet":
+            from pyarrow.parquet import ParquetFile
+
+            for batch in ParquetFile(path).iter_batches(columns=[column]):
+                yield from batch.column(0).to_pylist()
+
+        else:
+            with open(path, "r") as source_f:
+                for line in source_f:
+                    if line := line.rstrip("\n"):
+                        yield line
+
+    elif hasattr(source, "column_names"):
+        for batch in source.iter(batch_size=DEFAULT_TOKENIZATION_BATCH_SIZE):
+            yield from batch[column]
+
+    else:
+        for text in source:
+            if not isinstance(text, str):
+                raise ValueError(
+                    f"Custom calibration datasets should hold strings (got: {type(text)})"
+                )
+            yield text
+
+
+def pack_texts(
+    texts: Iterable[str],
+    tokenizer: Any,
+    seqlen: int,
+    nsamples: int,
+    batch_size: int = DEFAULT_TOKENIZATION_BATCH_SIZE,
+    num_workers: Optional[int] = None,
+) -> CalibrationSet:
+    """
+    Tokenize a stream of documents and pack them into `nsamples` samples of exactly `seqlen` tokens.
+
+    Documents are tokenized in batches by a pool of threads (fast tokenizers release the GIL), with a bounded
+    number of batches in flight, and concatenated, separated by the end-of-sequence token, into a preallocated
+    buffer. The stream is consumed only until the buffer is full.
+    :param texts: The documents
+    :param tokenizer: The tokenizer of the model
+    :param seqlen: The number of tokens of every sample
+    :param nsamples: The number of samples
+    :param batch_size: The number of documents tokenized at once
+    :param num_workers: The number of tokenization threads, defaults to the number of CPUs (up to 8)
+    """
+    if num_workers is None:
+        num_workers = min(os.cpu_count() or 1, 8)
+    elif num_workers < 1:
+        raise ValueError(f"num_workers should be >= 1 (got: {num_workers})")
+
+    buffer = np.empty(nsamples * seqlen, dtype=np.int32)
+    separator = getattr(tokenizer, "eos_token_id", None)
+    num_tokens = 0
+
+    def _tokenize(batch: List[str]) -> List[List[int]]:
+        return tokenizer(batch, add_special_tokens=False, return_attention_mask=False)[
+            "input_ids"
+        ]
+
+    texts = iter(texts)
+    with ThreadPoolExecutor(
+        num_workers, thread_name_prefix="optimum-nvidia-calibration"
+    ) as executor:
+        pending = deque()
+
+        def _submit() -> bool:
+            if batch := list(islice(texts, batch_size)):
+                pending.append(executor.submit(_tokenize, batch))
+            return bool(batch)
+
+        while len(pending) < 2 * num_workers and _submit():
+            pass
+
+        while pending and num_tokens < len(buffer):
+            for ids in pending.popleft().result():
+                if separator is not None:
+                    ids.append(separator)
+
+                length = min(len(ids), len(buffer) - num_tokens)
+                buffer[num_tokens : num_tokens + length] = ids[:length]
+                num_tokens += length
+
+                if num_tokens == len(buffer):
+                    break
+            else:
+                _submit()
+
+        for future in pending:
+            future.cancel()
+
+    if (num_packed := num_tokens // seqlen) == 0:
+        raise ValueError(
+            f"The calibration dataset holds {num_tokens} tokens, not enough for a single sample of {seqlen} tokens"
+        )
+
+    if num_packed < nsamples:
+        LOGGER.warning(
+            f"The calibration dataset only holds enough tokens for {num_packed} samples ({nsamples} requested)"
+        )
+
+    return CalibrationSet(
+        buffer[: num_packed * seqlen],
+        np.arange(num_packed + 1, dtype=np.int64) * seqlen,
+    )
+
+
+def get_custom_calibration_dataset(
+    source: Any,
+    tokenizer: Any,
+    nsamples: int = 128,
+    seqlen: int = 2048,
+    column: str = "text",
+    device: Union[str, torch.device] = "cpu",
+    num_workers: Optional[int] = None,
+) -> CalibrationSet:
+    """
+    Create a calibration set from custom data (i.e. production traffic logs), read as a stream.
+    :param source: See `iter_texts`
+    :param tokenizer: The tokenizer of the model
+    :param nsamples: The number of samples
+    :param seqlen: The number of tokens of every sample
+    :param column: The field holding the text for JSON lines, parquet files and datasets
+    :param device: The device on which to put the samples
+    :param num_workers: The number of tokenization threads
+    """
+    return pack_texts(
+        iter_texts(source, column), tokenizer, seqlen, nsamples, num_workers=num_workers
+    ).to(device)
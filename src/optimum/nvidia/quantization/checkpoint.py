@@ -0,0 +1,330 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import json
+import os
+import shutil
+from hashlib import sha256
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Union
+from uuid import uuid4
+
+import torch
+from safetensors.torch import load_file, save_file
+
+
+LOGGER = getLogger(__name__)
+
+# Bump whenever the layout of the checkpoints or of the manifest changes
+CALIBRATION_CHECKPOINT_VERSION = 1
+
+# Number of calibration batches between two checkpoints
+DEFAULT_CHECKPOINT_INTERVAL = 32
+
+CALIBRATION_CHECKPOINT_FOLDER = ".calibration-checkpoint"
+CALIBRATION_MANIFEST_FILE = "calibration-manifest.json"
+
+FILE_CURSOR = "cursor.json"
+
+# Attributes of the calibrators holding the statistics accumulated over the batches seen so far
+_CALIBRATOR_STATE_PREFIX = "_calib_"
+
+_HASH_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+CalibrationState = NamedTuple(
+    "CalibrationState",
+    [
+        ("cursor", int),
+        ("statistics", Dict[str, torch.Tensor]),
+    ],
+)
+
+
+def compute_file_digest(path: Union[str, os.PathLike]) -> str:
+    """
+    Compute the sha256 digest of the file at `path`, reading it by chunks.
+    :return: Hexadecimal sha256 digest
+    """
+    digest = sha256()
+    with open(path, "rb") as file_f:
+        while chunk := file_f.read(_HASH_CHUNK_SIZE):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def compute_checkpoint_fingerprint(**parts: Any) -> str:
+    """
+    Compute the fingerprint of a calibration run, checkpoints are only resumed by runs with the same fingerprint.
+    :param parts: Everything influencing the statistics (model, quantization config, samples, batching...)
+    :return: Hexadecimal sha256 digest
+    """
+    payload = json.dumps(
+        {"version": CALIBRATION_CHECKPOINT_VERSION, **parts}, sort_keys=True
+    )
+    return sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _iter_calibrators(model: torch.nn.Module):
+    for parent_name, parent in model.named_modules():
+        # Quantizers don't own parameters, the statistics live on the device of the layer they belong to
+        parameter = next(parent.parameters(recurse=False), None)
+        device = parameter.device if parameter is not None else torch.device("cpu")
+
+        for name, module in parent.named_children():
+            if (calibrator := getattr(module, "_calibrator", None)) is not None:
+                prefix = f"{parent_name}.{name}" if parent_name else name
+                yield prefix, calibrator, device
+
+
+def collect_calibration_statistics(model: torch.nn.Module) -> Dict[str, torch.Tensor]:
+    """
+    Gather the statistics (amax, histograms...) accumulated so far by the calibrators of the quantizers of `model`.
+    :param model: The model being calibrated
+    :return: CPU copy of the statistics, indexed by `<quantizer>.<attribute>`
+    """
+    statistics = {}
+    for prefix, calibrator, _ in _iter_calibrators(model):
+        for attribute, value in vars(calibrator).items():
+            if attribute.startswith(_CALIBRATOR_STATE_PREFIX) and isinstance(
+                value, torch.Tensor
+            ):
+                statistics[f"{prefix}.{attribute}"] = (
+                    value.detach().to("cpu", copy=True).contiguous()
+                )
+
+    return statistics
+
+
+def restore_calibration_statistics(
+    model: torch.nn.Module, statistics: Dict[str, torch.Tensor]
+) -> int:
+    """
+    Load previously collected statistics back into the calibrators of the quantizers of `model`.
+    :param model: The model being calibrated, quantizers must already be inserted
+    :param statistics: The statistics returned by `collect_calibration_statistics`
+    :return: The number of restored statistics
+    """
+    remaining = dict(statistics)
+    for prefix, calibrator, device in _iter_calibrators(model):
+        for key in [key for key in remaining if key.rpartition(".")[0] == prefix]:
+            setattr(calibrator, key.rpartition(".")[2], remaining.pop(key).to(device))
+
+    if remaining:
+        raise ValueError(
+            f"Unable to restore {len(remaining)} calibration statistics, unknown quantizers: "
+            f"{sorted(remaining)[:5]}"
+        )
+
+    return len(statistics)
+
+
+class CalibrationCheckpoint:
+    """
+    Periodically persisted state of a calibration run, allowing a run interrupted (crash, preemption) to resume
+    from the last checkpoint rather than from the first sample.
+
+    Every checkpoint holds the statistics accumulated by the calibrators along with the number of batches already
+    processed (the cursor). Statistics are written to a new file first, then the cursor file referencing it (along
+    with its checksum) is atomically replaced, so an interrupted write never leaves a corrupted checkpoint behind.
+    """
+
+    __slots__ = ("_root", "_fingerprint", "_interval")
+
+    def __init__(
+        self,
+        root: Union[str, os.PathLike],
+        fingerprint: str,
+        interval: int = DEFAULT_CHECKPOINT_INTERVAL,
+    ):
+        if interval < 0:
+            raise ValueError(f"interval should be >= 0 (got: {interval})")
+
+        self._root = Path(root)
+        self._fingerprint = fingerprint
+        self._interval = interval
+
+    @property
+    def root(self) -> Path:
+        return self._root
+
+    @property
+    def interval(self) -> int:
+        return self._interval
+
+    def should_save(self, cursor: int) -> bool:
+        """
+        Check whether a checkpoint is due after `cursor` batches, never when checkpointing is disabled (interval 0).
+        """
+        return self._interval > 0 and cursor > 0 and cursor % self._interval == 0
+
+    def load(self) -> Optional[CalibrationState]:
+        """
+        Retrieve the last checkpoint of this run.
+        :return: None if there is no checkpoint, or if it doesn't match the current run or is corrupted
+        """
+        if not (cursor_path := self._root / FILE_CURSOR).exists():
+            return None
+
+        try:
+            with open(cursor_path, "r") as cursor_f:
+                cursor = json.load(cursor_f)
+
+            if cursor.get("fingerprint") != self._fingerprint:
+                LOGGER.warning(
+                    f"Discarding calibration checkpoint {self._root} created by a different run"
+                )
+                self.clear()
+                return None
+
+            state_path = self._root / cursor["state"]
+            if compute_file_digest(state_path) != cursor["sha256"]:
+                raise ValueError(f"Checksum mismatch for {state_path}")
+
+            return CalibrationState(int(cursor["cursor"]), load_file(state_path))
+        except (OSError, KeyError, ValueError) as e:
+            LOGGER.warning(
+                f"Discarding corrupted calibration checkpoint {self._root}: {e}"
+            )
+            self.clear()
+            return None
+
+    def save(self, cursor: int, statistics: Dict[str, torch.Tensor]):
+        """
+        Persist the statistics accumulated over the first `cursor` batches.
+        :param cursor: The number of batches processed so far
+        :param statistics: The statistics returned by `collect_calibration_statistics`
+        """
+        self._root.mkdir(parents=True, exist_ok=True)
+
+        state_name = f"state-{cursor}.safetensors"
+        save_file(statistics, self._root / state_name)
+
+        staging_path = self._root / f".{FILE_CURSOR}.{uuid4().hex}"
+        with open(staging_path, "w") as cursor_f:
+            json.dump(
+                {
+                    "version": CALIBRATION_CHECKPOINT_VERSION,
+                    "fingerprint": self._fingerprint,
+                    "cursor": cursor,
+                    "state": state_name,
+                    "sha256": compute_file_digest(self._root / state_name),
+                },
+                cursor_f,
+            )
+        os.replace(staging_path, self._root / FILE_CURSOR)
+
+        # Previous states are not referenced anymore
+        for path in self._root.glob("state-*.safetensors"):
+            if path.name != state_name:
+                path.unlink(missing_ok=True)
+
+        LOGGER.debug(f"Saved calibration checkpoint at batch {cursor} to {self._root}")
+
+    def clear(self):
+        """
+        Remove the checkpoint, once the calibration is done or when it can't be resumed.
+        """
+        shutil.rmtree(self._root, ignore_errors=True)
+
+
+def write_calibration_manifest(
+    root: Union[str, os.PathLike],
+    files: Optional[Iterable[Union[str, os.PathLike]]] = None,
+    metadata: Optional[Dict[str, Any]] = None,
+) -> Path:
+    """
+    Record the size and checksum of the calibration artifacts stored in `root`, marking them as complete.
+    :param root: The folder holding the artifacts
+    :param files: The artifacts to record, defaults to all the (non-hidden) files in `root`
+    :param metadata: Additional information stored along with the checksums
+    :return: The path of the manifest
+    """
+    root = Path(root)
+    if files is None:
+        files = [
+            path
+            for path in root.rglob("*")
+            if path.is_file()
+            and path.name != CALIBRATION_MANIFEST_FILE
+            and not any(part.startswith(".") for part in path.relative_to(root).parts)
+        ]
+
+    artifacts = {}
+    for path in sorted(Path(file) for file in files):
+        path = path if path.is_absolute() else root / path
+        artifacts[path.relative_to(root).as_posix()] = {
+            "size": path.stat().st_size,
+            "sha256": compute_file_digest(path),
+        }
+
+    # Written last and atomically, the presence of the manifest means the artifacts are complete
+    staging_path = root / f".{CALIBRATION_MANIFEST_FILE}.{uuid4().hex}"
+    with open(staging_path, "w") as manifest_f:
+        json.dump(
+            {
+                "version": CALIBRATION_CHECKPOINT_VERSION,
+                "files": artifacts,
+                "metadata": metadata or {},
+            },
+            manifest_f,
+            indent=2,
+        )
+    os.replace(staging_path, root / CALIBRATION_MANIFEST_FILE)
+
+    return root / CALIBRATION_MANIFEST_FILE
+
+
+def verify_calibration_manifest(
+    root: Union[str, os.PathLike], metadata: Optional[Dict[str, Any]] = None
+) -> bool:
+    """
+    Check the calibration artifacts stored in `root` are complete and intact.
+    :param root: The folder holding the artifacts
+    :param metadata: If provided, the metadata the manifest should have been written with
+    :return: True if the manifest exists and every artifact matches its size and checksum, False otherwise
+    """
+    manifest_path = Path(root) / CALIBRATION_MANIFEST_FILE
+    if not manifest_path.exists():
+        return False
+
+    try:
+        with open(manifest_path, "r") as manifest_f:
+            manifest = json.load(manifest_f)
+
+        if manifest["version"] != CALIBRATION_CHECKPOINT_VERSION:
+            return False
+
+        if metadata is not None and manifest["metadata"] != metadata:
+            LOGGER.debug(f"Calibration artifacts {root} were produced by another run")
+            return False
+
+        for name, artifact in manifest["files"].items():
+            path = Path(root) / name
+            if not path.exists() or path.stat().st_size != artifact["size"]:
+                LOGGER.warning(f"Calibration artifact {path} is missing or truncated")
+                return False
+
+            if compute_file_digest(path) != artifact["sha256"]:
+                LOGGER.warning(f"Calibration artifact {path} is corrupted")
+                return False
+    except (OSError, KeyError, ValueError) as e:
+        LOGGER.warning(f"Invalid calibration manifest {manifest_path}: {e}")
+        return False
+
+    return bool(manifest["files"])
@@ -0,0 +1,183 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+from logging import getLogger
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+import torch
+
+
+LOGGER = getLogger(__name__)
+
+
+class _LayerInputs(Exception):
+    """
+    Raised by `_InputsCatcher` to interrupt the forward pass once the inputs of the first layer are known.
+    """
+
+    def __init__(self, args: Tuple[Any, ...], kwargs: Dict[str, Any]):
+        super().__init__()
+        self.args = args
+        self.kwargs = kwargs
+
+
+class _InputsCatcher(torch.nn.Module):
+    """
+    Stand-in for the first decoder layer, capturing the inputs the model prepared for it (hidden states,
+    attention masks, positions, rotary embeddings...) whatever the version of transformers.
+    """
+
+    def __init__(self, layer: torch.nn.Module):
+        super().__init__()
+        self.layer = layer
+
+    def __getattr__(self, name: str):
+        # Some models read attributes of their layers (i.e. attention type) while iterating over them
+        try:
+            return super().__getattr__(name)
+        except AttributeError:
+            return getattr(super().__getattr__("layer"), name)
+
+    def forward(self, *args, **kwargs):
+        raise _LayerInputs(args, kwargs)
+
+
+def get_decoder_layers(
+    model: torch.nn.Module,
+) -> Tuple[torch.nn.Module, torch.nn.ModuleList]:
+    """
+    Retrieve the decoder of a causal language model along with its stack of layers.
+    :param model: A transformers causal language model (i.e. `LlamaForCausalLM`)
+    :return: Tuple with the decoder (i.e. `LlamaModel`) and its layers
+    """
+    decoder = model.get_decoder() if hasattr(model, "get_decoder") else model
+    layers = getattr(decoder, "layers", None)
+
+    if not isinstance(layers, torch.nn.ModuleList):
+        raise ValueError(
+            f"Unable to locate the decoder layers of {type(model).__name__}, sequential calibration is not supported"
+        )
+
+    return decoder, layers
+
+
+def _to(value: Any, device: Union[str, torch.device]) -> Any:
+    if isinstance(value, torch.Tensor):
+        return value.to(device, non_blocking=True)
+    elif isinstance(value, (tuple, list)):
+        return type(value)(_to(item, device) for item in value)
+    elif isinstance(value, dict):
+        return {key: _to(item, device) for key, item in value.items()}
+
+    return value
+
+
+def _module_device(module: torch.nn.Module) -> torch.device:
+    parameter = next(module.parameters(), None)
+    return parameter.device if parameter is not None else torch.device("cpu")
+
+
+def sequential_forward(
+    model: torch.nn.Module,
+    batches: Iterable[Dict[str, torch.Tensor]],
+    device: Union[str, torch.device] = "cuda:0",
+    offload_activations: bool = False,
+    with_head: bool = True,
+) -> int:
+    """
+    Run the calibration batches through `model` one decoder layer at a time, rather than one batch at a time.
+
+    The inputs of the first layer are captured for all the batches, then every layer is moved to `device`, fed the
+    activations of all the batches, and moved back to where it was while its outputs become the inputs of the next
+    layer. The quantizers inserted in the layers see exactly the same activations as with regular forward passes,
+    while the memory used on `device` is bounded by the size of a single layer plus the cached activations, and every
+    weight is copied to `device` only once.
+    :param model: The model to calibrate, i.e. loaded on CPU
+    :param batches: The calibration batches, as dicts of model inputs
+    :param device: The device running the layers
+    :param offload_activations: Keep the cached activations on CPU between two layers, rather than on `device`
+    :param with_head: Also run the final norm and the language modeling head over the outputs of the last layer
+    :return: The number of batches processed
+    """
+    decoder, layers = get_decoder_layers(model)
+    cache_device = "cpu" if offload_activations else device
+
+    # Everything but the layers (embeddings, rotary embeddings, final norm, head) lives on `device` for the run
+    resident = [child for child in decoder.children() if child is not layers]
+    resident += [child for child in model.children() if child is not decoder]
+    resident_devices = [_module_device(module) for module in resident]
+    for module in resident:
+        module.to(device)
+
+    try:
+        # Capture the inputs of the first layer, the model takes care of masks and positions
+        activations: List[Tuple[torch.Tensor, Tuple[Any, ...], Dict[str, Any]]] = []
+        layers[0] = _InputsCatcher(layers[0])
+        try:
+            for batch in batches:
+                inputs = {
+                    name: tensor.to(device, non_blocking=True)
+                    for name, tensor in batch.items()
+                    if name != "num_tokens"
+                }
+
+                try:
+                    model(**inputs, use_cache=False)
+                except _LayerInputs as captured:
+                    args, kwargs = captured.args, dict(captured.kwargs)
+                    hidden_states = args[0] if args else kwargs.pop("hidden_states")
+                    activations.append(
+                        (
+                            _to(hidden_states, cache_device),
+                            _to(args[1:], cache_device),
+                            _to(kwargs, cache_device),
+                        )
+                    )
+                else:
+                    raise RuntimeError("The first decoder layer was never called")
+        finally:
+            layers[0] = layers[0].layer
+
+        # Feed the activations of all the batches through one layer after the other
+        for index, layer in enumerate(layers):
+            LOGGER.debug(f"Calibrating layer {index + 1}/{len(layers)}")
+
+            layer_device = _module_device(layer)
+            layer.to(device)
+
+            for step, (hidden_states, args, kwargs) in enumerate(activations):
+                outputs = layer(
+                    _to(hidden_states, device),
+                    *_to(args, device),
+                    **_to(kwargs, device),
+                )
+                if isinstance(outputs, (tuple, list)):
+                    outputs = outputs[0]
+
+                activations[step] = (_to(outputs, cache_device), args, kwargs)
+
+            layer.to(layer_device)
+
+        norm = getattr(decoder, "norm", None)
+        head = model.get_output_embeddings() if with_head else None
+        if norm is not None and head is not None:
+            for hidden_states, _, _ in activations:
+                head(norm(_to(hidden_states, device)))
+    finally:
+        for module, module_device in zip(resident, resident_devices):
+            module.to(module_device)
+
+    return len(activations)
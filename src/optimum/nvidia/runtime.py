@@ -14,18 +14,42 @@
 #  limitations under the License.
 
 import warnings
+from collections import defaultdict
+from itertools import chain
 from logging import getLogger
 from os import PathLike
 from pathlib import Path
-from typing import List, Optional, Tuple, Union
+from threading import Thread
+from typing import Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple, Union
 
+import numpy as np
 import tensorrt_llm.bindings as ctrrt
 import torch
 
+from optimum.nvidia.generation import Executor, GenerationRequest
+from optimum.nvidia.generation.sampling import (
+    DEFAULT_SAMPLING_PARAMETERS,
+    SamplingValue,
+    pack_sampling_parameters,
+)
+from optimum.nvidia.generation.streaming import TokenStream
+from optimum.nvidia.utils.buffers import BufferPool
+
 
 LOGGER = getLogger(__name__)
 
 PackedTensor = List[torch.Tensor]
+InputIds = Union[torch.Tensor, Sequence[Sequence[int]], Sequence[int]]
+
+PackedInputs = NamedTuple(
+    "PackedInputs",
+    [
+        ("ids", torch.Tensor),
+        ("lengths", torch.Tensor),
+        ("offsets", torch.Tensor),
+        ("max_length", int),
+    ],
+)
 
 
 DEFAULT_BATCH_SIZE: int = 1
@@ -33,6 +57,179 @@ DEFAULT_PROMPT_LENGTH: int = 128
 DEFAULT_BEAM_WIDTH: int = 1
 
 
+def pack_stop_words(
+    stop_words: Sequence[Sequence[int]], batch_size: int
+) -> torch.Tensor:
+    """
+    Lay out token ids sequences the way the engine expects its `stop_words_list`, shared by all the sequences.
+    For each sequence of the batch, the first row holds the concatenated token ids (padded with 0) and the second
+    one the offset where each of them ends (padded with -1).
+    :param stop_words: The token ids sequences to stop on
+    :param batch_size: The number of sequences in the batch
+    :return: int32 tensor (BS x 2 x max(len(stop_words), sum(map(len, stop_words))))
+    """
+    if any(len(stop_word) == 0 for stop_word in stop_words):
+        raise ValueError("Stop words should not be empty")
+
+    flat_ids = list(chain.from_iterable(stop_words))
+    length = max(len(flat_ids), len(stop_words))
+
+    stop_words_list = torch.zeros((2, length), dtype=torch.int32)
+    stop_words_list[1].fill_(-1)
+    stop_words_list[0, : len(flat_ids)] = torch.tensor(flat_ids, dtype=torch.int32)
+    stop_words_list[1, : len(stop_words)] = torch.from_numpy(
+        np.cumsum(list(map(len, stop_words)), dtype=np.int32)
+    )
+
+    return stop_words_list.unsqueeze(0).expand(batch_size, -1, -1).contiguous()
+
+
+class InputPacker:
+    """
+    Prepare the (ids, lengths) inputs of the engine from a batch of prompts.
+
+    Token ids, lengths and cumulative offsets of the batch are written in a single pass to one host staging buffer,
+    laid out as [ids | lengths | offsets], and moved to the device with a single asynchronous copy. Both the
+    staging buffer (pinned when targeting a CUDA device) and the device buffer come from `BufferPool`s, the device
+    buffer should be given back through `release` once the engine is done with the inputs.
+
+    When the engine doesn't use packed inputs, ids are right-padded with `pad_token_id` to the longest sequence.
+    """
+
+    __slots__ = ("_host_pool", "_device_pool")
+
+    def __init__(
+        self,
+        device: torch.device,
+        host_pool: Optional[BufferPool] = None,
+        device_pool: Optional[BufferPool] = None,
+    ):
+        device = torch.device(device)
+        self._host_pool = host_pool or BufferPool(
+            "cpu", pin_memory=device.type == "cuda"
+        )
+        self._device_pool = device_pool or BufferPool(device)
+
+    def release(self, inputs: PackedInputs):
+        """
+        Give the device buffer holding `inputs` back to the pool.
+        """
+        self._device_pool.release(inputs.ids)
+
+    def pack(
+        self, sequences: Sequence, packed: bool, pad_token_id: int = 0
+    ) -> PackedInputs:
+        """
+        Pack a batch of ragged sequences of token ids, without any padding involved.
+        :param sequences: The token ids of each prompt, a single prompt can be provided as a flat list of ids
+        :param packed: Whether the engine expects packed inputs (1 x sum(lengths)) or padded ones (BS x max(lengths))
+        :param pad_token_id: The token id used to pad the inputs when `packed` is False
+        :return: `PackedInputs` on the target device
+        """
+        if len(sequences) == 0:
+            raise ValueError("Cannot pack an empty batch")
+
+        if not isinstance(sequences[0], (Sequence, torch.Tensor, np.ndarray)):
+            sequences = [sequences]
+
+        lengths = np.fromiter(map(len, sequences), dtype=np.int32, count=len(sequences))
+        if isinstance(sequences[0], torch.Tensor):
+            flat_ids = torch.cat([sequence.cpu().view(-1) for sequence in sequences])
+        else:
+            flat_ids = torch.from_numpy(
+                np.fromiter(
+                    chain.from_iterable(sequences),
+                    dtype=np.int32,
+                    count=int(lengths.sum()),
+                )
+            )
+
+        return self._pack(flat_ids, torch.from_numpy(lengths), packed, pad_token_id)
+
+    def pack_tensor(
+        self,
+        input_ids: torch.Tensor,
+        attention_mask: Optional[torch.Tensor],
+        packed: bool,
+        pad_token_id: int = 0,
+    ) -> PackedInputs:
+        """
+        Pack a (potentially padded) batch of token ids.
+        :param input_ids: 1D tensor for a single prompt, or 2D (BS x SL) tensor
+        :param attention_mask: Mask of the non-padded tokens, all the tokens are attended to if None
+        :param packed: Whether the engine expects packed inputs (1 x sum(lengths)) or padded ones (BS x max(lengths))
+        :param pad_token_id: The token id used to pad the inputs when `packed` is False
+        :return: `PackedInputs` on the target device
+        """
+        input_ids = input_ids.cpu().view(-1, input_ids.shape[-1]).int()
+
+        if attention_mask is None:
+            batch_size, length = input_ids.shape
+            lengths = torch.full((batch_size,), length, dtype=torch.int32)
+            flat_ids = input_ids.view(-1)
+        else:
+            mask = attention_mask.cpu().view(input_ids.shape).bool()
+            lengths = mask.sum(dim=1, dtype=torch.int32)
+            flat_ids = torch.masked_select(input_ids, mask)
+
+        return self._pack(flat_ids, lengths, packed, pad_token_id)
+
+    def _pack(
+        self,
+        flat_ids: torch.Tensor,
+        lengths: torch.Tensor,
+        packed: bool,
+        pad_token_id: int,
+    ) -> PackedInputs:
+        batch_size = lengths.numel()
+        max_length = int(lengths.max())
+        num_ids = flat_ids.numel() if packed else batch_size * max_length
+
+        numel = num_ids + 2 * batch_size + 1
+        host = self._host_pool.acquire((numel,), torch.int32)
+        host_ids = host[:num_ids]
+        host_lengths = host[num_ids : num_ids + batch_size]
+        host_offsets = host[num_ids + batch_size :]
+
+        host_lengths.copy_(lengths)
+        host_offsets[0] = 0
+        torch.cumsum(lengths, dim=0, dtype=torch.int32, out=host_offsets[1:])
+
+        if packed:
+            host_ids.copy_(flat_ids)
+        else:
+            # Scatter every token to its (row, column) position in the padded layout
+            rows = torch.repeat_interleave(
+                torch.arange(batch_size),
+                lengths.long(),
+                output_size=flat_ids.numel(),
+            )
+            columns = torch.arange(flat_ids.numel()) - host_offsets[rows]
+            host_ids.fill_(pad_token_id)
+            host_ids.view(batch_size, max_length)[rows, columns] = flat_ids
+
+        # Single copy for the whole batch, the staging buffer can be reused once it completed
+        device_buffer = self._device_pool.acquire((numel,), torch.int32)
+        device_buffer.copy_(host, non_blocking=self._host_pool.pin_memory)
+
+        if self._host_pool.pin_memory:
+            copy_done = torch.cuda.Event()
+            copy_done.record()
+            self._host_pool.release(host, copy_done)
+        else:
+            self._host_pool.release(host)
+
+        ids = device_buffer[:num_ids].view(
+            (1, num_ids) if packed else (batch_size, max_length)
+        )
+        return PackedInputs(
+            ids,
+            device_buffer[num_ids : num_ids + batch_size],
+            device_buffer[num_ids + batch_size :],
+            max_length,
+        )
+
+
 class CompiledModel:
     def __init__(self, engines_folder_path: Union[Path, PathLike]):
         self._engines_folder_path = Path(engines_folder_path)
@@ -54,6 +251,9 @@ class CausalLM(CompiledModel):
         "_mapping",
         "_session",
         "_session_config",
+        "_host_buffer_pool",
+        "_buffer_pool",
+        "_packer",
         "_use_packed_inputs",
         "max_beam_width",
         "max_batch_size",
@@ -95,6 +295,11 @@ class CausalLM(CompiledModel):
 
         # Additional cached properties
         self._use_packed_inputs = self._config.model_config.use_packed_input
+        self._host_buffer_pool = BufferPool("cpu", pin_memory=True)
+        self._buffer_pool = BufferPool(self._device)
+        self._packer = InputPacker(
+            self._device, self._host_buffer_pool, self._buffer_pool
+        )
         self.max_batch_size = self._config.model_config.max_batch_size
         self.max_prompt_length = self._config.model_config.max_input_len
 
@@ -105,98 +310,385 @@ class CausalLM(CompiledModel):
     def config(self) -> ctrrt.GptJsonConfig:
         return self._config
 
+    @property
+    def buffer_pool(self) -> BufferPool:
+        """
+        Pool of device buffers holding the inputs and outputs of the engine.
+        """
+        return self._buffer_pool
+
+    @property
+    def host_buffer_pool(self) -> BufferPool:
+        """
+        Pool of pinned host buffers used to stage the inputs of the engine.
+        """
+        return self._host_buffer_pool
+
+    def release(self, *tensors: torch.Tensor):
+        """
+        Give the output tensors of `generate` back to the buffer pool, they must not be used afterward.
+        Releasing is optional, outputs which are not released are simply not reused.
+        """
+        for tensor in tensors:
+            self._buffer_pool.release(tensor)
+
     def generate(
         self,
-        input_ids: torch.Tensor,
+        input_ids: InputIds,
         attention_mask: Optional[torch.Tensor] = None,
         max_new_tokens: int = -1,
-        min_length: int = -1,
+        min_length: SamplingValue = -1,
         num_beams: int = 1,
-        temperature: float = 1.0,
-        top_k: int = 50,
-        top_p: float = 1.0,
-        repetition_penalty: float = 1.0,
-        length_penalty: float = 1.0,
-        seed: int = 0,
+        temperature: SamplingValue = 1.0,
+        top_k: SamplingValue = 50,
+        top_p: SamplingValue = 1.0,
+        repetition_penalty: SamplingValue = 1.0,
+        length_penalty: SamplingValue = 1.0,
+        seed: SamplingValue = 0,
         pad_token_id: int = 0,
         bos_token_id: int = 1,
         eos_token_id: int = 2,
+        stop_words: Optional[Sequence[Sequence[int]]] = None,
     ) -> Tuple[torch.Tensor, torch.Tensor]:
-        device = self._device
-
-        # If no GenerationConfig is provided, let's allocate one with default settings
-        generation_config = ctrrt.SamplingConfig(min(num_beams, self.max_beam_width))
-        generation_config.random_seed = [seed]
-        generation_config.temperature = [temperature]
-        generation_config.top_k = [top_k]
-        generation_config.top_p = [top_p]
-        generation_config.repetition_penalty = [repetition_penalty]
-        generation_config.length_penalty = [length_penalty]
-
-        if min_length > 0:
-            generation_config.min_length = [min_length]
+        """
+        Generate tokens for a batch of prompts.
 
+        Sampling parameters accept either a single value, shared by all the sequences, or one value per sequence.
+        Sequences stop as soon as they generate `eos_token_id` or one of the token ids sequences in `stop_words`.
+        :return: Tuple holding the generated ids (BS x BEAMS x SL) and the length of each sequence (BS x BEAMS)
+        """
         with torch.no_grad():
-            if not isinstance(input_ids, torch.Tensor):
-                raise TypeError("input_ids should be a PyTorch tensor (torch.Tensor)")
+            trt_inputs, inputs = self._create_generation_input(
+                input_ids,
+                attention_mask,
+                max_new_tokens,
+                pad_token_id,
+                eos_token_id,
+                stop_words,
+            )
 
-            input_ids, lengths = self._prepare_inputs(input_ids, attention_mask)
-            if torch.any(torch.gt(lengths, self.max_prompt_length)):
-                raise ValueError(
-                    f"Input length {lengths} is bigger than maximum prompt length ({self.max_prompt_length})."
+            try:
+                generation_config = self._create_sampling_config(
+                    batch_size=inputs.lengths.numel(),
+                    min_length=min_length,
+                    num_beams=num_beams,
+                    temperature=temperature,
+                    top_k=top_k,
+                    top_p=top_p,
+                    repetition_penalty=repetition_penalty,
+                    length_penalty=length_penalty,
+                    seed=seed,
                 )
+                trt_outputs = self._create_generation_output(
+                    trt_inputs, inputs, min(num_beams, self.max_beam_width)
+                )
+                self._session.generate(trt_outputs, trt_inputs, generation_config)
+            finally:
+                self._packer.release(inputs)
+
+            return trt_outputs.ids, trt_outputs.lengths
 
-            trt_inputs = ctrrt.GenerationInput(
-                end_id=eos_token_id,
-                pad_id=pad_token_id,
-                ids=input_ids.to(device),
-                lengths=lengths.to(device),
-                packed=self._use_packed_inputs,
+    def generate_stream(
+        self,
+        input_ids: InputIds,
+        attention_mask: Optional[torch.Tensor] = None,
+        max_new_tokens: int = -1,
+        min_length: SamplingValue = -1,
+        num_beams: int = 1,
+        temperature: SamplingValue = 1.0,
+        top_k: SamplingValue = 50,
+        top_p: SamplingValue = 1.0,
+        repetition_penalty: SamplingValue = 1.0,
+        length_penalty: SamplingValue = 1.0,
+        seed: SamplingValue = 0,
+        pad_token_id: int = 0,
+        bos_token_id: int = 1,
+        eos_token_id: int = 2,
+        stop_words: Optional[Sequence[Sequence[int]]] = None,
+    ) -> TokenStream:
+        """
+        Generate tokens, yielding them as soon as they are produced by the engine.
+
+        The engine runs in a background thread, the returned stream can be consumed either through a regular
+        `for` loop or an `async for` loop. Each item is a tensor holding the new token of every sequence in the batch.
+        Sequences which already reached `eos_token_id` (or one of `stop_words`) keep producing `eos_token_id` until all
+        of them are finished.
+        Sampling parameters accept either a single value, shared by all the sequences, or one value per sequence.
+        :return: `TokenStream` yielding `torch.Tensor` of shape [batch_size]
+        """
+        if num_beams > 1:
+            raise ValueError(
+                f"Streaming is only supported with num_beams=1 (got: {num_beams})"
             )
 
-            if max_new_tokens is None or max_new_tokens < 1:
-                max_new_tokens = self.max_output_length - input_ids.shape[1]
+        stream = TokenStream()
 
-            trt_inputs.max_new_tokens = max_new_tokens
+        with torch.no_grad():
+            trt_inputs, inputs = self._create_generation_input(
+                input_ids,
+                attention_mask,
+                max_new_tokens,
+                pad_token_id,
+                eos_token_id,
+                stop_words,
+            )
 
-            # Tensors are being allocated as in/out parameters and TRTLLM will resize
-            trt_outputs = ctrrt.GenerationOutput(
-                ids=torch.empty(0, device=device, dtype=torch.int32),
-                lengths=torch.empty(0, device=device, dtype=torch.int32),
+        try:
+            generation_config = self._create_sampling_config(
+                batch_size=inputs.lengths.numel(),
+                min_length=min_length,
+                num_beams=num_beams,
+                temperature=temperature,
+                top_k=top_k,
+                top_p=top_p,
+                repetition_penalty=repetition_penalty,
+                length_penalty=length_penalty,
+                seed=seed,
+            )
+        except ValueError:
+            self._packer.release(inputs)
+            raise
+
+        # Offsets of the first generated token for each sequence in the output tensor (BS x BEAMS x SL)
+        offsets = inputs.lengths.long().view(-1, 1, 1)
+
+        def _on_token_generated(ids: torch.Tensor, step: int, finished: bool):
+            tokens = torch.gather(ids, 2, offsets + step)
+            stream.put(tokens.view(-1).cpu())
+
+        def _generate():
+            try:
+                with torch.no_grad():
+                    trt_outputs = self._create_generation_output(
+                        trt_inputs, inputs, min(num_beams, self.max_beam_width)
+                    )
+                    trt_outputs.on_token_generated = _on_token_generated
+                    self._session.generate(trt_outputs, trt_inputs, generation_config)
+                    self.release(trt_outputs.ids, trt_outputs.lengths)
+                stream.end()
+            except Exception as e:
+                stream.end(e)
+            finally:
+                self._packer.release(inputs)
+
+        Thread(target=_generate, daemon=True).start()
+        return stream
+
+    def _create_sampling_config(
+        self,
+        batch_size: int,
+        num_beams: int,
+        **sampling_parameters: SamplingValue,
+    ) -> ctrrt.SamplingConfig:
+        # Each parameter holds either a single value for the whole batch or one value per sequence
+        sampling = pack_sampling_parameters(batch_size, **sampling_parameters)
+
+        sampling_config = ctrrt.SamplingConfig(min(num_beams, self.max_beam_width))
+        sampling_config.random_seed = sampling["seed"]
+        sampling_config.temperature = sampling["temperature"]
+        sampling_config.top_k = sampling["top_k"]
+        sampling_config.top_p = sampling["top_p"]
+        sampling_config.repetition_penalty = sampling["repetition_penalty"]
+        sampling_config.length_penalty = sampling["length_penalty"]
+
+        # Sequences without any constraint fall back to the engine's default minimum length (1)
+        if any(min_length > 0 for min_length in sampling["min_length"]):
+            sampling_config.min_length = [
+                max(min_length, 1) for min_length in sampling["min_length"]
+            ]
+
+        return sampling_config
+
+    def _create_generation_input(
+        self,
+        input_ids: InputIds,
+        attention_mask: Optional[torch.Tensor],
+        max_new_tokens: int,
+        pad_token_id: int,
+        eos_token_id: int,
+        stop_words: Optional[Sequence[Sequence[int]]] = None,
+    ) -> Tuple[ctrrt.GenerationInput, PackedInputs]:
+        inputs = self._prepare_inputs(input_ids, attention_mask, pad_token_id)
+        if inputs.max_length > self.max_prompt_length:
+            raise ValueError(
+                f"Input length {inputs.max_length} is bigger than maximum prompt length ({self.max_prompt_length})."
             )
 
-            self._session.generate(trt_outputs, trt_inputs, generation_config)
+        trt_inputs = ctrrt.GenerationInput(
+            end_id=eos_token_id,
+            pad_id=pad_token_id,
+            ids=inputs.ids,
+            lengths=inputs.lengths,
+            packed=self._use_packed_inputs,
+        )
 
-            return trt_outputs.ids, trt_outputs.lengths
+        if max_new_tokens is None or max_new_tokens < 1:
+            max_new_tokens = self.max_output_length - inputs.max_length
+
+        trt_inputs.max_new_tokens = max_new_tokens
+
+        # Let the engine stop the sequences by itself instead of decoding up to max_new_tokens
+        if stop_words:
+            trt_inputs.stop_words_list = pack_stop_words(
+                stop_words, inputs.lengths.numel()
+            ).to(self._device)
+
+        return trt_inputs, inputs
+
+    def _create_generation_output(
+        self, trt_inputs: ctrrt.GenerationInput, inputs: PackedInputs, num_beams: int
+    ) -> ctrrt.GenerationOutput:
+        # Tensors are being allocated as in/out parameters, TRTLLM resizes them in place to the same shapes
+        batch_size = inputs.lengths.numel()
+        max_length = inputs.max_length + trt_inputs.max_new_tokens
+
+        return ctrrt.GenerationOutput(
+            ids=self._buffer_pool.acquire(
+                (batch_size, num_beams, max_length), torch.int32
+            ),
+            lengths=self._buffer_pool.acquire((batch_size, num_beams), torch.int32),
+        )
 
     def _prepare_inputs(
-        self, input_ids: torch.Tensor, attention_mask: Optional[torch.Tensor] = None
-    ) -> Tuple[torch.Tensor, torch.Tensor]:
-        shape = input_ids.size()
-        input_ids = input_ids.int()
-
-        if input_ids.ndim == 1:
-            lengths = torch.tensor(shape, dtype=torch.int32, device=self._device)
-        elif input_ids.ndim == 2 and shape[0] == 1:
-            lengths = torch.tensor([shape[1]], dtype=torch.int32, device=self._device)
-        elif attention_mask is not None:
-            lengths = attention_mask.sum(dim=1, dtype=torch.int32)
-        else:
-            warnings.warn(
-                "Not enough information to compute the non-padded tensor length. "
-                "Please provide an attention_mask to avoid situations where padding"
-                " will be attended to in attention modules"
+        self,
+        input_ids: InputIds,
+        attention_mask: Optional[torch.Tensor] = None,
+        pad_token_id: int = 0,
+    ) -> PackedInputs:
+        if isinstance(input_ids, torch.Tensor):
+            if input_ids.ndim > 2:
+                raise ValueError(
+                    f"input_ids should be a 1D or 2D tensor (got: {input_ids.ndim}D)"
+                )
+
+            if (
+                attention_mask is None
+                and input_ids.ndim == 2
+                and input_ids.shape[0] > 1
+            ):
+                warnings.warn(
+                    "Not enough information to compute the non-padded tensor length. "
+                    "Please provide an attention_mask to avoid situations where padding"
+                    " will be attended to in attention modules"
+                )
+
+            return self._packer.pack_tensor(
+                input_ids, attention_mask, self._use_packed_inputs, pad_token_id
+            )
+
+        if not isinstance(input_ids, Sequence):
+            raise TypeError(
+                "input_ids should be a PyTorch tensor (torch.Tensor) or a list of token ids sequences"
             )
 
-            attention_mask = torch.ones_like(input_ids)
-            lengths = torch.tensor(shape, dtype=torch.int32).flatten()
+        return self._packer.pack(input_ids, self._use_packed_inputs, pad_token_id)
+
+
+class CausalLMExecutor(Executor):
+    """
+    Executor running on top of `CausalLM.generate`.
+
+    `GptSession` doesn't expose a single decoding step, so every step generates a chunk of `tokens_per_step`
+    tokens for all the active requests, re-submitting each sequence (prompt and tokens generated so far) to the
+    engine. Finished sequences release their slot at the chunk boundary, letting new requests join the batch.
+    """
+
+    __slots__ = ("_model", "_tokens_per_step")
 
-        if self._use_packed_inputs and shape[0] > 1:
-            input_ids = torch.masked_select(input_ids, attention_mask.bool()).view(
-                1, -1
+    def __init__(self, model: CausalLM, tokens_per_step: int = 16):
+        if tokens_per_step < 1:
+            raise ValueError(f"tokens_per_step should be >= 1 (got: {tokens_per_step})")
+
+        self._model = model
+        self._tokens_per_step = tokens_per_step
+
+    @property
+    def max_batch_size(self) -> int:
+        return self._model.max_batch_size
+
+    def validate(self, request: GenerationRequest):
+        # The last chunk re-submits the prompt along with all but the last generated tokens
+        max_length = len(request.prompt_ids) + request.max_new_tokens - 1
+        if max_length > self._model.max_prompt_length:
+            raise ValueError(
+                f"prompt length ({len(request.prompt_ids)}) + max_new_tokens ({request.max_new_tokens}) "
+                f"exceeds the maximum prompt length supported by the engine ({self._model.max_prompt_length})"
+            )
+
+    def step(self, requests: Mapping[int, GenerationRequest]) -> Dict[int, List[int]]:
+        # Requests sharing a call to generate must share the same parameters, but sampling parameters which are
+        # set for each sequence of the batch
+        groups = defaultdict(list)
+        for slot, request in requests.items():
+            shared_kwargs = {
+                name: value
+                for name, value in request.generate_kwargs.items()
+                if name not in DEFAULT_SAMPLING_PARAMETERS
+            }
+            key = (request.eos_token_id, tuple(sorted(shared_kwargs.items())))
+            groups[key].append(slot)
+
+        new_tokens = {}
+        for (eos_token_id, generate_kwargs), slots in groups.items():
+            new_tokens.update(
+                self._step_group(
+                    {slot: requests[slot] for slot in slots},
+                    eos_token_id,
+                    dict(generate_kwargs),
+                )
             )
 
-        return input_ids, lengths
+        return new_tokens
+
+    def _step_group(
+        self,
+        requests: Mapping[int, GenerationRequest],
+        eos_token_id: int,
+        generate_kwargs: Dict,
+    ) -> Dict[int, List[int]]:
+        sequences = [request.all_ids for request in requests.values()]
+        input_lengths = [len(sequence) for sequence in sequences]
+
+        max_new_tokens = min(
+            self._tokens_per_step,
+            max(request.num_remaining_tokens for request in requests.values()),
+        )
+
+        # Gather the sampling parameters of every sequence, falling back to the defaults when not provided
+        for name, default in DEFAULT_SAMPLING_PARAMETERS.items():
+            if any(name in request.generate_kwargs for request in requests.values()):
+                generate_kwargs[name] = [
+                    request.generate_kwargs.get(name, default)
+                    for request in requests.values()
+                ]
+
+        if eos_token_id is not None:
+            generate_kwargs["eos_token_id"] = eos_token_id
+
+        # BS x BEAMS x SL
+        device_ids, device_lengths = self._model.generate(
+            sequences,
+            max_new_tokens=max_new_tokens,
+            **generate_kwargs,
+        )
+        ids, lengths = device_ids.cpu(), device_lengths.cpu()
+
+        new_tokens = {}
+        for row, slot in enumerate(requests.keys()):
+            start = input_lengths[row]
+            end = max(int(lengths[row, 0]), start)
+            tokens = ids[row, 0, start:end].tolist()
+
+            # The engine stopped early, meaning the sequence reached the end-of-sequence token
+            if len(tokens) < max_new_tokens and eos_token_id is not None:
+                if not tokens or tokens[-1] != eos_token_id:
+                    tokens.append(eos_token_id)
+
+            new_tokens[slot] = tokens
+
+        # Device and host tensors are the same when running on CPU, only release once done with them
+        self._model.release(device_ids, device_lengths)
+        return new_tokens
 
 
 class TensorRTForSpeechSeq2Seq(CompiledModel):
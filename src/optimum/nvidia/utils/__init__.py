@@ -14,6 +14,7 @@
 #  limitations under the License.
 import functools
 
+from .buffers import BufferPool, BufferPoolStats
 from .constants import (
     DEFAULT_ENGINE_FOLDER,
     DEFAULT_HF_HUB_TRT_REVISION,
@@ -27,6 +28,7 @@ from .hub import get_user_agent
 from .nvml import has_float8_support
 from .offload import maybe_offload_weights_to_cpu
 from .onnx import to_onnx
+from .tokenization import TokenizationCache, TokenizationCacheStats
 
 
 def rgetattr(obj, attr):
@@ -0,0 +1,223 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from logging import getLogger
+from math import prod
+from threading import Lock
+from typing import List, Optional, Sequence, Tuple, Union
+from weakref import WeakValueDictionary
+
+import torch
+
+
+LOGGER = getLogger(__name__)
+
+# Smallest buffer handed out, avoids fragmenting the pool with tiny size classes
+DEFAULT_MIN_BUFFER_NUMEL = 256
+
+# Amount of memory kept around by the pool for buffers not currently in use
+DEFAULT_MAX_CACHED_BYTES = 512 * 1024 * 1024
+
+
+def size_class(numel: int, min_numel: int = DEFAULT_MIN_BUFFER_NUMEL) -> int:
+    """
+    Round `numel` up to its size class.
+    Each power of two is divided in 4 size classes, bounding the memory wasted by rounding up to 25%.
+    :param numel: The number of elements requested
+    :param min_numel: The smallest size class
+    :return: The number of elements of the buffer to allocate
+    """
+    numel = max(numel, min_numel, 1)
+    step = 1 << max((numel - 1).bit_length() - 3, 0)
+    return -(-numel // step) * step
+
+
+@dataclass
+class BufferPoolStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    cached_bytes: int = 0
+    in_use: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+
+class BufferPool:
+    """
+    Pool of preallocated buffers, on the host (optionally pinned) or on a device.
+
+    Buffers are bucketed by (dtype, size class): `acquire` hands out a view of the requested shape over a free
+    buffer of the matching bucket, allocating one only if none is available, and `release` returns it to the pool.
+    Free buffers are kept in least-recently-used order and the oldest ones are dropped whenever the pool holds more
+    than `max_cached_bytes`.
+
+    Buffers which are never released are simply garbage collected along with the last tensor referencing them.
+    """
+
+    __slots__ = (
+        "_device",
+        "_pin_memory",
+        "_max_cached_bytes",
+        "_min_numel",
+        "_free",
+        "_in_use",
+        "_stats",
+        "_lock",
+    )
+
+    def __init__(
+        self,
+        device: Union[str, torch.device] = "cpu",
+        pin_memory: bool = False,
+        max_cached_bytes: int = DEFAULT_MAX_CACHED_BYTES,
+        min_numel: int = DEFAULT_MIN_BUFFER_NUMEL,
+    ):
+        self._device = torch.device(device)
+
+        if pin_memory and self._device.type != "cpu":
+            raise ValueError(
+                f"Only host buffers can be pinned (device: {self._device})"
+            )
+
+        self._pin_memory = pin_memory
+        self._max_cached_bytes = max_cached_bytes
+        self._min_numel = min_numel
+
+        # (dtype, numel) -> [(buffer, event the buffer is waiting on)], least recently used first
+        self._free: OrderedDict[
+            Tuple[torch.dtype, int],
+            List[Tuple[torch.Tensor, Optional[torch.cuda.Event]]],
+        ] = OrderedDict()
+        self._in_use = WeakValueDictionary()
+        self._stats = BufferPoolStats()
+        self._lock = Lock()
+
+    @property
+    def device(self) -> torch.device:
+        return self._device
+
+    @property
+    def pin_memory(self) -> bool:
+        return self._pin_memory
+
+    @property
+    def stats(self) -> BufferPoolStats:
+        """
+        Snapshot of the pool's counters.
+        """
+        with self._lock:
+            return replace(self._stats, in_use=len(self._in_use))
+
+    def acquire(self, shape: Sequence[int], dtype: torch.dtype) -> torch.Tensor:
+        """
+        Retrieve an uninitialized tensor from the pool.
+        :param shape: The shape of the tensor
+        :param dtype: The data type of the tensor
+        :return: `torch.Tensor` of shape `shape`, to be given back through `release` once not needed anymore
+        """
+        key = (dtype, size_class(prod(shape), self._min_numel))
+
+        with self._lock:
+            if free := self._free.get(key, None):
+                buffer, event = free.pop()
+                if not free:
+                    del self._free[key]
+
+                self._stats.hits += 1
+                self._stats.cached_bytes -= _nbytes(buffer)
+            else:
+                buffer, event = None, None
+                self._stats.misses += 1
+
+        # The buffer might still be read by an asynchronous copy
+        if event is not None:
+            event.synchronize()
+
+        if buffer is None:
+            buffer = torch.empty(
+                key[1], dtype=dtype, device=self._device, pin_memory=self._pin_memory
+            )
+
+        with self._lock:
+            self._in_use[buffer.data_ptr()] = buffer
+
+        return buffer[: prod(shape)].view(shape)
+
+    def release(self, tensor: torch.Tensor, event: Optional[torch.cuda.Event] = None):
+        """
+        Give back a tensor obtained through `acquire`, tensors not coming from the pool are ignored.
+        The tensor (and any of its views) must not be used anymore.
+        :param tensor: The tensor to give back
+        :param event: Event to wait on before handing out the buffer again, i.e. pending copy from this buffer
+        """
+        with self._lock:
+            if (buffer := self._in_use.pop(tensor.data_ptr(), None)) is None:
+                return
+
+            key = (buffer.dtype, buffer.numel())
+            self._free.setdefault(key, []).append((buffer, event))
+            self._free.move_to_end(key)
+            self._stats.cached_bytes += _nbytes(buffer)
+
+            if self._stats.cached_bytes > self._max_cached_bytes:
+                self._trim(self._max_cached_bytes)
+
+    def trim(self, max_cached_bytes: int = 0) -> int:
+        """
+        Drop the least recently used free buffers until the pool holds at most `max_cached_bytes`.
+        :param max_cached_bytes: The amount of memory the free buffers may use once trimmed
+        :return: The number of bytes freed
+        """
+        with self._lock:
+            return self._trim(max_cached_bytes)
+
+    def clear(self):
+        """
+        Drop all the free buffers and reset the counters.
+        """
+        with self._lock:
+            self._free.clear()
+            self._stats = BufferPoolStats()
+
+    def _trim(self, max_cached_bytes: int) -> int:
+        freed = 0
+        while self._free and self._stats.cached_bytes > max_cached_bytes:
+            key, free = next(iter(self._free.items()))
+            buffer, event = free.pop(0)
+            if not free:
+                del self._free[key]
+
+            if event is not None:
+                event.synchronize()
+
+            freed += _nbytes(buffer)
+            self._stats.cached_bytes -= _nbytes(buffer)
+            self._stats.evictions += 1
+
+        if freed:
+            LOGGER.debug(f"Trimmed {freed} bytes from the {self._device} buffer pool")
+
+        return freed
+
+
+def _nbytes(tensor: torch.Tensor) -> int:
+    return tensor.numel() * tensor.element_size()
@@ -0,0 +1,361 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from hashlib import sha256
+from logging import getLogger
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple
+from weakref import WeakKeyDictionary
+
+from transformers import PreTrainedTokenizerBase
+
+
+LOGGER = getLogger(__name__)
+
+DEFAULT_TOKENIZATION_CACHE_SIZE_BYTES = 32 * 1024 * 1024
+DEFAULT_MAX_PREFIXES = 64
+
+# Number of trailing tokens of a prefix tokenized again along with the suffix, letting merges across the boundary
+# between the prefix and the suffix happen as if the whole text was tokenized at once
+PREFIX_BOUNDARY_TOKENS = 2
+
+_FINGERPRINTS: WeakKeyDictionary = WeakKeyDictionary()
+
+
+def get_tokenizer_fingerprint(tokenizer: PreTrainedTokenizerBase) -> str:
+    """
+    Compute a digest identifying the tokenization performed by `tokenizer`.
+    Fast tokenizers are identified by their serialized definition, other ones by their name, vocabulary and
+    added tokens.
+    """
+    if (fingerprint := _FINGERPRINTS.get(tokenizer, None)) is not None:
+        return fingerprint
+
+    digest = sha256(type(tokenizer).__name__.encode("utf-8"))
+    if getattr(tokenizer, "is_fast", False):
+        digest.update(tokenizer.backend_tokenizer.to_str().encode("utf-8"))
+    else:
+        digest.update(str(tokenizer.name_or_path).encode("utf-8"))
+        digest.update(str(len(tokenizer)).encode("utf-8"))
+        digest.update(str(sorted(tokenizer.get_added_vocab().items())).encode("utf-8"))
+
+    fingerprint = digest.hexdigest()
+    _FINGERPRINTS[tokenizer] = fingerprint
+    return fingerprint
+
+
+@dataclass
+class TokenizationCacheStats:
+    hits: int = 0
+    misses: int = 0
+    prefix_hits: int = 0
+    prefix_fallbacks: int = 0
+    evictions: int = 0
+    size_bytes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        requests = self.hits + self.misses
+        return self.hits / requests if requests else 0.0
+
+
+class TokenizationCache:
+    """
+    Least-recently-used cache of tokenization results, keyed by (tokenizer fingerprint, text, add_special_tokens)
+    and bounded by an (approximate) byte budget.
+
+    In prefix-aware mode, texts starting with a registered prefix (see `add_prefix`) are not tokenized entirely:
+    the tokens of the prefix are retrieved from the cache and only the suffix, along with the last
+    `PREFIX_BOUNDARY_TOKENS` tokens of the prefix, is tokenized. If the tokens at the boundary don't line up with the
+    ones of the prefix, the text is tokenized entirely. This mode requires fast tokenizers (offsets mapping).
+    At most `max_prefixes` prefixes are registered, the least recently used ones are dropped first.
+    """
+
+    __slots__ = (
+        "_max_size_bytes",
+        "_max_prefixes",
+        "_prefix_aware",
+        "_entries",
+        "_prefixes",
+        "_special_tokens",
+        "_stats",
+        "_lock",
+    )
+
+    def __init__(
+        self,
+        max_size_bytes: int = DEFAULT_TOKENIZATION_CACHE_SIZE_BYTES,
+        prefix_aware: bool = False,
+        max_prefixes: int = DEFAULT_MAX_PREFIXES,
+    ):
+        if max_size_bytes < 0:
+            raise ValueError(f"max_size_bytes should be >= 0 (got: {max_size_bytes})")
+
+        if max_prefixes < 1:
+            raise ValueError(f"max_prefixes should be >= 1 (got: {max_prefixes})")
+
+        self._max_size_bytes = max_size_bytes
+        self._max_prefixes = max_prefixes
+        self._prefix_aware = prefix_aware
+        self._entries: OrderedDict[Tuple, Tuple] = OrderedDict()
+        self._prefixes: OrderedDict[str, None] = OrderedDict()
+        self._special_tokens: Dict[str, Tuple[Tuple[int, ...], Tuple[int, ...]]] = {}
+        self._stats = TokenizationCacheStats()
+        self._lock = Lock()
+
+    @property
+    def prefix_aware(self) -> bool:
+        return self._prefix_aware
+
+    @property
+    def stats(self) -> TokenizationCacheStats:
+        """
+        Snapshot of the cache's counters.
+        """
+        with self._lock:
+            return replace(self._stats)
+
+    def add_prefix(self, prefix: str):
+        """
+        Register `prefix` as a prefix shared by many texts (i.e. system prompt, few-shot examples).
+        """
+        if not prefix:
+            return
+
+        with self._lock:
+            if prefix in self._prefixes:
+                self._prefixes.move_to_end(prefix)
+                return
+
+            self._prefixes[prefix] = None
+            if len(self._prefixes) > self._max_prefixes:
+                self._prefixes.popitem(last=False)
+
+    def clear(self):
+        """
+        Drop all the cached entries and reset the counters, registered prefixes are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._stats = TokenizationCacheStats()
+
+    def encode(
+        self,
+        tokenizer: PreTrainedTokenizerBase,
+        text: str,
+        add_special_tokens: bool = False,
+    ) -> List[int]:
+        """
+        Tokenize a single text, see `encode_batch`.
+        """
+        return self.encode_batch(tokenizer, [text], add_special_tokens)[0]
+
+    def encode_batch(
+        self,
+        tokenizer: PreTrainedTokenizerBase,
+        texts: Sequence[str],
+        add_special_tokens: bool = False,
+    ) -> List[List[int]]:
+        """
+        Tokenize `texts`, only the texts not found in the cache are sent to the tokenizer, in a single call.
+        :param tokenizer: The tokenizer to use
+        :param texts: The texts to tokenize
+        :param add_special_tokens: Whether to add the special tokens (i.e. BOS) the tokenizer is configured with
+        :return: The token ids of each text
+        """
+        fingerprint = get_tokenizer_fingerprint(tokenizer)
+        keys = [(fingerprint, text, add_special_tokens) for text in texts]
+        results: List[Optional[Tuple[int, ...]]] = [None] * len(texts)
+
+        with self._lock:
+            for index, key in enumerate(keys):
+                if (ids := self._entries.get(key, None)) is not None:
+                    self._entries.move_to_end(key)
+                    results[index] = ids
+
+        misses = [index for index, ids in enumerate(results) if ids is None]
+        with self._lock:
+            self._stats.hits += len(texts) - len(misses)
+            self._stats.misses += len(misses)
+
+        if misses and self._prefix_aware and self._prefixes:
+            misses = self._encode_with_prefixes(
+                tokenizer, texts, add_special_tokens, misses, results
+            )
+
+        if misses:
+            encodings = tokenizer(
+                [texts[index] for index in misses],
+                add_special_tokens=add_special_tokens,
+                return_attention_mask=False,
+            )["input_ids"]
+            for index, ids in zip(misses, encodings):
+                results[index] = tuple(ids)
+
+        with self._lock:
+            for key, ids in zip(keys, results):
+                if key not in self._entries:
+                    self._insert(key, ids)
+
+        return [list(ids) for ids in results]
+
+    def _encode_with_prefixes(
+        self,
+        tokenizer: PreTrainedTokenizerBase,
+        texts: Sequence[str],
+        add_special_tokens: bool,
+        misses: List[int],
+        results: List[Optional[Tuple[int, ...]]],
+    ) -> List[int]:
+        if not getattr(tokenizer, "is_fast", False):
+            return misses
+
+        with self._lock:
+            registered = sorted(self._prefixes, key=len, reverse=True)
+
+        # Longest registered prefix of each text
+        matches = {}
+        for index in misses:
+            for prefix in registered:
+                if len(texts[index]) > len(prefix) and texts[index].startswith(prefix):
+                    matches[index] = prefix
+                    break
+
+        if not matches:
+            return misses
+
+        with self._lock:
+            for prefix in set(matches.values()):
+                if prefix in self._prefixes:
+                    self._prefixes.move_to_end(prefix)
+
+        # Tokens of the prefixes, without special tokens, and start offset of each token
+        prefixes = {
+            prefix: self._get_prefix(tokenizer, prefix)
+            for prefix in set(matches.values())
+        }
+
+        tails, candidates = [], []
+        for index, prefix in matches.items():
+            ids, starts = prefixes[prefix]
+            if len(ids) > PREFIX_BOUNDARY_TOKENS:
+                tails.append(texts[index][starts[-PREFIX_BOUNDARY_TOKENS] :])
+                candidates.append(index)
+
+        if not candidates:
+            return misses
+
+        leading, trailing = (
+            self._get_special_tokens(tokenizer) if add_special_tokens else ((), ())
+        )
+        encodings = tokenizer(
+            tails, add_special_tokens=False, return_attention_mask=False
+        )["input_ids"]
+
+        fallbacks = 0
+        for index, tail_ids in zip(candidates, encodings):
+            ids, _ = prefixes[matches[index]]
+
+            # Tokenization of the suffix realigned with the one of the prefix
+            if tail_ids[0] == ids[-PREFIX_BOUNDARY_TOKENS]:
+                results[index] = (
+                    leading + ids[:-PREFIX_BOUNDARY_TOKENS] + tuple(tail_ids) + trailing
+                )
+            else:
+                fallbacks += 1
+
+        with self._lock:
+            self._stats.prefix_hits += len(candidates) - fallbacks
+            self._stats.prefix_fallbacks += fallbacks
+
+        return [index for index in misses if results[index] is None]
+
+    def _get_prefix(
+        self, tokenizer: PreTrainedTokenizerBase, prefix: str
+    ) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+        key = (get_tokenizer_fingerprint(tokenizer), prefix, None)
+
+        with self._lock:
+            if (entry := self._entries.get(key, None)) is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        encoding = tokenizer(
+            prefix,
+            add_special_tokens=False,
+            return_attention_mask=False,
+            return_offsets_mapping=True,
+        )
+        entry = (
+            tuple(encoding["input_ids"]),
+            tuple(start for start, _ in encoding["offset_mapping"]),
+        )
+
+        with self._lock:
+            self._insert(key, entry)
+
+        return entry
+
+    def _get_special_tokens(
+        self, tokenizer: PreTrainedTokenizerBase
+    ) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+        """
+        Special tokens added before and after the text when calling the tokenizer with `add_special_tokens=True`.
+        """
+        fingerprint = get_tokenizer_fingerprint(tokenizer)
+        if (special_tokens := self._special_tokens.get(fingerprint, None)) is None:
+            with_special = tokenizer("a", add_special_tokens=True)["input_ids"]
+            without_special = tokenizer("a", add_special_tokens=False)["input_ids"]
+
+            for start in range(len(with_special) - len(without_special) + 1):
+                if (
+                    with_special[start : start + len(without_special)]
+                    == without_special
+                ):
+                    break
+            else:
+                raise ValueError(
+                    "Unable to locate special tokens added by the tokenizer"
+                )
+
+            special_tokens = (
+                tuple(with_special[:start]),
+                tuple(with_special[start + len(without_special) :]),
+            )
+            self._special_tokens[fingerprint] = special_tokens
+
+        return special_tokens
+
+    def _insert(self, key: Tuple, value: Tuple):
+        if (size_bytes := self._entry_size(key, value)) > self._max_size_bytes:
+            return
+
+        self._entries[key] = value
+        self._stats.size_bytes += size_bytes
+
+        while self._stats.size_bytes > self._max_size_bytes:
+            evicted_key, evicted = self._entries.popitem(last=False)
+            self._stats.size_bytes -= self._entry_size(evicted_key, evicted)
+            self._stats.evictions += 1
+
+    @staticmethod
+    def _entry_size(key: Tuple, value: Tuple) -> int:
+        # Prefixes (identified by a None add_special_tokens) hold both ids and offsets
+        if key[2] is None:
+            return len(key[1]) + 8 * len(value[0])
+        return len(key[1]) + 4 * len(value)
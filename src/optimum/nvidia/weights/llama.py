@@ -0,0 +1,231 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from copy import deepcopy
+from logging import getLogger
+from pathlib import Path
+from typing import Any, List
+
+import torch
+
+from optimum.nvidia.lang import DataType
+from optimum.nvidia.weights.safetensors import (
+    SafetensorsCheckpoint,
+    SafetensorsWriter,
+)
+
+
+LOGGER = getLogger(__name__)
+
+
+def split(tensor: torch.Tensor, tp_size: int, tp_rank: int, dim: int = 0):
+    """
+    Retrieve the slice of `tensor` owned by the tensor-parallel rank `tp_rank`.
+    :param tensor: The tensor to split
+    :param tp_size: The number of tensor-parallel ranks
+    :param tp_rank: The tensor-parallel rank
+    :param dim: The dimension along which the tensor is split
+    :return: The (contiguous) slice of the tensor
+    """
+    if tp_size == 1:
+        return tensor
+
+    if tensor.shape[dim] % tp_size != 0:
+        raise ValueError(
+            f"Unable to split dimension {dim} of tensor with shape {tuple(tensor.shape)} in {tp_size} ranks"
+        )
+
+    return torch.chunk(tensor, tp_size, dim=dim)[tp_rank].contiguous()
+
+
+def pad_vocab(tensor: torch.Tensor, tp_size: int) -> torch.Tensor:
+    """
+    Pad the vocabulary dimension (0) of `tensor` to a multiple of `tp_size`.
+    """
+    if (padding := -tensor.shape[0] % tp_size) == 0:
+        return tensor
+
+    return torch.nn.functional.pad(tensor, (0, 0, 0, padding))
+
+
+def fuse_qkv(
+    q: torch.Tensor,
+    k: torch.Tensor,
+    v: torch.Tensor,
+    num_kv_heads: int,
+    tp_size: int,
+    tp_rank: int,
+) -> torch.Tensor:
+    """
+    Fuse the query, key and value projections of the rank `tp_rank` in a single QKV projection.
+    Key and value heads are replicated when there are fewer of them than tensor-parallel ranks.
+    """
+    if num_kv_heads < tp_size:
+        head_size = k.shape[0] // num_kv_heads
+        replicas = tp_size // num_kv_heads
+
+        k = k.reshape(num_kv_heads, head_size, -1).repeat_interleave(replicas, dim=0)
+        v = v.reshape(num_kv_heads, head_size, -1).repeat_interleave(replicas, dim=0)
+        k, v = k.reshape(tp_size * head_size, -1), v.reshape(tp_size * head_size, -1)
+
+    return torch.cat(
+        [
+            split(q, tp_size, tp_rank),
+            split(k, tp_size, tp_rank),
+            split(v, tp_size, tp_rank),
+        ],
+        dim=0,
+    )
+
+
+def convert_llama_checkpoint(
+    checkpoint: SafetensorsCheckpoint, config: Any, output_folder: Path
+) -> List[Path]:
+    """
+    Convert a Llama-like (Llama, Mistral) transformers checkpoint to TRTLLM ranked-checkpoints, without loading
+    the whole model in memory.
+
+    Layers are processed one after the other: the source tensors of a layer are read from the memory-mapped shards,
+    fused (QKV) and sliced (tensor-parallelism), then appended to the checkpoint of every rank owning the layer.
+    Peak host memory usage is thus bounded by the size of a couple of layers rather than the size of the model.
+    :param checkpoint: The original transformers checkpoint
+    :param config: The TRTLLM config describing the model and its sharding
+    :param output_folder: Folder where to write the rank{N}.safetensors files
+    :return: The paths of the ranked-checkpoints
+    """
+    dtype = DataType(config.dtype).to_torch()
+    world_size = config.mapping.world_size
+
+    # Retrieve the mapping (tp/pp ranks) of each rank
+    mappings = []
+    for rank in range(world_size):
+        rank_config = deepcopy(config)
+        rank_config.set_rank(rank)
+        mappings.append(rank_config.mapping)
+
+    def _get(name: str) -> torch.Tensor:
+        return checkpoint.get_tensor(name).to(dtype)
+
+    writers = [
+        SafetensorsWriter(output_folder / f"rank{rank}.safetensors")
+        for rank in range(world_size)
+    ]
+
+    try:
+        # Embeddings live on the first pipeline stage
+        embedding = _get("model.embed_tokens.weight")
+        for mapping, writer in zip(mappings, writers):
+            if mapping.is_first_pp_rank():
+                if config.use_parallel_embedding:
+                    weight = split(
+                        pad_vocab(embedding, mapping.tp_size)
+                        if config.embedding_sharding_dim == 0
+                        else embedding,
+                        mapping.tp_size,
+                        mapping.tp_rank,
+                        config.embedding_sharding_dim,
+                    )
+                else:
+                    weight = embedding
+                writer.write("transformer.vocab_embedding.weight", weight)
+
+        del embedding
+
+        # Transformer layers
+        num_kv_heads = config.num_key_value_heads
+        layers_per_rank = [
+            list(mapping.pp_layers(config.num_hidden_layers)) for mapping in mappings
+        ]
+
+        for layer in range(config.num_hidden_layers):
+            LOGGER.debug(f"Converting layer {layer}/{config.num_hidden_layers}")
+
+            prefix = f"model.layers.{layer}"
+            weights = {
+                name: _get(f"{prefix}.{name}.weight")
+                for name in (
+                    "input_layernorm",
+                    "post_attention_layernorm",
+                    "self_attn.q_proj",
+                    "self_attn.k_proj",
+                    "self_attn.v_proj",
+                    "self_attn.o_proj",
+                    "mlp.gate_proj",
+                    "mlp.up_proj",
+                    "mlp.down_proj",
+                )
+            }
+
+            for mapping, writer, layers in zip(mappings, writers, layers_per_rank):
+                if layer not in layers:
+                    continue
+
+                tp_size, tp_rank = mapping.tp_size, mapping.tp_rank
+                converted = {
+                    "input_layernorm.weight": weights["input_layernorm"],
+                    "post_layernorm.weight": weights["post_attention_layernorm"],
+                    "attention.qkv.weight": fuse_qkv(
+                        weights["self_attn.q_proj"],
+                        weights["self_attn.k_proj"],
+                        weights["self_attn.v_proj"],
+                        num_kv_heads,
+                        tp_size,
+                        tp_rank,
+                    ),
+                    "attention.dense.weight": split(
+                        weights["self_attn.o_proj"], tp_size, tp_rank, dim=1
+                    ),
+                    "mlp.fc.weight": split(weights["mlp.gate_proj"], tp_size, tp_rank),
+                    "mlp.gate.weight": split(weights["mlp.up_proj"], tp_size, tp_rank),
+                    "mlp.proj.weight": split(
+                        weights["mlp.down_proj"], tp_size, tp_rank, dim=1
+                    ),
+                }
+
+                local_layer = layers.index(layer)
+                for name, tensor in converted.items():
+                    writer.write(f"transformer.layers.{local_layer}.{name}", tensor)
+
+            # Release the layer before reading the next one
+            del weights
+
+        # Final norm and language modeling head live on the last pipeline stage
+        norm = _get("model.norm.weight")
+        lm_head = _get(
+            "lm_head.weight"
+            if "lm_head.weight" in checkpoint
+            else "model.embed_tokens.weight"  # Tied embeddings
+        )
+
+        for mapping, writer in zip(mappings, writers):
+            if mapping.is_last_pp_rank():
+                writer.write("transformer.ln_f.weight", norm)
+                writer.write(
+                    "lm_head.weight",
+                    split(
+                        pad_vocab(lm_head, mapping.tp_size),
+                        mapping.tp_size,
+                        mapping.tp_rank,
+                    ),
+                )
+    except Exception:
+        for writer in writers:
+            writer.abort()
+        raise
+
+    for writer in writers:
+        writer.close()
+
+    return [writer.path for writer in writers]
@@ -0,0 +1,192 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+import os
+import shutil
+import struct
+from logging import getLogger
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import torch
+from safetensors import safe_open
+from transformers.utils import SAFE_WEIGHTS_INDEX_NAME, SAFE_WEIGHTS_NAME
+
+
+LOGGER = getLogger(__name__)
+
+# Data section of safetensors files must be aligned on 8 bytes
+SAFETENSORS_HEADER_ALIGNMENT = 8
+
+SAFETENSORS_DTYPES = {
+    torch.float64: "F64",
+    torch.float32: "F32",
+    torch.float16: "F16",
+    torch.bfloat16: "BF16",
+    torch.float8_e4m3fn: "F8_E4M3",
+    torch.float8_e5m2: "F8_E5M2",
+    torch.int64: "I64",
+    torch.int32: "I32",
+    torch.int16: "I16",
+    torch.int8: "I8",
+    torch.uint8: "U8",
+    torch.bool: "BOOL",
+}
+
+
+class SafetensorsCheckpoint:
+    """
+    Lazy view over a (potentially sharded) safetensors checkpoint.
+
+    Shards are memory-mapped and tensors are only materialized when requested through `get_tensor`, allowing to
+    process checkpoints much larger than the available host memory.
+    """
+
+    __slots__ = ("_root", "_weight_map", "_handles")
+
+    @staticmethod
+    def exists(root: Union[str, os.PathLike]) -> bool:
+        """
+        Check whether a safetensors checkpoint is stored at `root`
+        """
+        root = Path(root)
+        return (root / SAFE_WEIGHTS_INDEX_NAME).exists() or (
+            root / SAFE_WEIGHTS_NAME
+        ).exists()
+
+    def __init__(self, root: Union[str, os.PathLike]):
+        self._root = Path(root)
+
+        if (index_path := self._root / SAFE_WEIGHTS_INDEX_NAME).exists():
+            with open(index_path, "r") as index_f:
+                self._weight_map: Dict[str, str] = json.load(index_f)["weight_map"]
+        elif (self._root / SAFE_WEIGHTS_NAME).exists():
+            with safe_open(self._root / SAFE_WEIGHTS_NAME, framework="pt") as shard:
+                self._weight_map = dict.fromkeys(shard.keys(), SAFE_WEIGHTS_NAME)
+        else:
+            raise ValueError(f"No safetensors checkpoint found at {self._root}")
+
+        self._handles = {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._weight_map
+
+    def keys(self) -> List[str]:
+        return list(self._weight_map.keys())
+
+    def get_tensor(self, name: str) -> torch.Tensor:
+        """
+        Materialize the tensor `name` from the shard it belongs to.
+        :param name: The name of the tensor in the original checkpoint
+        :return: `torch.Tensor` on CPU
+        """
+        if name not in self._weight_map:
+            raise KeyError(f"Tensor {name} not found in checkpoint {self._root}")
+
+        filename = self._weight_map[name]
+        if (handle := self._handles.get(filename, None)) is None:
+            LOGGER.debug(f"Memory-mapping shard {self._root / filename}")
+            handle = safe_open(self._root / filename, framework="pt")
+            self._handles[filename] = handle
+
+        return handle.get_tensor(name)
+
+
+class SafetensorsWriter:
+    """
+    Write a safetensors file incrementally, one tensor at a time.
+
+    The safetensors header, which describes all the tensors, has to be located at the beginning of the file.
+    Tensors' data are first appended to a temporary file and the final file is assembled when closing the writer,
+    so only a single tensor has to be kept in memory at a time.
+    """
+
+    __slots__ = ("_path", "_data_path", "_data_f", "_header", "_offset")
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        self._path = Path(path)
+        self._data_path = self._path.with_name(f".{self._path.name}.data")
+        self._data_f = open(self._data_path, "wb")
+        self._header: Dict[str, Dict] = {}
+        self._offset = 0
+
+    def __enter__(self) -> "SafetensorsWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def write(self, name: str, tensor: torch.Tensor):
+        """
+        Append `tensor` to the file.
+        :param name: The name of the tensor in the safetensors file
+        :param tensor: The tensor to write
+        """
+        if name in self._header:
+            raise ValueError(f"Tensor {name} was already written to {self._path}")
+
+        if tensor.dtype not in SAFETENSORS_DTYPES:
+            raise ValueError(f"Unsupported dtype {tensor.dtype} for tensor {name}")
+
+        data = tensor.detach().cpu().contiguous().reshape(-1).view(torch.uint8)
+        num_bytes = data.numel()
+
+        self._data_f.write(data.numpy().data)
+        self._header[name] = {
+            "dtype": SAFETENSORS_DTYPES[tensor.dtype],
+            "shape": list(tensor.shape),
+            "data_offsets": [self._offset, self._offset + num_bytes],
+        }
+        self._offset += num_bytes
+
+    def close(self, metadata: Optional[Dict[str, str]] = None):
+        """
+        Assemble the final safetensors file from the header and the data written so far.
+        :param metadata: Optional metadata to include in the header
+        """
+        if self._data_f.closed:
+            return
+
+        self._data_f.close()
+
+        header = dict(self._header)
+        if metadata:
+            header["__metadata__"] = metadata
+
+        header = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        header += b" " * (-len(header) % SAFETENSORS_HEADER_ALIGNMENT)
+
+        try:
+            with open(self._path, "wb") as out_f, open(self._data_path, "rb") as data_f:
+                out_f.write(struct.pack("<Q", len(header)))
+                out_f.write(header)
+                shutil.copyfileobj(data_f, out_f)
+        finally:
+            self._data_path.unlink(missing_ok=True)
+
+    def abort(self):
+        """
+        Discard everything written so far.
+        """
+        self._data_f.close()
+        self._data_path.unlink(missing_ok=True)
@@ -0,0 +1,200 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import asyncio
+import time
+
+import pytest
+
+from optimum.nvidia.pipelines import AsyncTextGenerationPipeline
+
+
+class FakePipeline:
+    def __init__(self, max_batch_size: int):
+        self.max_batch_size = max_batch_size
+        self.calls = []
+        self.failures = 0
+        self.delay = 0.0
+
+    def __call__(self, prompts, **kwargs):
+        if kwargs.get("fail", False) or "out-of-memory" in prompts:
+            self.failures += 1
+            raise RuntimeError("engine failure")
+
+        if "too-long" in prompts:
+            raise ValueError("prompt is too long")
+
+        time.sleep(self.delay)
+
+        self.calls.append((list(prompts), kwargs))
+
+        temperature = kwargs.get("temperature", 1.0)
+        if not isinstance(temperature, list):
+            temperature = [temperature] * len(prompts)
+
+        return [
+            {"generated_text": f"{prompt}|{prompt_temperature}"}
+            for prompt, prompt_temperature in zip(prompts, temperature)
+        ]
+
+
+def _run(pipe: AsyncTextGenerationPipeline, requests):
+    async def _gather():
+        try:
+            return await asyncio.gather(
+                *(pipe(prompt, **params) for prompt, params in requests),
+                return_exceptions=True,
+            )
+        finally:
+            await pipe.close()
+
+    return asyncio.run(_gather())
+
+
+def test_async_pipeline_coalesces_requests():
+    fake = FakePipeline(max_batch_size=4)
+    pipe = AsyncTextGenerationPipeline(fake, max_wait_ms=50)
+
+    outputs = _run(pipe, [(f"prompt-{i}", {}) for i in range(6)])
+
+    assert [output["generated_text"] for output in outputs] == [
+        f"prompt-{i}|1.0" for i in range(6)
+    ]
+    assert [len(prompts) for prompts, _ in fake.calls] == [4, 2]
+
+
+def test_async_pipeline_preserves_parameters():
+    fake = FakePipeline(max_batch_size=8)
+    pipe = AsyncTextGenerationPipeline(fake, max_wait_ms=50)
+
+    requests = [
+        ("a", {"temperature": 0.5, "max_new_tokens": 8}),
+        ("b", {"max_new_tokens": 8}),
+        ("c", {"temperature": 0.5, "max_new_tokens": 4}),
+    ]
+    outputs = _run(pipe, requests)
+
+    assert [output["generated_text"] for output in outputs] == [
+        "a|0.5",
+        "b|1.0",
+        "c|0.5",
+    ]
+    assert sorted(prompts for prompts, _ in fake.calls) == [["a", "b"], ["c"]]
+
+
+def test_async_pipeline_batches_sampling_parameters():
+    fake = FakePipeline(max_batch_size=8)
+    pipe = AsyncTextGenerationPipeline(fake, max_wait_ms=50)
+
+    requests = [
+        ("a", {"temperature": 0.5, "seed": 1}),
+        ("b", {}),
+        ("c", {"temperature": 0.7}),
+    ]
+    outputs = _run(pipe, requests)
+
+    assert [output["generated_text"] for output in outputs] == [
+        "a|0.5",
+        "b|1.0",
+        "c|0.7",
+    ]
+
+    # Requests only differing by their sampling parameters share a single engine call
+    assert len(fake.calls) == 1
+    prompts, params = fake.calls[0]
+    assert prompts == ["a", "b", "c"]
+    assert params == {"temperature": [0.5, 1.0, 0.7], "seed": [1, 2017, 2017]}
+
+
+def test_async_pipeline_forwards_errors():
+    fake = FakePipeline(max_batch_size=2)
+    pipe = AsyncTextGenerationPipeline(fake, max_wait_ms=50)
+
+    outputs = _run(pipe, [("a", {"fail": True}), ("b", {})])
+
+    assert isinstance(outputs[0], RuntimeError)
+    assert outputs[1]["generated_text"] == "b|1.0"
+
+
+def test_async_pipeline_isolates_invalid_requests():
+    fake = FakePipeline(max_batch_size=4)
+    pipe = AsyncTextGenerationPipeline(fake, max_wait_ms=50)
+
+    outputs = _run(pipe, [("a", {}), ("too-long", {}), ("b", {})])
+
+    assert outputs[0]["generated_text"] == "a|1.0"
+    assert isinstance(outputs[1], ValueError)
+    assert outputs[2]["generated_text"] == "b|1.0"
+
+
+def test_async_pipeline_does_not_retry_engine_failures():
+    fake = FakePipeline(max_batch_size=4)
+    pipe = AsyncTextGenerationPipeline(fake, max_wait_ms=50)
+
+    outputs = _run(pipe, [("a", {}), ("out-of-memory", {}), ("b", {})])
+
+    assert all(isinstance(output, RuntimeError) for output in outputs)
+    assert fake.failures == 1
+
+
+def test_async_pipeline_close_cancels_pending_requests():
+    fake = FakePipeline(max_batch_size=1)
+    fake.delay = 0.2
+    pipe = AsyncTextGenerationPipeline(fake, max_wait_ms=0)
+
+    async def _close_while_generating():
+        tasks = [asyncio.ensure_future(pipe(f"prompt-{i}")) for i in range(3)]
+
+        # Let the first request reach the engine, the others stay queued
+        await asyncio.sleep(0.05)
+
+        # Waiting for the engine call in flight doesn't block the event loop
+        ticks = 0
+
+        async def _tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.ensure_future(_tick())
+        await pipe.close()
+        ticker.cancel()
+        assert ticks > 1
+
+        outputs = await asyncio.wait_for(
+            asyncio.gather(*tasks, return_exceptions=True), timeout=5
+        )
+
+        with pytest.raises(RuntimeError):
+            await pipe("late")
+
+        return outputs
+
+    outputs = asyncio.run(_close_while_generating())
+    assert all(isinstance(output, asyncio.CancelledError) for output in outputs)
+
+
+def test_async_pipeline_validation():
+    with pytest.raises(ValueError):
+        AsyncTextGenerationPipeline(FakePipeline(2), max_batch_size=0)
+
+    with pytest.raises(ValueError):
+        AsyncTextGenerationPipeline(FakePipeline(2), max_wait_ms=-1)
+
+    assert (
+        AsyncTextGenerationPipeline(FakePipeline(2), max_batch_size=8).max_batch_size
+        == 2
+    )
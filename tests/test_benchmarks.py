@@ -0,0 +1,168 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import asyncio
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch
+from transformers import BatchEncoding
+
+from optimum.nvidia.benchmarks import (
+    BenchmarkRequest,
+    CausalLMBackend,
+    RequestMetrics,
+    ServiceLevelObjective,
+    SimulatedBackend,
+    TransformersBackend,
+    create_workload,
+    poisson_arrivals,
+    run_benchmark,
+    sample_output_lengths,
+    sample_prompts_from_dataset,
+    summarize,
+    workload_from_trace,
+)
+from optimum.nvidia.generation.streaming import TokenStream
+
+
+def test_poisson_arrivals():
+    arrivals = poisson_arrivals(100.0, 2000, seed=0)
+
+    assert arrivals[0] == 0.0
+    assert np.all(np.diff(arrivals) >= 0)
+    assert np.mean(np.diff(arrivals)) == pytest.approx(0.01, rel=0.1)
+    assert np.all(poisson_arrivals(float("inf"), 4) == 0.0)
+
+    with pytest.raises(ValueError):
+        poisson_arrivals(0, 4)
+
+
+def test_workload_from_dataset_and_trace(tmp_path: Path):
+    texts = ["short", "a b c d e f", "one two three four five six seven eight"] * 4
+    prompts = sample_prompts_from_dataset(texts, 6, min_length=4, max_length=6, seed=0)
+
+    assert len(prompts) == 6
+    assert all(4 <= len(prompt.split()) <= 6 for prompt in prompts)
+
+    lengths = sample_output_lengths(1000, 32, 8, max_length=40, seed=0)
+    assert max(lengths) <= 40 and min(lengths) >= 1
+
+    with open(tmp_path / "trace.jsonl", "w") as trace_f:
+        for timestamp, length in [(12.0, 3), (10.0, 5)]:
+            trace_f.write(
+                json.dumps(
+                    {
+                        "timestamp": timestamp,
+                        "prompt_length": 7,
+                        "output_length": length,
+                    }
+                )
+                + "\n"
+            )
+
+    requests = workload_from_trace(tmp_path / "trace.jsonl")
+    assert [(r.arrival, r.max_new_tokens) for r in requests] == [(0.0, 5), (2.0, 3)]
+    assert all(r.prompt_length == 7 for r in requests)
+
+
+def test_summarize_percentiles_and_goodput():
+    metrics = [
+        RequestMetrics(0.0, 4, [0.1, 0.2, 0.3], end=0.3),
+        RequestMetrics(0.0, 4, [0.5, 0.7, 0.9], end=0.9),
+        RequestMetrics(0.0, 4, error="failure", end=0.1),
+    ]
+
+    report = summarize("test", metrics, ServiceLevelObjective(ttft=0.2))
+
+    assert report.num_failed == 1
+    assert report.ttft["p50"] == pytest.approx(0.3)
+    assert report.inter_token_latency["mean"] == pytest.approx(0.15)
+    assert report.e2e_latency["p99"] == pytest.approx(0.894)
+    assert report.slo_attainment == pytest.approx(1 / 3)
+    assert report.goodput == pytest.approx(1 / 0.9)
+
+
+def test_run_benchmark_simulated_backend():
+    num_requests = 16
+    requests = create_workload(
+        ["hello world"] * num_requests,
+        8,
+        poisson_arrivals(200.0, num_requests, seed=0),
+    )
+    backend = SimulatedBackend(max_batch_size=4, decode_ms=1.0)
+
+    report = run_benchmark(backend, requests, ServiceLevelObjective(ttft=10.0))
+
+    assert report.num_requests == num_requests
+    assert report.num_failed == 0
+    assert report.slo_attainment == 1.0
+    assert report.output_token_throughput > 0
+    assert report.ttft["p50"] <= report.ttft["p99"] < report.e2e_latency["p99"]
+    assert report.inter_token_latency["p50"] >= 1e-3
+
+
+async def _consume(backend, request: BenchmarkRequest):
+    return [token_id async for token_id in backend.generate(request)]
+
+
+def test_causallm_backend_drains_stream():
+    streams = []
+
+    def _pipeline(prompt, stream, max_new_tokens):
+        token_stream = TokenStream()
+        for token_id in range(max_new_tokens):
+            token_stream.put(
+                {
+                    "token_id": token_id,
+                    "text": "",
+                    "finished": token_id == max_new_tokens - 1,
+                }
+            )
+
+        # The engine keeps stepping the batch after the request finished
+        token_stream.put({"token_id": None, "text": "", "finished": True})
+        token_stream.end()
+
+        streams.append(token_stream)
+        return token_stream
+
+    backend = CausalLMBackend(_pipeline)
+    request = BenchmarkRequest(0.0, "hello", 1, 3)
+
+    assert asyncio.run(_consume(backend, request)) == [0, 1, 2]
+    assert list(streams[0]) == []
+
+
+def test_transformers_backend_forwards_errors():
+    class _Tokenizer:
+        def __call__(self, prompt, return_tensors):
+            return BatchEncoding({"input_ids": torch.tensor([[1, 2]])})
+
+    class _Model:
+        device = "cpu"
+
+        def generate(self, input_ids, max_new_tokens, streamer):
+            streamer.put(input_ids)
+            streamer.put(torch.tensor([3]))
+            raise RuntimeError("out of memory")
+
+    backend = TransformersBackend(_Model(), _Tokenizer())
+    request = BenchmarkRequest(0.0, "hello", 2, 4)
+
+    with pytest.raises(RuntimeError, match="out of memory"):
+        asyncio.run(_consume(backend, request))
@@ -0,0 +1,103 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import pytest
+import torch
+
+from optimum.nvidia.utils.buffers import BufferPool, size_class
+
+
+@pytest.mark.parametrize(
+    "numel, expected",
+    [(1, 1), (5, 5), (9, 10), (17, 20), (100, 112), (1024, 1024), (1025, 1280)],
+)
+def test_size_class(numel, expected):
+    assert size_class(numel, min_numel=1) == expected
+
+
+def test_size_class_minimum():
+    assert size_class(3, min_numel=256) == 256
+
+
+def test_acquire_release():
+    pool = BufferPool()
+
+    tensor = pool.acquire((4, 8), torch.int32)
+    assert tensor.shape == (4, 8)
+    assert tensor.dtype == torch.int32
+    assert pool.stats.misses == 1
+    assert pool.stats.in_use == 1
+
+    pointer = tensor.data_ptr()
+    pool.release(tensor)
+    assert pool.stats.in_use == 0
+    assert pool.stats.cached_bytes == 256 * 4
+
+    # Same size class and dtype reuse the buffer
+    other = pool.acquire((16, 3), torch.int32)
+    assert other.data_ptr() == pointer
+    assert pool.stats.hits == 1
+    assert pool.stats.cached_bytes == 0
+
+    # Different dtype doesn't
+    pool.acquire((4, 8), torch.float32)
+    assert pool.stats.misses == 2
+    assert pool.stats.hit_rate == pytest.approx(1 / 3)
+
+
+def test_release_foreign_tensor():
+    pool = BufferPool()
+    pool.release(torch.empty(10))
+
+    assert pool.stats.cached_bytes == 0
+
+
+def test_unreleased_buffers_are_garbage_collected():
+    pool = BufferPool()
+    tensor = pool.acquire((10,), torch.int32)
+    assert pool.stats.in_use == 1
+
+    del tensor
+    assert pool.stats.in_use == 0
+
+
+def test_lru_trimming():
+    pool = BufferPool(max_cached_bytes=2 * 256 * 4, min_numel=256)
+
+    tensors = [pool.acquire((256 * (i + 1),), torch.int32) for i in range(3)]
+    for tensor in tensors:
+        pool.release(tensor)
+
+    # Least recently released buffers go first, a buffer larger than the budget isn't kept either
+    assert pool.stats.cached_bytes == 0
+    assert pool.stats.evictions == 3
+
+    pool = BufferPool(max_cached_bytes=1024 * 1024, min_numel=256)
+    tensors = [pool.acquire((256,), torch.int32) for _ in range(2)]
+    tensors.append(pool.acquire((512,), torch.float32))
+    oldest_pointer = tensors[0].data_ptr()
+    for tensor in tensors:
+        pool.release(tensor)
+
+    assert pool.trim(256 * 4 + 512 * 4) == 256 * 4
+    assert pool.stats.evictions == 1
+    assert pool.acquire((256,), torch.int32).data_ptr() != oldest_pointer
+    assert pool.trim() == 512 * 4
+
+
+def test_pin_memory_requires_host():
+    with pytest.raises(ValueError):
+        BufferPool("cuda", pin_memory=True)
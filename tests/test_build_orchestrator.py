@@ -0,0 +1,204 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import json
+import logging
+import stat
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+
+from optimum.nvidia.builder import LocalEngineBuilder
+from optimum.nvidia.builder.cache import EngineCache
+from optimum.nvidia.builder.config import (
+    EngineConfig,
+    EngineConfigBuilder,
+    GenerationProfile,
+    InferenceProfile,
+    ShardingProfile,
+)
+from optimum.nvidia.builder.local import CLI_PLUGIN_NAMES
+from optimum.nvidia.builder.manifest import read_engines_manifest
+from optimum.nvidia.builder.orchestrator import (
+    BuildJob,
+    BuildOrchestrator,
+    EngineBuildError,
+)
+
+
+STUB_TRTLLM_BUILD = """#!{python}
+import json, os, sys, time
+
+log = os.environ.get("STUB_LOG")
+if log:
+    with open(log, "a") as log_f:
+        log_f.write(json.dumps({{"argv": sys.argv[1:], "start": time.time()}}) + "\\n")
+
+print("building", " ".join(sys.argv[1:]), flush=True)
+time.sleep(float(os.environ.get("STUB_SLEEP", "0")))
+
+if "--fail" in sys.argv:
+    print("error: something went wrong", flush=True)
+    sys.exit(3)
+
+if "--output_dir" in sys.argv:
+    output_dir = sys.argv[sys.argv.index("--output_dir") + 1]
+    os.makedirs(output_dir, exist_ok=True)
+    open(os.path.join(output_dir, "rank0.engine"), "w").close()
+"""
+
+
+@pytest.fixture
+def stub(tmp_path: Path, monkeypatch) -> Path:
+    exe = tmp_path / "trtllm-build"
+    exe.write_text(STUB_TRTLLM_BUILD.format(python=sys.executable))
+    exe.chmod(exe.stat().st_mode | stat.S_IEXEC)
+
+    monkeypatch.setenv("STUB_LOG", str(tmp_path / "calls.jsonl"))
+    monkeypatch.setattr(LocalEngineBuilder, "TRTLLM_BUILD_EXEC", str(exe))
+    return exe
+
+
+def _calls(tmp_path: Path):
+    with open(tmp_path / "calls.jsonl") as log_f:
+        return [json.loads(line) for line in log_f]
+
+
+def test_orchestrator_streams_logs(stub: Path, caplog):
+    with caplog.at_level(logging.INFO):
+        results = BuildOrchestrator(2).run([BuildJob("job", [str(stub), "a"], 1)])
+
+    assert results[0].returncode == 0
+    assert results[0].output == ["building a"]
+    assert "[job] building a" in caplog.text
+
+
+def test_orchestrator_bounds_concurrency(stub: Path, tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("STUB_SLEEP", "0.5")
+
+    jobs = [BuildJob(f"job{i}", [str(stub), str(i)], 1) for i in range(4)]
+    results = BuildOrchestrator(2).run(jobs)
+
+    assert [result.job for result in results] == jobs
+    starts = sorted(call["start"] for call in _calls(tmp_path))
+
+    # Two waves of two jobs
+    assert starts[1] - starts[0] < 0.4
+    assert starts[2] - starts[0] >= 0.4
+
+
+def test_orchestrator_aggregates_failures(stub: Path):
+    jobs = [
+        BuildJob("ok", [str(stub)], 1),
+        BuildJob("ko", [str(stub), "--fail"], 1),
+        BuildJob("missing", ["/does/not/exist"], 1),
+    ]
+
+    with pytest.raises(EngineBuildError) as error:
+        BuildOrchestrator(4).run(jobs)
+
+    assert [failure.job.name for failure in error.value.failures] == ["ko", "missing"]
+    assert error.value.failures[0].returncode == 3
+    assert "error: something went wrong" in str(error.value)
+
+
+def _build_profiles(root: Path) -> List[Path]:
+    for rank in range(2):
+        (root / f"rank{rank}.safetensors").touch()
+
+    model_config = SimpleNamespace(
+        mapping=SimpleNamespace(world_size=2),
+        supports_strong_typing=lambda: False,
+    )
+
+    def _engine_config(max_batch_size: int) -> EngineConfig:
+        return EngineConfig(
+            optimisation_level=3,
+            strongly_typed=False,
+            logits_dtype="float32",
+            workload_profile=InferenceProfile(max_batch_size, 128, 128),
+            generation_profile=GenerationProfile(1, -1),
+            sharding_profile=ShardingProfile(tensor_parallelism=2, world_size=2),
+            plugins_config=SimpleNamespace(**dict.fromkeys(CLI_PLUGIN_NAMES)),
+        )
+
+    builder = LocalEngineBuilder(model_config, root, max_workers=4)
+    return builder.build_profiles({"bs1": _engine_config(1), "bs8": _engine_config(8)})
+
+
+def test_local_engine_builder_profiles(stub: Path, tmp_path: Path):
+    folders = _build_profiles(tmp_path)
+
+    assert folders == [tmp_path / "bs1", tmp_path / "bs8"]
+    assert all((folder / "rank0.engine").exists() for folder in folders)
+
+    # Engines of all the profiles are recorded to be loaded as a set
+    manifest = read_engines_manifest(tmp_path)
+    assert [entry.name for entry in manifest] == ["bs1", "bs8"]
+    assert [entry.path for entry in manifest] == folders
+    assert manifest[1].profile == InferenceProfile(8, 128, 128)
+
+    for call in _calls(tmp_path):
+        argv = call["argv"]
+        assert argv[argv.index("--checkpoint_dir") + 1] == str(tmp_path)
+        assert argv[argv.index("--workers") + 1] == "2"
+        assert argv[argv.index("--output_timing_cache") + 1].endswith("timing.cache")
+
+
+def test_engine_cache_stores_profiles(stub: Path, tmp_path: Path):
+    engines_folder = tmp_path / "engines"
+    engines_folder.mkdir()
+    _build_profiles(engines_folder)
+
+    cache = EngineCache(tmp_path / "cache")
+    cache.store("key", engines_folder)
+    entry = cache.lookup("key", tmp_path / "output")
+
+    # The engines of every profile are cached, and retrieved, along with the manifest pointing to them
+    manifest = read_engines_manifest(entry)
+    assert [profile.name for profile in manifest] == ["bs1", "bs8"]
+    assert all((profile.path / "rank0.engine").exists() for profile in manifest)
+    assert all(profile.path.is_relative_to(entry) for profile in manifest)
+    assert not list(entry.rglob("*.safetensors"))
+
+
+def test_engine_config_builder_profiles():
+    config = SimpleNamespace(max_position_embeddings=4096, torch_dtype="float16")
+    builder = EngineConfigBuilder.from_dict(
+        config,
+        max_batch_size=16,
+        max_prompt_length=256,
+        max_output_length=512,
+        inference_profiles=[
+            {"max_batch_size": 2, "max_prompt_length": 2048, "max_output_length": 4096}
+        ],
+    )
+    builder.with_plugins_config(SimpleNamespace())
+
+    # A single engine can't be built for several profiles
+    with pytest.raises(ValueError):
+        builder.build()
+
+    configs = builder.build_profiles()
+    assert list(configs.keys()) == ["bs16-in256-out256", "bs2-in2048-out2048"]
+    assert configs["bs2-in2048-out2048"].workload_profile == InferenceProfile(
+        2, 2048, 2048
+    )
+
+    with pytest.raises(ValueError):
+        builder.with_inference_profiles([(1, 4096, 1)])
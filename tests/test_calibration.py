@@ -0,0 +1,191 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import json
+
+import numpy as np
+import pytest
+import torch
+from datasets import Dataset
+from transformers import AutoTokenizer
+
+from optimum.nvidia.quantization.calibration import (
+    CalibrationCache,
+    CalibrationSet,
+    compute_calibration_cache_key,
+    get_calibration_dataset,
+    get_custom_calibration_dataset,
+    iter_texts,
+    pack_texts,
+    sample_documents,
+    sample_windows,
+)
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    return AutoTokenizer.from_pretrained("hf-internal-testing/llama-tokenizer")
+
+
+def test_calibration_set_roundtrip(tmp_path):
+    calibration_set = CalibrationSet.from_sequences([[1, 2, 3], [4], [5, 6]])
+
+    assert len(calibration_set) == 3
+    assert calibration_set.lengths.tolist() == [3, 1, 2]
+    assert calibration_set[-1]["input_ids"].tolist() == [5, 6]
+    assert calibration_set[0]["attention_mask"].tolist() == [1, 1, 1]
+    assert calibration_set[0]["input_ids"].dtype == torch.long
+
+    calibration_set.save(tmp_path)
+    loaded = CalibrationSet.load(tmp_path)
+
+    assert isinstance(loaded.ids, np.memmap)
+    assert [sample["input_ids"].tolist() for sample in loaded] == [
+        [1, 2, 3],
+        [4],
+        [5, 6],
+    ]
+
+    with pytest.raises(IndexError):
+        loaded[3]
+
+
+def test_sample_windows():
+    ids = np.arange(100, dtype=np.int32)
+    calibration_set = sample_windows(ids, 8, 16, np.random.default_rng(0))
+
+    assert len(calibration_set) == 16
+    for sample in calibration_set:
+        window = sample["input_ids"]
+        assert len(window) == 8
+        assert torch.equal(window, torch.arange(window[0], window[0] + 8))
+
+    with pytest.raises(ValueError):
+        sample_windows(ids, 100, 1, np.random.default_rng(0))
+
+
+def test_sample_documents(tokenizer):
+    texts = [
+        "short",
+        "a much longer document " * 8,
+        "tiny",
+        "another long document " * 8,
+    ]
+
+    calibration_set = sample_documents(
+        texts, tokenizer, 12, 2, np.random.default_rng(0), min_length=12, batch_size=2
+    )
+    assert calibration_set.lengths.tolist() == [12, 12]
+
+    # Without minimum length, documents are simply truncated
+    calibration_set = sample_documents(
+        texts, tokenizer, 12, 4, np.random.default_rng(0)
+    )
+    assert sorted(calibration_set.lengths.tolist()) == sorted(
+        min(len(tokenizer(text)["input_ids"]), 12) for text in texts
+    )
+
+    with pytest.raises(ValueError):
+        sample_documents(
+            texts, tokenizer, 12, 3, np.random.default_rng(0), min_length=12
+        )
+
+
+def test_calibration_cache(tokenizer, tmp_path, monkeypatch):
+    cache = CalibrationCache(tmp_path)
+    key = compute_calibration_cache_key(tokenizer, "c4", "train", 16, 4, 0)
+
+    assert key != compute_calibration_cache_key(tokenizer, "c4", "train", 16, 4, 1)
+    assert cache.lookup(key) is None
+
+    calls = []
+
+    def _build(*args):
+        calls.append(args)
+        return CalibrationSet.from_sequences([[1] * 16] * 4)
+
+    monkeypatch.setattr(
+        "optimum.nvidia.quantization.calibration.build_calibration_set", _build
+    )
+
+    first = get_calibration_dataset("c4", tokenizer, 4, 16, cache=cache)
+    second = get_calibration_dataset("c4", tokenizer, 4, 16, cache=cache)
+
+    # The second call is served by the cache
+    assert len(calls) == 1
+    assert isinstance(second.ids, np.memmap)
+    assert [s["input_ids"].tolist() for s in first] == [
+        s["input_ids"].tolist() for s in second
+    ]
+
+
+def test_iter_texts(tmp_path):
+    texts = ["first document", "second document", "third document"]
+
+    (tmp_path / "logs.jsonl").write_text(
+        "\n".join(json.dumps({"prompt": text}) for text in texts)
+    )
+    (tmp_path / "lines.json").write_text(
+        "\n".join(json.dumps({"prompt": text}) for text in texts)
+    )
+    (tmp_path / "array.json").write_text(
+        "\n " + json.dumps([{"prompt": text} for text in texts])
+    )
+    (tmp_path / "logs.txt").write_text("\n".join(texts) + "\n")
+    Dataset.from_dict({"prompt": texts}).to_parquet(tmp_path / "logs.parquet")
+
+    for name in ("logs.jsonl", "lines.json", "array.json", "logs.txt", "logs.parquet"):
+        assert list(iter_texts(tmp_path / name, column="prompt")) == texts
+
+    dataset = Dataset.from_dict({"prompt": texts})
+    assert list(iter_texts(dataset, column="prompt")) == texts
+    assert list(iter_texts(iter(texts))) == texts
+
+    with pytest.raises(ValueError):
+        list(iter_texts(tmp_path / "missing.jsonl"))
+
+
+@pytest.mark.parametrize("num_workers", [1, 4])
+def test_pack_texts(tokenizer, num_workers):
+    consumed = []
+
+    def _stream():
+        for index in range(10_000):
+            consumed.append(index)
+            yield f"document number {index} from the production logs"
+
+    calibration_set = pack_texts(
+        _stream(), tokenizer, 16, 8, batch_size=4, num_workers=num_workers
+    )
+
+    assert len(calibration_set) == 8
+    assert calibration_set.lengths.tolist() == [16] * 8
+
+    # Documents are separated by the end-of-sequence token
+    assert tokenizer.eos_token_id in calibration_set.ids.tolist()
+
+    # The stream is only read until enough tokens were gathered
+    assert len(consumed) < 200
+
+
+def test_pack_texts_not_enough_tokens(tokenizer):
+    calibration_set = get_custom_calibration_dataset(
+        ["a short document"] * 4, tokenizer, nsamples=100, seqlen=8
+    )
+    assert 0 < len(calibration_set) < 100
+
+    with pytest.raises(ValueError):
+        pack_texts(["tiny"], tokenizer, 1024, 1)
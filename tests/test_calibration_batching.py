@@ -0,0 +1,205 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import numpy as np
+import pytest
+import torch
+
+from optimum.nvidia.quantization import batching
+from optimum.nvidia.quantization.batching import (
+    CalibrationBatches,
+    CalibrationBatching,
+    CalibrationStats,
+    bucket_samples,
+    create_calibration_dataloader,
+    pack_samples,
+)
+from optimum.nvidia.quantization.calibration import CalibrationSet
+
+
+SEQUENCES = [[1, 5, 6, 7, 8], [1, 9, 10], [1, 11, 12, 13], [1, 14]]
+
+
+@pytest.fixture
+def calibration_set():
+    return CalibrationSet.from_sequences(SEQUENCES)
+
+
+def test_bucket_samples_groups_similar_lengths():
+    batches = bucket_samples(np.array([3, 8, 2, 7, 5]), batch_size=2)
+    assert batches == [[1, 3], [4, 0], [2]]
+
+
+def test_bucket_samples_invalid_batch_size():
+    with pytest.raises(ValueError):
+        bucket_samples(np.array([1, 2]), batch_size=0)
+
+
+def test_pack_samples_first_fit_decreasing():
+    rows = pack_samples(np.array([6, 4, 3, 2, 5]), max_length=8)
+    assert rows == [[0, 3], [4, 2], [1]]
+
+    # Samples longer than a row fill a whole row
+    assert pack_samples(np.array([12, 2]), max_length=8) == [[0], [1]]
+
+
+def test_bucket_batches_left_padded(calibration_set):
+    batches = CalibrationBatches(calibration_set, batch_size=2, pad_token_id=0)
+    assert batches.batching == CalibrationBatching.BUCKET
+    assert len(batches) == 2
+
+    batch = batches[0]
+    assert batch["input_ids"].tolist() == [[1, 5, 6, 7, 8], [0, 1, 11, 12, 13]]
+    assert batch["attention_mask"].tolist() == [[1, 1, 1, 1, 1], [0, 1, 1, 1, 1]]
+    assert int(batch["num_tokens"]) == 9
+    assert "position_ids" not in batch
+
+    batch = batches[1]
+    assert batch["input_ids"].tolist() == [[1, 9, 10], [0, 1, 14]]
+    assert int(batch["num_tokens"]) == 5
+
+
+@pytest.mark.parametrize("inverted", [True, False])
+def test_pack_batches(calibration_set, monkeypatch, inverted):
+    monkeypatch.setattr(batching, "INVERTED_4D_ATTENTION_MASKS", inverted)
+    batches = CalibrationBatches(
+        calibration_set, batch_size=4, batching="pack", max_length=8, pad_token_id=0
+    )
+    assert len(batches) == 1
+    assert batches.num_tokens == sum(map(len, SEQUENCES))
+
+    batch = batches[0]
+    assert batch["input_ids"].tolist() == [
+        [1, 5, 6, 7, 8, 1, 9, 10],
+        [1, 11, 12, 13, 1, 14, 0, 0],
+    ]
+    assert batch["position_ids"].tolist() == [
+        [0, 1, 2, 3, 4, 0, 1, 2],
+        [0, 1, 2, 3, 0, 1, 0, 0],
+    ]
+    assert int(batch["num_tokens"]) == 14
+
+    assert batch["attention_mask"].shape == (2, 1, 8, 8)
+    assert batch["attention_mask"].dtype == torch.float32
+
+    if inverted:
+        # Additive mask, 0 where attending
+        mask = batch["attention_mask"] == 0
+        assert (batch["attention_mask"][~mask] == torch.finfo(torch.float32).min).all()
+    else:
+        # 1 where attending, 0 elsewhere
+        mask = batch["attention_mask"] == 1
+        assert (batch["attention_mask"][~mask] == 0).all()
+
+    # Causal within a sample, nothing across samples
+    assert mask[0, 0, 4, :5].all() and not mask[0, 0, 5, :5].any()
+    assert mask[0, 0, 7, 5:].all()
+    assert not mask[0, 0, 2, 3:].any()
+
+    # Padding only attends to itself and is never attended
+    assert mask[1, 0, 6].tolist() == [False] * 6 + [True, False]
+    assert not mask[1, 0, :6, 6:].any()
+
+
+def test_pack_batches_mask_dtype(calibration_set, monkeypatch):
+    monkeypatch.setattr(batching, "INVERTED_4D_ATTENTION_MASKS", True)
+    batch = CalibrationBatches(
+        calibration_set, batching="pack", max_length=8, dtype=torch.bfloat16
+    )[0]
+
+    assert batch["attention_mask"].dtype == torch.bfloat16
+    assert batch["attention_mask"].min() == torch.finfo(torch.bfloat16).min
+
+
+def test_pack_batches_requires_4d_masks(calibration_set, monkeypatch):
+    monkeypatch.setattr(batching, "SUPPORTS_4D_ATTENTION_MASKS", False)
+
+    with pytest.raises(ValueError):
+        CalibrationBatches(calibration_set, batching="pack", max_length=8)
+
+    # Bucketing doesn't involve 4D masks
+    CalibrationBatches(calibration_set, batching="bucket")
+
+
+@pytest.mark.parametrize("attn_implementation", ["eager", "sdpa"])
+def test_packed_forward_matches_unpacked(calibration_set, attn_implementation):
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    torch.manual_seed(0)
+    model = LlamaForCausalLM(
+        LlamaConfig(
+            vocab_size=32,
+            hidden_size=32,
+            intermediate_size=64,
+            num_hidden_layers=2,
+            num_attention_heads=4,
+            num_key_value_heads=4,
+            attn_implementation=attn_implementation,
+        )
+    ).eval()
+
+    batch = CalibrationBatches(
+        calibration_set,
+        batch_size=4,
+        batching="pack",
+        max_length=8,
+        dtype=model.dtype,
+    )[0]
+
+    with torch.no_grad():
+        logits = model(
+            input_ids=batch["input_ids"],
+            position_ids=batch["position_ids"],
+            attention_mask=batch["attention_mask"],
+        ).logits
+
+        expected = model(torch.tensor([SEQUENCES[0]])).logits[0]
+        torch.testing.assert_close(logits[0, :5], expected)
+
+        expected = model(torch.tensor([SEQUENCES[3]])).logits[0]
+        torch.testing.assert_close(logits[1, 4:6], expected)
+
+
+def test_calibration_stats():
+    stats = CalibrationStats()
+    stats.update({"input_ids": torch.zeros((2, 5)), "num_tokens": torch.tensor(8)}, 0.5)
+    stats.update({"input_ids": torch.zeros((2, 3)), "num_tokens": torch.tensor(4)}, 0.5)
+
+    assert stats.num_batches == 2
+    assert stats.tokens_per_second == 12.0
+    assert stats.padding_ratio == pytest.approx(4 / 16)
+
+
+@pytest.mark.parametrize("num_workers", [0, 2])
+def test_calibration_dataloader(calibration_set, num_workers):
+    loader = create_calibration_dataloader(
+        calibration_set, batch_size=2, num_workers=num_workers
+    )
+
+    batches = list(loader)
+    assert len(batches) == 2
+    assert sum(int(batch["num_tokens"]) for batch in batches) == 14
+
+
+def test_calibration_dataloader_from_samples():
+    samples = [{"input_ids": torch.tensor([sequence])} for sequence in SEQUENCES]
+    loader = create_calibration_dataloader(
+        samples, batch_size=4, batching=CalibrationBatching.PACK, num_workers=0
+    )
+
+    (batch,) = list(loader)
+    assert batch["input_ids"].shape == (3, 5)
+    assert int(batch["num_tokens"]) == 14
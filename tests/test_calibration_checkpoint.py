@@ -0,0 +1,212 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import json
+
+import pytest
+import torch
+
+from optimum.nvidia.quantization.batching import (
+    CalibrationBatches,
+    create_calibration_dataloader,
+)
+from optimum.nvidia.quantization.calibration import CalibrationSet
+from optimum.nvidia.quantization.checkpoint import (
+    CALIBRATION_MANIFEST_FILE,
+    CalibrationCheckpoint,
+    collect_calibration_statistics,
+    compute_checkpoint_fingerprint,
+    restore_calibration_statistics,
+    verify_calibration_manifest,
+    write_calibration_manifest,
+)
+
+
+class MaxCalibrator:
+    def __init__(self):
+        self._calib_amax = None
+
+    def collect(self, x: torch.Tensor):
+        amax = x.abs().amax()
+        self._calib_amax = (
+            amax if self._calib_amax is None else torch.max(self._calib_amax, amax)
+        )
+
+
+class Quantizer(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self._calibrator = MaxCalibrator()
+
+    def forward(self, x):
+        self._calibrator.collect(x)
+        return x
+
+
+class QuantizedLinear(torch.nn.Linear):
+    def __init__(self, in_features, out_features):
+        super().__init__(in_features, out_features)
+        self.input_quantizer = Quantizer()
+
+    def forward(self, x):
+        return super().forward(self.input_quantizer(x))
+
+
+def create_model():
+    torch.manual_seed(0)
+    return torch.nn.Sequential(QuantizedLinear(4, 8), QuantizedLinear(8, 2))
+
+
+def test_collect_restore_statistics():
+    model = create_model()
+    model(torch.randn(3, 4))
+
+    statistics = collect_calibration_statistics(model)
+    assert set(statistics) == {
+        "0.input_quantizer._calib_amax",
+        "1.input_quantizer._calib_amax",
+    }
+
+    restored = create_model()
+    assert restore_calibration_statistics(restored, statistics) == 2
+    for name, value in collect_calibration_statistics(restored).items():
+        torch.testing.assert_close(value, statistics[name])
+
+    with pytest.raises(ValueError):
+        restore_calibration_statistics(
+            restored, {"2.input_quantizer._calib_amax": torch.ones(())}
+        )
+
+
+def test_resume_matches_uninterrupted_run(tmp_path):
+    torch.manual_seed(1)
+    batches = [torch.randn(2, 4) * (i + 1) for i in range(6)]
+
+    model = create_model()
+    for batch in batches:
+        model(batch)
+    expected = collect_calibration_statistics(model)
+
+    # First run is interrupted after 4 batches, checkpointing every 2
+    checkpoint = CalibrationCheckpoint(tmp_path, "run", interval=2)
+    model = create_model()
+    for cursor, batch in enumerate(batches[:4], start=1):
+        model(batch)
+        if checkpoint.should_save(cursor):
+            checkpoint.save(cursor, collect_calibration_statistics(model))
+
+    # Only the last state is kept around
+    assert len(list(tmp_path.glob("state-*.safetensors"))) == 1
+
+    state = CalibrationCheckpoint(tmp_path, "run", interval=2).load()
+    assert state.cursor == 4
+
+    model = create_model()
+    restore_calibration_statistics(model, state.statistics)
+    for batch in batches[state.cursor :]:
+        model(batch)
+
+    for name, value in collect_calibration_statistics(model).items():
+        torch.testing.assert_close(value, expected[name])
+
+
+def test_checkpoint_should_save(tmp_path):
+    checkpoint = CalibrationCheckpoint(tmp_path, "run", interval=4)
+    assert [c for c in range(10) if checkpoint.should_save(c)] == [4, 8]
+
+    disabled = CalibrationCheckpoint(tmp_path, "run", interval=0)
+    assert not any(disabled.should_save(c) for c in range(10))
+
+    with pytest.raises(ValueError):
+        CalibrationCheckpoint(tmp_path, "run", interval=-1)
+
+
+def test_checkpoint_discarded_on_fingerprint_mismatch(tmp_path):
+    CalibrationCheckpoint(tmp_path / "ckpt", "a").save(2, {"x": torch.ones(2)})
+
+    assert CalibrationCheckpoint(tmp_path / "ckpt", "a").load().cursor == 2
+    assert CalibrationCheckpoint(tmp_path / "ckpt", "b").load() is None
+    assert not (tmp_path / "ckpt").exists()
+
+
+def test_checkpoint_discarded_when_corrupted(tmp_path):
+    checkpoint = CalibrationCheckpoint(tmp_path / "ckpt", "a")
+    checkpoint.save(2, {"x": torch.ones(2)})
+
+    state_path = next((tmp_path / "ckpt").glob("state-*.safetensors"))
+    data = bytearray(state_path.read_bytes())
+    data[-1] ^= 0xFF
+    state_path.write_bytes(bytes(data))
+
+    assert checkpoint.load() is None
+    assert not (tmp_path / "ckpt").exists()
+
+
+def test_checkpoint_fingerprint():
+    fingerprint = compute_checkpoint_fingerprint(model="llama", batches="abc")
+    assert fingerprint == compute_checkpoint_fingerprint(batches="abc", model="llama")
+    assert fingerprint != compute_checkpoint_fingerprint(model="llama", batches="abd")
+
+
+@pytest.fixture
+def artifacts(tmp_path):
+    (tmp_path / "config.json").write_text(json.dumps({"architecture": "llama"}))
+    (tmp_path / "rank0.safetensors").write_bytes(b"\x00" * 64)
+    (tmp_path / ".calibration-checkpoint").mkdir()
+    (tmp_path / ".calibration-checkpoint" / "cursor.json").write_text("{}")
+    return tmp_path
+
+
+def test_calibration_manifest(artifacts):
+    assert not verify_calibration_manifest(artifacts)
+
+    write_calibration_manifest(artifacts, metadata={"quantization": "fp8"})
+    with open(artifacts / CALIBRATION_MANIFEST_FILE) as manifest_f:
+        manifest = json.load(manifest_f)
+
+    # Hidden files (checkpoints) are not part of the artifacts
+    assert set(manifest["files"]) == {"config.json", "rank0.safetensors"}
+
+    assert verify_calibration_manifest(artifacts)
+    assert verify_calibration_manifest(artifacts, {"quantization": "fp8"})
+    assert not verify_calibration_manifest(artifacts, {"quantization": "int8"})
+
+    # Additional files don't invalidate the artifacts
+    (artifacts / "rank0.engine").write_bytes(b"\x01")
+    assert verify_calibration_manifest(artifacts)
+
+
+def test_calibration_manifest_detects_corruption(artifacts):
+    write_calibration_manifest(artifacts, ["rank0.safetensors"])
+    assert verify_calibration_manifest(artifacts)
+
+    # Same size, different content
+    (artifacts / "rank0.safetensors").write_bytes(b"\x01" * 64)
+    assert not verify_calibration_manifest(artifacts)
+
+    (artifacts / "rank0.safetensors").unlink()
+    assert not verify_calibration_manifest(artifacts)
+
+
+def test_calibration_dataloader_start():
+    calibration_set = CalibrationSet.from_sequences([[1, 2, 3], [1, 2], [1], [4]])
+    batches = CalibrationBatches(calibration_set, batch_size=1)
+
+    loader = create_calibration_dataloader(batches, num_workers=0, start=2)
+    assert [batch["input_ids"].tolist() for batch in loader] == [[[1]], [[4]]]
+
+    assert batches.digest() == CalibrationBatches(calibration_set).digest()
+    assert batches.digest() != CalibrationBatches(calibration_set, 2).digest()
@@ -0,0 +1,152 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import os
+from pathlib import Path
+
+import pytest
+
+from optimum.nvidia.builder.cache import (
+    DEFAULT_ENGINE_CACHE_SIZE_GB,
+    ENV_ENGINE_CACHE_DIR,
+    ENV_ENGINE_CACHE_SIZE_GB,
+    EngineCache,
+    compute_engine_cache_key,
+)
+from optimum.nvidia.builder.config import (
+    EngineConfig,
+    GenerationProfile,
+    InferenceProfile,
+    ShardingProfile,
+)
+
+
+VERSIONS = {"tensorrt_llm": "0.9.0", "tensorrt": "9.3.0", "sm": "90"}
+
+
+def _create_engines(root: Path, name: str, size: int) -> Path:
+    folder = root / name
+    folder.mkdir()
+    (folder / "config.json").write_text("{}")
+    (folder / "rank0.engine").write_bytes(b"\0" * size)
+    (folder / "rank0.safetensors").write_bytes(b"\0" * size)
+    return folder
+
+
+def _engine_config(max_batch_size: int) -> EngineConfig:
+    return EngineConfig(
+        optimisation_level=3,
+        strongly_typed=False,
+        logits_dtype="float32",
+        workload_profile=InferenceProfile(max_batch_size, 128, 128),
+        generation_profile=GenerationProfile(1, -1),
+        sharding_profile=ShardingProfile(),
+        plugins_config=None,
+    )
+
+
+def test_engine_cache_key():
+    key = compute_engine_cache_key(
+        "abc", _engine_config(1), {"dtype": "float16"}, None, VERSIONS
+    )
+
+    assert key == compute_engine_cache_key(
+        "abc", _engine_config(1), {"dtype": "float16"}, None, VERSIONS
+    )
+    assert key != compute_engine_cache_key(
+        "abc", _engine_config(2), {"dtype": "float16"}, None, VERSIONS
+    )
+    assert key != compute_engine_cache_key(
+        "def", _engine_config(1), {"dtype": "float16"}, None, VERSIONS
+    )
+    assert key != compute_engine_cache_key(
+        "abc", _engine_config(1), {"dtype": "float16"}, {"use_fp8": True}, VERSIONS
+    )
+    assert key != compute_engine_cache_key(
+        "abc",
+        _engine_config(1),
+        {"dtype": "float16"},
+        None,
+        VERSIONS | {"tensorrt_llm": "0.10.0"},
+    )
+
+
+def test_engine_cache_lookup_and_store(tmp_path: Path):
+    cache = EngineCache(tmp_path / "cache")
+    engines = _create_engines(tmp_path, "engines", 16)
+
+    assert cache.lookup("key", tmp_path / "output") is None
+    entry = cache.store("key", engines)
+
+    assert "key" in cache
+    assert (entry / "rank0.engine").exists()
+    assert not (entry / "rank0.safetensors").exists()
+
+    # Engines are linked to the caller's folder
+    assert cache.lookup("key", tmp_path / "output") == tmp_path / "output"
+    assert (tmp_path / "output" / "rank0.engine").read_bytes() == b"\0" * 16
+    assert not (tmp_path / "output" / "entry.json").exists()
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+    # Entries are visible from other instances (i.e. processes)
+    assert EngineCache(tmp_path / "cache").lookup("key", tmp_path / "other")
+
+
+def test_engine_cache_lookup_survives_eviction(tmp_path: Path):
+    cache = EngineCache(tmp_path / "cache")
+    cache.store("key", _create_engines(tmp_path, "engines", 16))
+
+    output = cache.lookup("key", tmp_path / "output")
+    cache.evict(0)
+
+    assert "key" not in cache
+    assert (output / "rank0.engine").read_bytes() == b"\0" * 16
+
+
+def test_engine_cache_from_env(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv(ENV_ENGINE_CACHE_DIR, str(tmp_path))
+    monkeypatch.delenv(ENV_ENGINE_CACHE_SIZE_GB, raising=False)
+
+    # The cache is bounded by default
+    assert EngineCache.from_env().max_size_bytes == int(
+        DEFAULT_ENGINE_CACHE_SIZE_GB * 1024**3
+    )
+
+    monkeypatch.setenv(ENV_ENGINE_CACHE_SIZE_GB, "0.5")
+    assert EngineCache.from_env().max_size_bytes == 512 * 1024**2
+
+
+def test_engine_cache_lru_eviction(tmp_path: Path):
+    cache = EngineCache(tmp_path / "cache", max_size_bytes=250)
+
+    for index in range(2):
+        cache.store(f"key{index}", _create_engines(tmp_path, f"e{index}", 100))
+
+    # Make key0 the most recently used entry
+    entry_file = cache.root / "key1" / "entry.json"
+    os.utime(entry_file, (0, 0))
+    assert cache.lookup("key0", tmp_path / "output") is not None
+
+    cache.store("key2", _create_engines(tmp_path, "e2", 100))
+
+    assert "key0" in cache
+    assert "key1" not in cache
+    assert "key2" in cache
+    assert cache.stats.evictions == 1
+
+
+def test_engine_cache_validation(tmp_path: Path):
+    with pytest.raises(ValueError):
+        EngineCache(tmp_path, max_size_bytes=-1)
@@ -1,14 +1,20 @@
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from types import SimpleNamespace
 
 import mock
+import numpy as np
+import pytest
+import torch
+from safetensors.torch import load_file
 from transformers import AutoConfig as HfAutoConfig
 from transformers import AutoModelForCausalLM as HfAutoModelForCausalLM
 
 # import pytest
 import optimum.nvidia.hub
 from optimum.nvidia import AutoModelForCausalLM
-from optimum.nvidia.hub import FOLDER_TRTLLM_ENGINES
+from optimum.nvidia.hub import FOLDER_TRTLLM_ENGINES, HuggingFaceHubModel
+from optimum.nvidia.quantization.calibration import CalibrationSet
 
 
 # from optimum.nvidia.utils.nvml import get_device_name
@@ -63,3 +69,70 @@ def test_save_engine_locally_and_reload():
 
         _save()
         _reload()
+
+
+class FakeRankedConfig:
+    def __init__(self, world_size: int):
+        self.mapping = SimpleNamespace(world_size=world_size, rank=0)
+
+    def set_rank(self, rank: int):
+        self.mapping.rank = rank
+
+
+class FakeConversion(HuggingFaceHubModel):
+    @staticmethod
+    def convert_weights(target, source, config):
+        weight = source.weight.detach().numpy()
+        shards = np.array_split(weight, config.mapping.world_size)
+        return {"weight": np.ascontiguousarray(shards[config.mapping.rank])}
+
+
+@pytest.mark.parametrize("num_workers", [1, 4])
+def test_convert_checkpoint_per_rank(num_workers: int):
+    hf_model = torch.nn.Linear(16, 8, bias=False)
+    target = mock.MagicMock()
+
+    with TemporaryDirectory() as out:
+        out = Path(out)
+        FakeConversion.convert_checkpoint(
+            target, hf_model, FakeRankedConfig(4), out, num_workers
+        )
+
+        for rank in range(4):
+            weights = load_file(out / f"rank{rank}.safetensors")
+            expected = hf_model.weight[rank * 2 : (rank + 1) * 2]
+            assert torch.equal(weights["weight"], expected)
+
+    assert target.load.call_count == 4
+
+
+def test_quantization_cache_key():
+    def _qconfig(sequences):
+        return SimpleNamespace(
+            to_dict=lambda: {"quant_method": "fp8"},
+            has_calibration_dataset=True,
+            calibration_dataset=CalibrationSet.from_sequences(sequences),
+        )
+
+    key = HuggingFaceHubModel.get_quantization_cache_key(
+        {"quantization_config": _qconfig([[1, 2, 3], [4, 5]])}
+    )
+    assert key == HuggingFaceHubModel.get_quantization_cache_key(
+        {"quantization_config": _qconfig([[1, 2, 3], [4, 5]])}
+    )
+
+    # Same number of samples, different content
+    assert key != HuggingFaceHubModel.get_quantization_cache_key(
+        {"quantization_config": _qconfig([[1, 2, 3], [4, 6]])}
+    )
+
+    for calibration_kwargs in (
+        {"calibration_batching": "pack"},
+        {"calibration_batch_size": 4},
+        {"sequential_calibration": True},
+    ):
+        assert key != HuggingFaceHubModel.get_quantization_cache_key(
+            {"quantization_config": _qconfig([[1, 2, 3], [4, 5]]), **calibration_kwargs}
+        )
+
+    assert HuggingFaceHubModel.get_quantization_cache_key({}) is None
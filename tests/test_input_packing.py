@@ -0,0 +1,126 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import pytest
+import torch
+
+from optimum.nvidia.runtime import InputPacker, pack_stop_words
+from optimum.nvidia.utils import BufferPool
+
+
+@pytest.fixture
+def packer():
+    return InputPacker(torch.device("cpu"))
+
+
+def test_pack_ragged_sequences(packer):
+    inputs = packer.pack([[1, 2, 3], [4], [5, 6]], packed=True)
+
+    assert inputs.ids.tolist() == [[1, 2, 3, 4, 5, 6]]
+    assert inputs.lengths.tolist() == [3, 1, 2]
+    assert inputs.offsets.tolist() == [0, 3, 4, 6]
+    assert inputs.max_length == 3
+    assert inputs.ids.dtype == torch.int32
+
+
+def test_pack_ragged_sequences_padded(packer):
+    inputs = packer.pack([[1, 2, 3], [4], [5, 6]], packed=False, pad_token_id=0)
+
+    assert inputs.ids.tolist() == [[1, 2, 3], [4, 0, 0], [5, 6, 0]]
+    assert inputs.lengths.tolist() == [3, 1, 2]
+    assert inputs.offsets.tolist() == [0, 3, 4, 6]
+
+
+def test_pack_single_sequence(packer):
+    inputs = packer.pack([7, 8, 9], packed=True)
+
+    assert inputs.ids.tolist() == [[7, 8, 9]]
+    assert inputs.lengths.tolist() == [3]
+
+
+def test_pack_tensor_sequences(packer):
+    inputs = packer.pack([torch.tensor([1, 2]), torch.tensor([3])], packed=True)
+
+    assert inputs.ids.tolist() == [[1, 2, 3]]
+    assert inputs.lengths.tolist() == [2, 1]
+
+
+def test_pack_tensor_with_mask(packer):
+    input_ids = torch.tensor([[1, 2, 3], [4, 5, 0], [0, 6, 7]])
+    attention_mask = torch.tensor([[1, 1, 1], [1, 1, 0], [0, 1, 1]])
+
+    inputs = packer.pack_tensor(input_ids, attention_mask, packed=True)
+    assert inputs.ids.tolist() == [[1, 2, 3, 4, 5, 6, 7]]
+    assert inputs.lengths.tolist() == [3, 2, 2]
+
+    # Left padding is turned into right padding
+    inputs = packer.pack_tensor(input_ids, attention_mask, packed=False, pad_token_id=9)
+    assert inputs.ids.tolist() == [[1, 2, 3], [4, 5, 9], [6, 7, 9]]
+
+
+def test_pack_tensor_without_mask(packer):
+    inputs = packer.pack_tensor(torch.ones((3, 4), dtype=torch.int64), None, True)
+
+    assert inputs.lengths.tolist() == [4, 4, 4]
+    assert inputs.offsets.tolist() == [0, 4, 8, 12]
+
+    inputs = packer.pack_tensor(torch.arange(5), None, True)
+    assert inputs.ids.tolist() == [[0, 1, 2, 3, 4]]
+    assert inputs.lengths.tolist() == [5]
+
+
+def test_pack_reuses_buffers():
+    host_pool, device_pool = BufferPool(), BufferPool()
+    packer = InputPacker(torch.device("cpu"), host_pool, device_pool)
+
+    first = packer.pack([[1, 2, 3, 4]], packed=True)
+    second = packer.pack([[5, 6]], packed=True)
+
+    # The staging buffer is reused while device buffers are handed out until released
+    assert host_pool.stats.hits == 1
+    assert device_pool.stats.in_use == 2
+    assert first.ids.tolist() == [[1, 2, 3, 4]]
+    assert second.ids.tolist() == [[5, 6]]
+
+    packer.release(first)
+    packer.release(second)
+    assert device_pool.stats.in_use == 0
+
+    third = packer.pack([[7, 8, 9]], packed=True)
+    assert device_pool.stats.hits == 1
+    assert third.ids.tolist() == [[7, 8, 9]]
+    assert third.lengths.tolist() == [3]
+
+
+def test_pack_empty_batch(packer):
+    with pytest.raises(ValueError):
+        packer.pack([], packed=True)
+
+
+def test_pack_stop_words():
+    stop_words = pack_stop_words([[1, 2], [3], [4, 5, 6]], batch_size=2)
+
+    assert stop_words.dtype == torch.int32
+    assert stop_words.tolist() == [
+        [[1, 2, 3, 4, 5, 6], [2, 3, 6, -1, -1, -1]],
+        [[1, 2, 3, 4, 5, 6], [2, 3, 6, -1, -1, -1]],
+    ]
+
+    # More stop words than tokens, the offsets set the length
+    assert pack_stop_words([[7]], batch_size=1).tolist() == [[[7], [1]]]
+
+    with pytest.raises(ValueError):
+        pack_stop_words([[1], []], batch_size=1)
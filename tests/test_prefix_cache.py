@@ -0,0 +1,159 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+from itertools import count
+from typing import Dict, List, Mapping
+
+import pytest
+
+from optimum.nvidia.generation import (
+    Executor,
+    GenerationRequest,
+    InflightBatchingScheduler,
+    PrefixCache,
+)
+
+
+def test_prefix_cache_validation():
+    with pytest.raises(ValueError):
+        PrefixCache(max_blocks=-1)
+
+    with pytest.raises(ValueError):
+        PrefixCache(max_blocks=8, tokens_per_block=0)
+
+    cache = PrefixCache(max_blocks=8, tokens_per_block=2)
+    with pytest.raises(ValueError):
+        cache.insert([1, 2, 3], ["a", "b"])
+
+
+def test_prefix_cache_match_full_blocks():
+    cache = PrefixCache(max_blocks=8, tokens_per_block=2)
+    assert cache.insert([1, 2, 3, 4, 5], ["a", "b"]) == []
+    assert cache.num_blocks == 2
+
+    match = cache.match([1, 2, 3, 4, 9, 9])
+    assert match.num_tokens == 4
+    assert match.blocks == ["a", "b"]
+
+    # Diverging within the second block only matches the first one
+    assert cache.match([1, 2, 3, 9]).blocks == ["a"]
+
+    # The last token is never matched
+    assert cache.match([1, 2, 3, 4]).num_tokens == 2
+
+    assert cache.match([7, 8, 9]).num_tokens == 0
+
+    stats = cache.stats
+    assert stats.lookups == 4
+    assert stats.hits == 3
+    assert stats.matched_tokens == 8
+
+
+def test_prefix_cache_duplicate_blocks_are_returned():
+    cache = PrefixCache(max_blocks=8, tokens_per_block=2)
+    cache.insert([1, 2, 3, 4], ["a", "b"])
+
+    # Shared first block, new second one
+    assert cache.insert([1, 2, 5, 6], ["c", "d"]) == ["c"]
+    assert cache.num_blocks == 3
+    assert cache.match([1, 2, 5, 6, 7]).blocks == ["a", "d"]
+
+
+def test_prefix_cache_lru_eviction():
+    cache = PrefixCache(max_blocks=3, tokens_per_block=1)
+    cache.insert([1, 2], ["a", "b"])
+    cache.insert([3], ["c"])
+
+    # Refresh [1, 2]
+    cache.release(cache.match([1, 2, 0]))
+
+    # [3] is the least recently used leaf
+    assert cache.insert([4], ["d"]) == ["c"]
+    assert cache.stats.evictions == 1
+
+    # Leaves go first, then their parents
+    assert cache.evict(3) == ["b", "a", "d"]
+    assert cache.num_blocks == 0
+
+
+def test_prefix_cache_locked_blocks_are_not_evicted():
+    cache = PrefixCache(max_blocks=4, tokens_per_block=1)
+    cache.insert([1, 2], ["a", "b"])
+
+    match = cache.match([1, 2, 0])
+    assert cache.clear() == []
+
+    cache.release(match)
+    assert sorted(cache.clear()) == ["a", "b"]
+    assert cache.num_blocks == 0
+
+    with pytest.raises(ValueError):
+        cache.release(match)
+
+
+class FakeKVExecutor(Executor):
+    """
+    Generate one token per step, allocating one KV-cache block per `tokens_per_block` tokens not cached.
+    """
+
+    def __init__(self, max_batch_size: int, tokens_per_block: int):
+        self._max_batch_size = max_batch_size
+        self._tokens_per_block = tokens_per_block
+        self._block_ids = count()
+        self.blocks: Dict[int, List[int]] = {}
+        self.computed_tokens = []
+        self.freed = []
+
+    @property
+    def max_batch_size(self) -> int:
+        return self._max_batch_size
+
+    def on_admit(self, slot: int, request: GenerationRequest):
+        self.computed_tokens.append(len(request.prompt_ids) - request.num_cached_tokens)
+        self.blocks[slot] = list(request.cached_blocks)
+
+    def step(self, requests: Mapping[int, GenerationRequest]) -> Dict[int, List[int]]:
+        return {
+            slot: [100 + len(request.output_ids)] for slot, request in requests.items()
+        }
+
+    def kv_blocks(self, slot: int, request: GenerationRequest):
+        blocks = self.blocks.pop(slot)
+        num_blocks = (len(request.all_ids) - 1) // self._tokens_per_block
+        return blocks + [next(self._block_ids) for _ in range(num_blocks - len(blocks))]
+
+    def free_kv_blocks(self, blocks):
+        self.freed.extend(blocks)
+
+
+def test_scheduler_reuses_prefixes():
+    executor = FakeKVExecutor(max_batch_size=1, tokens_per_block=4)
+    cache = PrefixCache(max_blocks=16, tokens_per_block=4)
+    scheduler = InflightBatchingScheduler(executor, prefix_cache=cache)
+
+    system_prompt = list(range(8))
+    for suffix in ([20, 21], [30, 31, 32], [40]):
+        scheduler.submit(GenerationRequest(system_prompt + suffix, max_new_tokens=2))
+
+    finished = list(scheduler.run())
+
+    assert len(finished) == 3
+    assert [request.num_cached_tokens for request in finished] == [0, 8, 8]
+    assert executor.computed_tokens == [10, 3, 1]
+
+    # Blocks of the shared prefix are only kept once
+    assert executor.freed == []
+    assert cache.stats.hits == 2
@@ -0,0 +1,180 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import json
+from threading import Event, Thread
+from typing import List
+
+import pytest
+import torch
+
+from optimum.nvidia.generation import EngineRouter
+from optimum.nvidia.generation.streaming import TokenStream
+
+
+class StubEngine:
+    def __init__(
+        self, max_batch_size: int, max_prompt_length: int, max_output_length: int
+    ):
+        self.max_batch_size = max_batch_size
+        self.max_prompt_length = max_prompt_length
+        self.max_output_length = max_output_length
+        self.calls = []
+        self.released = []
+        self.gate = None
+
+    def generate(self, input_ids, attention_mask=None, max_new_tokens=-1, **kwargs):
+        if self.gate is not None:
+            self.gate.wait()
+
+        self.calls.append((input_ids, max_new_tokens, kwargs))
+        lengths = torch.tensor([[len(ids)] for ids in input_ids])
+        return torch.zeros((len(input_ids), 1, self.max_output_length)), lengths
+
+    def generate_stream(self, input_ids, attention_mask=None, **kwargs):
+        self.calls.append((input_ids, -1, kwargs))
+        stream = TokenStream()
+
+        def _produce():
+            self.gate.wait()
+            stream.put(torch.zeros(len(input_ids)))
+            stream.end()
+
+        Thread(target=_produce, daemon=True).start()
+        return stream
+
+    def release(self, *tensors: torch.Tensor):
+        self.released.extend(tensors)
+
+
+@pytest.fixture
+def engines():
+    return {
+        "long": StubEngine(2, 2048, 4096),
+        "short": StubEngine(8, 128, 256),
+        "medium": StubEngine(4, 512, 1024),
+    }
+
+
+def _prompts(batch_size: int, length: int) -> List[List[int]]:
+    return [[1] * length for _ in range(batch_size)]
+
+
+def test_router_selects_smallest_fitting_engine(engines):
+    router = EngineRouter(engines)
+
+    assert list(router.engines.keys()) == ["short", "medium", "long"]
+    assert router.max_batch_size == 8
+    assert router.max_prompt_length == 2048
+
+    assert router.select(4, 100, 100) == "short"
+    assert router.select(4, 100, 200) == "medium"
+    assert router.select(2, 600, 100) == "long"
+    assert router.select(8, 10, 10) == "short"
+
+    # Without an output budget, the batch may generate up to the largest maximum sequence length
+    assert router.candidates(1, 100) == ["long"]
+
+    with pytest.raises(ValueError):
+        router.select(4, 600, 100)
+
+
+def test_router_generate_and_release(engines):
+    router = EngineRouter(engines)
+
+    ids, lengths = router.generate(_prompts(3, 200), max_new_tokens=64, top_k=1)
+    assert len(engines["medium"].calls) == 1
+    assert engines["medium"].calls[0][1:] == (64, {"top_k": 1})
+    assert ids.shape[-1] == 1024
+
+    router.release(ids, lengths)
+    assert engines["medium"].released == [ids, lengths]
+
+    metrics = router.metrics
+    assert metrics["medium"].num_batches == 1
+    assert metrics["medium"].num_sequences == 3
+    assert metrics["medium"].num_prompt_tokens == 600
+    assert metrics["medium"].in_flight == 0
+    assert metrics["short"].num_batches == 0
+
+
+def test_router_falls_back_when_busy(engines):
+    router = EngineRouter(engines)
+    engines["short"].gate = Event()
+
+    thread = Thread(
+        target=router.generate, args=(_prompts(2, 10),), kwargs={"max_new_tokens": 10}
+    )
+    thread.start()
+    while router.metrics["short"].in_flight == 0:
+        pass
+
+    # The smallest engine is busy, the next one fitting takes the batch
+    router.generate(_prompts(2, 10), max_new_tokens=10)
+    assert len(engines["medium"].calls) == 1
+    assert router.metrics["medium"].num_fallbacks == 1
+
+    engines["short"].gate.set()
+    thread.join()
+
+    assert router.metrics["short"].num_batches == 1
+    assert router.select(2, 10, 10) == "short"
+
+
+def test_router_stream_holds_engine(engines):
+    router = EngineRouter(engines)
+    engines["short"].gate = Event()
+
+    stream = router.generate_stream(_prompts(1, 10), max_new_tokens=10)
+    assert router.metrics["short"].in_flight == 1
+
+    engines["short"].gate.set()
+    assert len(list(stream)) == 1
+
+    metrics = router.metrics["short"]
+    assert metrics.in_flight == 0
+    assert metrics.num_batches == 1
+
+
+def test_router_from_manifest(tmp_path):
+    manifest = {
+        "version": 1,
+        "engines": [
+            {
+                "name": name,
+                "path": name,
+                "profile": {
+                    "max_batch_size": batch,
+                    "max_input_len": prompt,
+                    "max_output_len": output,
+                },
+            }
+            for name, batch, prompt, output in [
+                ("long", 2, 2048, 2048),
+                ("short", 8, 128, 128),
+            ]
+        ],
+    }
+    (tmp_path / "engines.json").write_text(json.dumps(manifest))
+
+    def _factory(folder, gpus_per_node, use_cuda_graph):
+        max_input_len = 2048 if folder.name == "long" else 128
+        return StubEngine(1, max_input_len, 2 * max_input_len)
+
+    router = EngineRouter.from_manifest(
+        tmp_path, gpus_per_node=1, engine_factory=_factory
+    )
+    assert list(router.engines.keys()) == ["short", "long"]
@@ -0,0 +1,100 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import numpy as np
+import pytest
+import torch
+
+from optimum.nvidia.generation import (
+    DEFAULT_SAMPLING_PARAMETERS,
+    pack_sampling_parameters,
+)
+
+
+def test_pack_scalar_parameters():
+    packed = pack_sampling_parameters(4, **DEFAULT_SAMPLING_PARAMETERS)
+
+    assert packed == {
+        name: [value] for name, value in DEFAULT_SAMPLING_PARAMETERS.items()
+    }
+
+
+def test_pack_vector_parameters():
+    packed = pack_sampling_parameters(
+        3, temperature=[0.1, 0.5, 1], top_k=(1, 50, 50), seed=[7, 7, 7]
+    )
+
+    assert packed["temperature"] == [0.1, 0.5, 1.0]
+    assert packed["top_k"] == [1, 50, 50]
+    assert all(isinstance(top_k, int) for top_k in packed["top_k"])
+
+    # Uniform vectors are collapsed to a single value
+    assert packed["seed"] == [7]
+
+
+def test_pack_array_parameters():
+    packed = pack_sampling_parameters(
+        3,
+        temperature=np.array([0.1, 0.5, 1.0], dtype=np.float32),
+        top_k=np.array([1, 50, 50]),
+        seed=np.int64(7),
+    )
+
+    assert packed["temperature"] == pytest.approx([0.1, 0.5, 1.0])
+    assert packed["top_k"] == [1, 50, 50]
+    assert all(isinstance(top_k, int) for top_k in packed["top_k"])
+    assert packed["seed"] == [7]
+
+
+def test_pack_tensor_parameters():
+    packed = pack_sampling_parameters(
+        3,
+        temperature=torch.tensor([0.1, 0.5, 1.0]),
+        top_k=torch.tensor([1, 50, 50]),
+        seed=torch.tensor(7),
+    )
+
+    assert packed["temperature"] == pytest.approx([0.1, 0.5, 1.0])
+    assert packed["top_k"] == [1, 50, 50]
+    assert packed["seed"] == [7]
+
+    # Items of a list are accepted as tensors too
+    assert pack_sampling_parameters(2, top_p=[torch.tensor(0.5), 1.0])["top_p"] == [
+        0.5,
+        1.0,
+    ]
+
+
+@pytest.mark.parametrize(
+    "parameters",
+    [
+        {"temperature": np.ones((3, 1))},
+        {"temperature": torch.ones((3, 1))},
+        {"temperature": np.array([0.1, 0.2])},
+        {"top_p": torch.tensor([0.5, 0.0, 1.0])},
+        {"temperature": [0.1, 0.2]},
+        {"temperature": -1.0},
+        {"top_k": [1, 2.5, 3]},
+        {"top_p": [0.5, 0.0, 1.0]},
+        {"top_p": 1.5},
+        {"repetition_penalty": 0},
+        {"seed": "42"},
+        {"typical_p": 0.9},
+    ],
+)
+def test_pack_invalid_parameters(parameters):
+    with pytest.raises(ValueError):
+        pack_sampling_parameters(3, **parameters)
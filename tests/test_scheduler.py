@@ -0,0 +1,141 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from typing import Dict, List, Mapping
+
+import pytest
+
+from optimum.nvidia.generation import (
+    Executor,
+    FinishReason,
+    GenerationRequest,
+    InflightBatchingScheduler,
+)
+
+
+class FakeExecutor(Executor):
+    """
+    Generate one token per step, the token being the number of tokens generated so far for the request.
+    """
+
+    def __init__(self, max_batch_size: int):
+        self._max_batch_size = max_batch_size
+        self.batch_sizes = []
+        self.admitted = []
+        self.retired = []
+
+    @property
+    def max_batch_size(self) -> int:
+        return self._max_batch_size
+
+    def step(self, requests: Mapping[int, GenerationRequest]) -> Dict[int, List[int]]:
+        self.batch_sizes.append(len(requests))
+        return {slot: [len(request.output_ids)] for slot, request in requests.items()}
+
+    def on_admit(self, slot: int, request: GenerationRequest):
+        self.admitted.append((slot, request.request_id))
+
+    def on_retire(self, slot: int, request: GenerationRequest):
+        self.retired.append((slot, request.request_id))
+
+
+def test_request_validation():
+    with pytest.raises(ValueError):
+        GenerationRequest([])
+
+    with pytest.raises(ValueError):
+        GenerationRequest([1, 2], max_new_tokens=0)
+
+
+def test_request_stops_on_eos():
+    request = GenerationRequest([1], max_new_tokens=10, eos_token_id=2)
+    assert request.append([5, 2, 7]) == [5, 2]
+    assert request.finish_reason == FinishReason.EOS
+    assert request.output_ids == [5, 2]
+
+
+def test_scheduler_respects_capacity():
+    executor = FakeExecutor(max_batch_size=4)
+    scheduler = InflightBatchingScheduler(executor, max_batch_size=2)
+
+    for _ in range(5):
+        scheduler.submit(GenerationRequest([1], max_new_tokens=3))
+
+    finished = list(scheduler.run())
+
+    assert len(finished) == 5
+    assert max(executor.batch_sizes) == 2
+    assert all(request.finish_reason == FinishReason.LENGTH for request in finished)
+    assert all(request.output_ids == [0, 1, 2] for request in finished)
+    assert not scheduler.has_pending_requests
+
+
+def test_scheduler_refills_free_slots():
+    executor = FakeExecutor(max_batch_size=2)
+    scheduler = InflightBatchingScheduler(executor)
+
+    short = scheduler.submit(GenerationRequest([1], max_new_tokens=1))
+    long = scheduler.submit(GenerationRequest([1], max_new_tokens=4))
+    waiting = scheduler.submit(GenerationRequest([1], max_new_tokens=1))
+
+    assert scheduler.step() == [short]
+    assert scheduler.occupancy.active == 1
+    assert scheduler.num_waiting == 1
+
+    # The waiting request takes the slot released by the short one while the long one keeps decoding
+    assert scheduler.step() == [waiting]
+    assert executor.batch_sizes == [2, 2]
+    assert executor.admitted[-1] == (0, waiting.request_id)
+
+    assert list(scheduler.run()) == [long]
+    assert executor.batch_sizes == [2, 2, 1, 1]
+    assert sorted(executor.retired) == sorted(executor.admitted)
+
+
+def test_scheduler_occupancy():
+    executor = FakeExecutor(max_batch_size=4)
+    scheduler = InflightBatchingScheduler(executor)
+
+    assert scheduler.mean_occupancy == 0.0
+
+    scheduler.submit(GenerationRequest([1], max_new_tokens=2))
+    scheduler.submit(GenerationRequest([1], max_new_tokens=4))
+
+    scheduler.step()
+    occupancy = scheduler.occupancy
+    assert occupancy.active == 2
+    assert occupancy.free == 2
+    assert occupancy.ratio == 0.5
+
+    list(scheduler.run())
+    assert scheduler.num_steps == 4
+    assert scheduler.mean_occupancy == pytest.approx((2 + 2 + 1 + 1) / (4 * 4))
+
+
+def test_scheduler_aborts_stalled_requests():
+    class StallingExecutor(FakeExecutor):
+        def step(self, requests):
+            tokens = super().step(requests)
+            return {slot: ids for slot, ids in tokens.items() if slot != 0}
+
+    executor = StallingExecutor(max_batch_size=2)
+    scheduler = InflightBatchingScheduler(executor)
+    stalled = scheduler.submit(GenerationRequest([1], max_new_tokens=3))
+    healthy = scheduler.submit(GenerationRequest([1], max_new_tokens=3))
+
+    assert list(scheduler.run()) == [stalled, healthy]
+    assert stalled.finish_reason == FinishReason.ERROR
+    assert healthy.finish_reason == FinishReason.LENGTH
+    assert healthy.output_ids == [0, 1, 2]
@@ -0,0 +1,136 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import pytest
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM
+
+from optimum.nvidia.quantization.batching import CalibrationBatches
+from optimum.nvidia.quantization.calibration import CalibrationSet
+from optimum.nvidia.quantization.sequential import (
+    get_decoder_layers,
+    sequential_forward,
+)
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    return LlamaForCausalLM(
+        LlamaConfig(
+            vocab_size=64,
+            hidden_size=32,
+            intermediate_size=64,
+            num_hidden_layers=3,
+            num_attention_heads=4,
+            num_key_value_heads=2,
+        )
+    ).eval()
+
+
+@pytest.fixture(scope="module")
+def calibration_set():
+    return CalibrationSet.from_sequences(
+        [[1, 5, 6, 7, 8], [1, 9, 10], [1, 11, 12, 13], [1, 14, 15, 16, 17, 18, 19]]
+    )
+
+
+def record_amax(model):
+    """
+    Track the maximum absolute value of the inputs of every linear layer, as max calibrators would.
+    """
+    amax, handles = {}, []
+
+    def _hook(name):
+        def _record(module, inputs, outputs):
+            value = inputs[0].abs().amax()
+            amax[name] = torch.max(amax[name], value) if name in amax else value
+
+        return _record
+
+    for name, module in model.named_modules():
+        if isinstance(module, torch.nn.Linear):
+            handles.append(module.register_forward_hook(_hook(name)))
+
+    return amax, handles
+
+
+@pytest.mark.parametrize(
+    "batching, offload_activations",
+    [("bucket", False), ("bucket", True), ("pack", False)],
+)
+def test_sequential_forward_matches_regular_forward(
+    model, calibration_set, batching, offload_activations
+):
+    batches = CalibrationBatches(
+        calibration_set, batch_size=2, batching=batching, max_length=12
+    )
+
+    expected, handles = record_amax(model)
+    with torch.no_grad():
+        for batch in batches:
+            model(**{k: v for k, v in batch.items() if k != "num_tokens"})
+    for handle in handles:
+        handle.remove()
+
+    amax, handles = record_amax(model)
+    with torch.no_grad():
+        num_batches = sequential_forward(
+            model, batches, device="cpu", offload_activations=offload_activations
+        )
+    for handle in handles:
+        handle.remove()
+
+    assert num_batches == len(batches)
+
+    # Every layer, including the language modeling head, saw the same activations
+    assert amax.keys() == expected.keys()
+    assert "lm_head" in amax
+    for name, value in expected.items():
+        torch.testing.assert_close(amax[name], value)
+
+
+def test_sequential_forward_without_head(model, calibration_set):
+    amax, handles = record_amax(model)
+    with torch.no_grad():
+        sequential_forward(
+            model, CalibrationBatches(calibration_set), device="cpu", with_head=False
+        )
+    for handle in handles:
+        handle.remove()
+
+    assert "lm_head" not in amax
+
+
+def test_sequential_forward_restores_layers(model):
+    _, layers = get_decoder_layers(model)
+    first_layer = layers[0]
+
+    # Capture fails (out of vocabulary token), the original layer must be put back anyway
+    with pytest.raises(IndexError):
+        sequential_forward(model, [{"input_ids": torch.tensor([[1000]])}], device="cpu")
+
+    assert layers[0] is first_layer
+    assert all(p.device.type == "cpu" for p in model.parameters())
+
+
+def test_get_decoder_layers(model):
+    decoder, layers = get_decoder_layers(model)
+    assert decoder is model.model
+    assert len(layers) == 3
+
+    with pytest.raises(ValueError):
+        get_decoder_layers(torch.nn.Linear(2, 2))
@@ -0,0 +1,125 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import pytest
+from transformers import AutoTokenizer
+
+from optimum.nvidia.generation import (
+    AhoCorasick,
+    FinishReason,
+    GenerationRequest,
+    StopCriteria,
+)
+from optimum.nvidia.generation.stopping import encode_stop_string
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    return AutoTokenizer.from_pretrained("hf-internal-testing/llama-tokenizer")
+
+
+def _find_all(automaton: AhoCorasick, text: str):
+    state, matches = 0, []
+    for position, character in enumerate(text):
+        state = automaton.step(state, character)
+        if (index := automaton.match(state)) is not None:
+            matches.append((position, index))
+    return matches
+
+
+def test_aho_corasick():
+    automaton = AhoCorasick(["he", "she", "hers", "his"])
+
+    # "she" and "he" both end at position 3, the pattern reached directly wins
+    assert _find_all(automaton, "ushers") == [(3, 1), (5, 2)]
+    assert _find_all(automaton, "this") == [(3, 3)]
+    assert _find_all(automaton, "xyz") == []
+
+
+def test_aho_corasick_failure_links():
+    automaton = AhoCorasick([(1, 2, 3), (2, 3, 4)])
+
+    state = 0
+    for token in (1, 2, 3):
+        state = automaton.step(state, token)
+    assert automaton.match(state) == 0
+
+    # Falls back to (2, 3) and completes the second pattern
+    assert automaton.match(automaton.step(state, 4)) == 1
+
+
+def test_aho_corasick_empty_pattern():
+    with pytest.raises(ValueError):
+        AhoCorasick([[]])
+
+
+def test_stop_criteria_token_sequences():
+    criteria = StopCriteria(stop_sequences=[[7, 8], [9]])
+
+    match = criteria.find([1, 7, 2, 7, 8, 5])
+    assert match.stop == (7, 8)
+    assert match.num_tokens == 5
+
+    assert criteria.find([9]).num_tokens == 1
+    assert criteria.find([1, 2, 3]) is None
+
+
+def test_stop_criteria_requires_tokenizer():
+    with pytest.raises(ValueError):
+        StopCriteria(stop_strings=["\n\n"])
+
+
+@pytest.mark.parametrize("stop", ["Observation:", "\n\n", "ing"])
+def test_stop_criteria_strings(tokenizer, stop):
+    criteria = StopCriteria(stop_strings=["never matched", stop], tokenizer=tokenizer)
+    prompt_ids = tokenizer.encode("Question: what is up?", add_special_tokens=False)
+
+    text = " I am thinking about it.\n\nObservation: nothing"
+    ids = tokenizer.encode(text, add_special_tokens=False)
+
+    match = criteria.find(ids, prompt_ids)
+    assert match.stop == stop
+
+    # Generation stops right after the token completing the stop string
+    decoded = tokenizer.decode(ids[: match.num_tokens])
+    assert stop in decoded
+    assert stop not in tokenizer.decode(ids[: match.num_tokens - 1])
+
+
+def test_stop_criteria_stop_words(tokenizer):
+    criteria = StopCriteria([[1, 2]], [" Observation:", "."], tokenizer)
+
+    # "." merges with the preceding text (i.e. "..."), it can only be matched on the text
+    assert encode_stop_string(tokenizer, ".") is None
+    assert criteria.stop_words == [
+        (1, 2),
+        encode_stop_string(tokenizer, " Observation:"),
+    ]
+
+    ids = tokenizer.encode("Thought: done. Observation:", add_special_tokens=False)
+    assert tuple(ids[-len(criteria.stop_words[1]) :]) == criteria.stop_words[1]
+
+
+def test_request_finishes_on_stop_sequence():
+    request = GenerationRequest(
+        [1],
+        max_new_tokens=10,
+        eos_token_id=2,
+        stop_criteria=StopCriteria(stop_sequences=[[5, 6]]),
+    )
+
+    assert request.append([4, 5, 6, 7]) == [4, 5, 6]
+    assert request.finish_reason == FinishReason.STOP
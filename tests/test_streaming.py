@@ -0,0 +1,107 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+import asyncio
+from threading import Thread
+
+import pytest
+from transformers import AutoTokenizer
+
+from optimum.nvidia.generation.streaming import IncrementalDetokenizer, TokenStream
+
+
+def _produce(stream: TokenStream, items, error=None):
+    def _run():
+        for item in items:
+            stream.put(item)
+        stream.end(error)
+
+    Thread(target=_run).start()
+
+
+def test_token_stream_sync():
+    stream = TokenStream().map(lambda x: x * 2)
+    _produce(stream, range(4))
+
+    assert list(stream) == [0, 2, 4, 6]
+
+
+def test_token_stream_async():
+    stream = TokenStream()
+    _produce(stream, range(4))
+
+    async def _consume():
+        return [item async for item in stream]
+
+    assert asyncio.run(_consume()) == [0, 1, 2, 3]
+
+
+def test_token_stream_forwards_errors():
+    stream = TokenStream()
+    _produce(stream, [1], RuntimeError("engine failure"))
+
+    assert next(stream) == 1
+    with pytest.raises(RuntimeError):
+        next(stream)
+
+
+def test_token_stream_finalizers():
+    stream = TokenStream().map(lambda x: x * 2).finalize(lambda: "done")
+    _produce(stream, range(2))
+
+    assert list(stream) == [0, 2, "done"]
+
+    # Finalizers are skipped when the producer failed
+    stream = TokenStream().finalize(lambda: "done")
+    _produce(stream, [1], RuntimeError("engine failure"))
+
+    assert next(stream) == 1
+    with pytest.raises(RuntimeError):
+        next(stream)
+
+
+def test_token_stream_end_callbacks():
+    stream = TokenStream()
+    errors = []
+
+    stream.on_end(errors.append)
+    stream.end(RuntimeError("engine failure"))
+    assert isinstance(errors[0], RuntimeError)
+
+    # Callbacks registered once the stream ended are invoked immediately
+    stream.on_end(errors.append)
+    assert len(errors) == 2
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        " Hello world, how are you?",
+        " héllo 世界 🤗 done",
+        "  multiple   spaces\nand new lines",
+    ],
+)
+def test_incremental_detokenizer(text: str):
+    tokenizer = AutoTokenizer.from_pretrained("hf-internal-testing/llama-tokenizer")
+    prompt_ids = tokenizer.encode("Say something:", add_special_tokens=False)
+    ids = tokenizer.encode(text, add_special_tokens=False)
+
+    detokenizer = IncrementalDetokenizer(tokenizer, prompt_ids)
+    chunks = [detokenizer.push(token_id) for token_id in ids]
+    chunks.append(detokenizer.flush())
+
+    expected = tokenizer.decode(prompt_ids + ids)[len(tokenizer.decode(prompt_ids)) :]
+    assert "".join(chunks) == expected
+    assert all("�" not in chunk for chunk in chunks)
@@ -0,0 +1,344 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+from typing import List
+
+import pytest
+import torch
+from transformers import AutoTokenizer
+
+from optimum.nvidia.generation.streaming import TokenStream
+from optimum.nvidia.pipelines.text_generation import ReturnType, TextGenerationPipeline
+from optimum.nvidia.utils.tokenization import TokenizationCache
+
+
+class FakeRuntime:
+    """
+    Completes every prompt with `completion_ids`, recording the batches it was called with.
+    """
+
+    max_batch_size = 2
+    max_prompt_length = 16
+
+    def __init__(self, completion_ids: List[int] = ()):
+        self.completion_ids = list(completion_ids)
+        self.batches = []
+        self.kwargs = []
+        self.num_generated_tokens = []
+        self.released = []
+
+    def generate(self, input_ids: List[torch.Tensor], **kwargs):
+        self.batches.append([ids.tolist() for ids in input_ids])
+        self.kwargs.append(kwargs)
+
+        # As the engine, stop right after the first stop word
+        completion_ids = self.completion_ids
+        for end in range(1, len(completion_ids) + 1):
+            if any(
+                tuple(completion_ids[max(end - len(stop_word), 0) : end]) == stop_word
+                for stop_word in kwargs.get("stop_words") or ()
+            ):
+                completion_ids = completion_ids[:end]
+                break
+        self.num_generated_tokens.append(len(completion_ids))
+
+        # Sequences are padded with garbage past their length, as returned by the engine
+        sequences = [ids.tolist() + completion_ids for ids in input_ids]
+        max_length = max(map(len, sequences)) + 4
+        generated_sequence = torch.full(
+            (len(sequences), 1, max_length), 1000, dtype=torch.int32
+        )
+        for row, sequence in enumerate(sequences):
+            generated_sequence[row, 0, : len(sequence)] = torch.tensor(sequence)
+
+        lengths = torch.tensor(
+            [[len(sequence)] for sequence in sequences], dtype=torch.int32
+        )
+        return generated_sequence, lengths
+
+    def generate_stream(self, input_ids: List[torch.Tensor], **kwargs):
+        self.batches.append([ids.tolist() for ids in input_ids])
+        self.kwargs.append(kwargs)
+
+        stream = TokenStream()
+        for token_id in self.completion_ids[: kwargs["max_new_tokens"]]:
+            stream.put(torch.tensor([token_id] * len(input_ids)))
+        stream.end()
+        return stream
+
+    def release(self, *tensors: torch.Tensor):
+        self.released.extend(tensors)
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    return AutoTokenizer.from_pretrained("hf-internal-testing/llama-tokenizer")
+
+
+def test_preprocess_buckets_prompts(tokenizer):
+    pipe = TextGenerationPipeline(FakeRuntime(), tokenizer)
+    prompts = ["a b c d e f", "a", "a b c", "a b c d e f g h i j", "a b"]
+
+    model_inputs = pipe.preprocess(prompts)
+    lengths = [len(ids) for ids in model_inputs["input_ids"]]
+
+    # Batches are bounded by max_batch_size and hold prompts of increasing lengths
+    assert [len(batch) for batch in model_inputs["batches"]] == [2, 2, 1]
+    assert sorted(sum(model_inputs["batches"], [])) == list(range(len(prompts)))
+    assert [
+        lengths[index] for batch in model_inputs["batches"] for index in batch
+    ] == sorted(lengths)
+
+
+def test_preprocess_max_prompt_length(tokenizer):
+    pipe = TextGenerationPipeline(FakeRuntime(), tokenizer)
+    prompt = " ".join(["hello"] * 32)
+
+    with pytest.raises(ValueError):
+        pipe.preprocess(prompt)
+
+    model_inputs = pipe.preprocess(prompt, handle_long_generation="hole")
+    assert len(model_inputs["input_ids"][0]) == FakeRuntime.max_prompt_length
+
+
+def test_pipeline_restores_order(tokenizer):
+    completion = " and then"
+    runtime = FakeRuntime(tokenizer.encode(completion, add_special_tokens=False))
+    pipe = TextGenerationPipeline(runtime, tokenizer)
+
+    prompts = ["Hello my name is John", "The capital", "1, 2, 3", "Once"]
+    records = pipe(prompts, return_full_text=False)
+
+    assert len(runtime.batches) == 2
+    assert [record["generated_text"][0].strip() for record in records] == [
+        completion.strip()
+    ] * len(prompts)
+
+    records = pipe(prompts)
+    assert [record["generated_text"] for record in records] == [
+        [prompt + completion] for prompt in prompts
+    ]
+
+    # Device buffers are given back to the runtime
+    assert len(runtime.released) == 8
+
+
+def _model_outputs(tokenizer, prompts: List[str], completions: List[str]):
+    runtime = FakeRuntime()
+    runtime.max_batch_size = len(prompts)
+
+    prompts_ids = [
+        torch.tensor(tokenizer.encode(prompt, add_special_tokens=False))
+        for prompt in prompts
+    ]
+    completions_ids = [
+        torch.tensor(tokenizer.encode(completion, add_special_tokens=False))
+        for completion in completions
+    ]
+    generated_sequence, lengths = runtime.generate(
+        [torch.cat(ids) for ids in zip(prompts_ids, completions_ids)]
+    )
+
+    return {
+        "outputs": [
+            {
+                "indices": list(range(len(prompts))),
+                "generated_sequence": generated_sequence,
+                "lengths": lengths,
+                "prompt_lengths": torch.tensor([len(ids) for ids in prompts_ids]),
+            }
+        ],
+        "prompt_text": prompts,
+    }
+
+
+@pytest.mark.parametrize("num_decode_workers", [None, 2])
+def test_postprocess(tokenizer, num_decode_workers):
+    runtime = FakeRuntime()
+    pipe = TextGenerationPipeline(runtime, tokenizer)
+
+    prompts = [
+        "Hello my name is",
+        "The capital of France",
+        "1, 2, 3,",
+        "Once upon a time",
+    ]
+    completions = [" John and I", " is Paris", " 4, 5", " there was a princess"]
+    model_outputs = _model_outputs(tokenizer, prompts, completions)
+
+    records = pipe.postprocess(
+        model_outputs, ReturnType.NEW_TEXT, num_decode_workers=num_decode_workers
+    )
+    assert [record["generated_text"][0].strip() for record in records] == [
+        completion.strip() for completion in completions
+    ]
+
+    records = pipe.postprocess(
+        model_outputs, ReturnType.FULL_TEXT, num_decode_workers=num_decode_workers
+    )
+    assert [record["generated_text"] for record in records] == [
+        [prompt + completion] for prompt, completion in zip(prompts, completions)
+    ]
+
+
+def test_stream_flushes_rows_reaching_max_new_tokens(tokenizer):
+    completion_ids = tokenizer.encode(" Paris is nice", add_special_tokens=False)
+    pipe = TextGenerationPipeline(FakeRuntime(completion_ids), tokenizer)
+
+    records = list(
+        pipe(
+            "The capital of France is", stream=True, max_new_tokens=len(completion_ids)
+        )
+    )
+
+    assert "".join(record["text"] for record in records) == " Paris is nice"
+    assert not any(record["finished"] for record in records[:-1])
+    assert records[-1]["finished"]
+
+
+def test_pipeline_prefix_tokenized_once(tokenizer):
+    prefix = "You are a helpful assistant.\n"
+    cache = TokenizationCache(prefix_aware=True)
+    pipe = TextGenerationPipeline(
+        FakeRuntime(tokenizer.encode(" Paris", add_special_tokens=False)),
+        tokenizer,
+        tokenization_cache=cache,
+    )
+
+    pipe("Capital of France?", prefix=prefix, return_full_text=False)
+
+    # Only the prompt goes through the cache, the prefix isn't tokenized on its own
+    assert (cache.stats.hits, cache.stats.misses) == (0, 1)
+
+
+def test_decode_single_batch_call(tokenizer):
+    class _CountingBackend:
+        def __init__(self, backend):
+            self.backend = backend
+            self.calls = 0
+
+        def decode_batch(self, sequences, **kwargs):
+            self.calls += 1
+            return self.backend.decode_batch(sequences, **kwargs)
+
+    class _Tokenizer:
+        def __init__(self, tokenizer):
+            self.tokenizer = tokenizer
+            self.backend_tokenizer = _CountingBackend(tokenizer.backend_tokenizer)
+
+        def __getattr__(self, name):
+            return getattr(self.tokenizer, name)
+
+    pipe = TextGenerationPipeline(FakeRuntime(), tokenizer)
+    pipe.tokenizer = _Tokenizer(tokenizer)
+
+    texts = ["Hello my name is", " is Paris", "1, 2, 3, 4"]
+    sequences = [tokenizer.encode(text, add_special_tokens=False) for text in texts]
+
+    assert pipe._decode(sequences, True) == [
+        tokenizer.clean_up_tokenization(tokenizer.decode(ids, skip_special_tokens=True))
+        for ids in sequences
+    ]
+    assert pipe.tokenizer.backend_tokenizer.calls == 1
+
+
+def test_postprocess_tensors(tokenizer):
+    pipe = TextGenerationPipeline(FakeRuntime(), tokenizer)
+    model_outputs = _model_outputs(tokenizer, ["Hello"], [" world"])
+
+    records = pipe.postprocess(model_outputs, ReturnType.TENSORS)
+    assert (
+        records[0]["generated_token_ids"]
+        == model_outputs["outputs"][0]["generated_sequence"][0].tolist()
+    )
+
+
+def test_pipeline_stop_sequence(tokenizer):
+    completion = " and then. Observation: done"
+    runtime = FakeRuntime(tokenizer.encode(completion, add_special_tokens=False))
+    pipe = TextGenerationPipeline(runtime, tokenizer)
+
+    records = pipe(
+        ["Hello", "Hi there"], stop_sequence="Observation:", return_full_text=False
+    )
+    assert [record["generated_text"][0].strip() for record in records] == [
+        "and then. Observation:"
+    ] * 2
+
+
+def test_pipeline_stop_sequence_stops_engine(tokenizer):
+    completion_ids = tokenizer.encode(
+        " and then. Observation: done, and more text", add_special_tokens=False
+    )
+    runtime = FakeRuntime(completion_ids)
+    pipe = TextGenerationPipeline(runtime, tokenizer)
+
+    records = pipe(
+        ["Hello"],
+        stop_sequence=" Observation:",
+        max_new_tokens=len(completion_ids),
+        return_full_text=False,
+    )
+
+    # The stop string has a stable tokenization: the engine stops on it instead of decoding up to max_new_tokens
+    assert runtime.kwargs[0]["stop_words"] == [
+        tuple(tokenizer.encode(" Observation:", add_special_tokens=False))
+    ]
+    assert runtime.num_generated_tokens[0] < len(completion_ids)
+    assert records[0]["generated_text"][0].strip() == "and then. Observation:"
+
+
+def test_pipeline_single_stop_token_keeps_eos(tokenizer):
+    completion = (
+        tokenizer.encode(" and then", add_special_tokens=False)
+        + [tokenizer.eos_token_id]
+        + tokenizer.encode(" more text", add_special_tokens=False)
+    )
+    runtime = FakeRuntime(completion)
+    pipe = TextGenerationPipeline(runtime, tokenizer)
+
+    stop_token_id = tokenizer.encode("Observation", add_special_tokens=False)[0]
+    records = pipe(["Hello"], stop_token_ids=[[stop_token_id]], return_full_text=False)
+
+    # The stop token is handled by the engine, the actual end-of-sequence token still ends the generation
+    assert runtime.kwargs[0]["eos_token_id"] == stop_token_id
+    assert records[0]["generated_text"][0].strip() == "and then"
+
+
+def test_pipeline_sampling_parameters_per_prompt(tokenizer):
+    runtime = FakeRuntime(tokenizer.encode(" and then", add_special_tokens=False))
+    pipe = TextGenerationPipeline(runtime, tokenizer)
+
+    prompts = ["Hello my name is John", "Once", "The capital"]
+    pipe(prompts, temperature=[0.1, 0.2, 0.3], top_k=[1, 2, 3], top_p=0.9)
+
+    # Prompts are bucketed by length, parameters follow their prompt
+    temperatures = {}
+    for batch, kwargs in zip(runtime.batches, runtime.kwargs):
+        assert kwargs["top_p"] == 0.9
+        for ids, temperature, top_k in zip(
+            batch, kwargs["temperature"], kwargs["top_k"]
+        ):
+            temperatures[tokenizer.decode(ids)] = (temperature, top_k)
+
+    assert temperatures == {
+        "Hello my name is John": (0.1, 1),
+        "Once": (0.2, 2),
+        "The capital": (0.3, 3),
+    }
+
+    with pytest.raises(ValueError):
+        pipe(prompts, temperature=[0.1, 0.2])
@@ -0,0 +1,56 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from pathlib import Path
+
+import optimum.nvidia.builder.timing_cache
+from optimum.nvidia.builder.timing_cache import TimingCacheStore
+
+
+VERSIONS = {"tensorrt_llm": "0.9.0", "tensorrt": "9.3.0", "sm": "90"}
+
+
+def test_timing_cache_store_keys(tmp_path: Path):
+    store = TimingCacheStore(tmp_path, VERSIONS)
+    other = TimingCacheStore(tmp_path, VERSIONS | {"sm": "89"})
+
+    assert store.lookup("float16") is None
+    assert store.path_for("float16") != store.path_for("bfloat16")
+    assert store.path_for("float16") != other.path_for("float16")
+    assert store.path_for("float16").parent == store.root
+
+
+def test_timing_cache_store_merge(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(
+        optimum.nvidia.builder.timing_cache,
+        "merge_timing_caches",
+        lambda base, other: base + other,
+    )
+
+    store = TimingCacheStore(tmp_path / "store", VERSIONS)
+    build_cache = tmp_path / "timing.cache"
+
+    build_cache.write_bytes(b"first")
+    store.merge("float16", build_cache)
+    assert store.lookup("float16").read_bytes() == b"first"
+
+    build_cache.write_bytes(b"second")
+    store.merge("float16", build_cache)
+    assert store.lookup("float16").read_bytes() == b"firstsecond"
+
+    # Missing caches (i.e. failed builds) are ignored
+    store.merge("float16", tmp_path / "missing.cache")
+    assert store.lookup("float16").read_bytes() == b"firstsecond"
+    assert store.lookup("bfloat16") is None
@@ -0,0 +1,121 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+
+import pytest
+from transformers import AutoTokenizer
+
+from optimum.nvidia.utils.tokenization import (
+    TokenizationCache,
+    get_tokenizer_fingerprint,
+)
+
+
+SYSTEM_PROMPT = "You are a helpful assistant. Answer the following question:"
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    return AutoTokenizer.from_pretrained("hf-internal-testing/llama-tokenizer")
+
+
+def test_fingerprint(tokenizer):
+    assert get_tokenizer_fingerprint(tokenizer) == get_tokenizer_fingerprint(tokenizer)
+
+
+@pytest.mark.parametrize("add_special_tokens", [False, True])
+def test_encode_cached(tokenizer, add_special_tokens):
+    cache = TokenizationCache()
+    texts = ["Hello world", "How are you?", "Hello world"]
+
+    ids = cache.encode_batch(tokenizer, texts, add_special_tokens)
+    assert ids == [
+        tokenizer.encode(text, add_special_tokens=add_special_tokens) for text in texts
+    ]
+
+    # Duplicates within a batch are tokenized, subsequent calls are served from the cache
+    assert cache.stats.misses == 3
+    assert cache.encode(tokenizer, "How are you?", add_special_tokens) == ids[1]
+    assert cache.stats.hits == 1
+
+    # add_special_tokens is part of the key
+    cache.encode(tokenizer, "How are you?", not add_special_tokens)
+    assert cache.stats.misses == 4
+
+
+def test_encode_evicts_least_recently_used(tokenizer):
+    cache = TokenizationCache(max_size_bytes=64)
+
+    cache.encode(tokenizer, "first text")
+    cache.encode(tokenizer, "second text")
+    cache.encode(tokenizer, "first text")
+    cache.encode(tokenizer, "a third, longer text")
+
+    stats = cache.stats
+    assert stats.evictions == 1
+    assert stats.size_bytes <= 64
+
+    # "first text" was used more recently than "second text"
+    cache.encode(tokenizer, "first text")
+    assert cache.stats.hits == 2
+    cache.encode(tokenizer, "second text")
+    assert cache.stats.misses == 4
+
+
+@pytest.mark.parametrize("add_special_tokens", [False, True])
+@pytest.mark.parametrize(
+    "suffix",
+    [
+        " What is the capital of France?",
+        " 1 + 1 = ?",
+        "\nWhy is the sky blue?",
+        "s and questions",
+    ],
+)
+def test_prefix_aware(tokenizer, suffix, add_special_tokens):
+    cache = TokenizationCache(prefix_aware=True)
+    cache.add_prefix(SYSTEM_PROMPT)
+
+    text = SYSTEM_PROMPT + suffix
+    ids = cache.encode(tokenizer, text, add_special_tokens)
+
+    assert ids == tokenizer.encode(text, add_special_tokens=add_special_tokens)
+    assert cache.stats.prefix_hits == 1
+
+
+def test_prefixes_bounded(tokenizer):
+    cache = TokenizationCache(prefix_aware=True, max_prefixes=2)
+    cache.add_prefix(SYSTEM_PROMPT)
+    cache.add_prefix("First prefix shared by several prompts")
+    cache.add_prefix(SYSTEM_PROMPT)
+    cache.add_prefix("Second prefix")
+
+    # The least recently used prefix is dropped
+    cache.encode(tokenizer, "First prefix shared by several prompts and a question")
+    assert cache.stats.prefix_hits == 0
+
+    cache.encode(tokenizer, SYSTEM_PROMPT + " Hello")
+    assert cache.stats.prefix_hits == 1
+
+    with pytest.raises(ValueError):
+        TokenizationCache(max_prefixes=0)
+
+
+def test_prefix_aware_disabled(tokenizer):
+    cache = TokenizationCache()
+    cache.add_prefix(SYSTEM_PROMPT)
+
+    cache.encode(tokenizer, SYSTEM_PROMPT + " Hello")
+    assert cache.stats.prefix_hits == 0
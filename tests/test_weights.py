@@ -0,0 +1,118 @@
+#  coding=utf-8
+#  Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#  #
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#  #
+#      http://www.apache.org/licenses/LICENSE-2.0
+#  #
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+import torch
+from safetensors.torch import load_file
+from transformers import LlamaConfig, LlamaForCausalLM
+
+from optimum.nvidia.weights import (
+    SafetensorsCheckpoint,
+    SafetensorsWriter,
+    convert_llama_checkpoint,
+)
+
+
+class FakeMapping:
+    def __init__(self, tp_size: int, pp_size: int, rank: int = 0):
+        self.world_size = tp_size * pp_size
+        self.tp_size, self.pp_size = tp_size, pp_size
+        self.rank = rank
+        self.tp_rank, self.pp_rank = rank % tp_size, rank // tp_size
+
+    def is_first_pp_rank(self) -> bool:
+        return self.pp_rank == 0
+
+    def is_last_pp_rank(self) -> bool:
+        return self.pp_rank == self.pp_size - 1
+
+    def pp_layers(self, num_layers: int):
+        per_stage = num_layers // self.pp_size
+        return range(self.pp_rank * per_stage, (self.pp_rank + 1) * per_stage)
+
+
+class FakeConfig(SimpleNamespace):
+    def set_rank(self, rank: int):
+        self.mapping = FakeMapping(self.mapping.tp_size, self.mapping.pp_size, rank)
+
+
+def test_safetensors_writer_roundtrip(tmp_path: Path):
+    tensors = {
+        "a": torch.randn(3, 5, dtype=torch.float16),
+        "b": torch.arange(7, dtype=torch.int32),
+        "c": torch.randn(2, 2, dtype=torch.bfloat16),
+    }
+
+    with SafetensorsWriter(tmp_path / "out.safetensors") as writer:
+        for name, tensor in tensors.items():
+            writer.write(name, tensor)
+
+    loaded = load_file(tmp_path / "out.safetensors")
+    assert loaded.keys() == tensors.keys()
+    assert all(torch.equal(loaded[name], tensor) for name, tensor in tensors.items())
+    assert list(tmp_path.iterdir()) == [tmp_path / "out.safetensors"]
+
+
+@pytest.mark.parametrize("tp_size, pp_size", [(1, 1), (2, 1), (2, 2), (4, 1)])
+def test_convert_llama_checkpoint(tmp_path: Path, tp_size: int, pp_size: int):
+    hf_config = LlamaConfig(
+        vocab_size=99,
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+    )
+    hf_model = LlamaForCausalLM(hf_config)
+    hf_model.save_pretrained(tmp_path / "hf", max_shard_size="20KB")
+    state_dict = hf_model.state_dict()
+
+    config = FakeConfig(
+        dtype="float32",
+        num_hidden_layers=2,
+        num_key_value_heads=2,
+        use_parallel_embedding=False,
+        embedding_sharding_dim=0,
+        mapping=FakeMapping(tp_size, pp_size),
+    )
+
+    checkpoint = SafetensorsCheckpoint(tmp_path / "hf")
+    paths = convert_llama_checkpoint(checkpoint, config, tmp_path)
+    ranks = [load_file(path) for path in paths]
+
+    assert len(ranks) == tp_size * pp_size
+    assert torch.equal(
+        ranks[0]["transformer.vocab_embedding.weight"],
+        state_dict["model.embed_tokens.weight"],
+    )
+
+    # Reassemble the tensor-parallel slices of the last pipeline stage
+    last_stage = ranks[-tp_size:]
+    lm_head = torch.cat([rank["lm_head.weight"] for rank in last_stage])
+    assert torch.equal(lm_head[:99], state_dict["lm_head.weight"])
+
+    layer = f"transformer.layers.{2 // pp_size - 1}"
+    down_proj = torch.cat([rank[f"{layer}.mlp.proj.weight"] for rank in last_stage], 1)
+    assert torch.equal(down_proj, state_dict["model.layers.1.mlp.down_proj.weight"])
+
+    # QKV is fused per rank, key/value heads being replicated when num_kv_heads < tp_size
+    q_size, kv_size = 32 // tp_size, 16 // min(tp_size, 2)
+    qkv = ranks[-1][f"{layer}.attention.qkv.weight"]
+    q = state_dict["model.layers.1.self_attn.q_proj.weight"]
+    assert qkv.shape == (q_size + 2 * kv_size, 32)
+    assert torch.equal(qkv[:q_size], q[-q_size:])